@@ -0,0 +1,109 @@
+'''
+Business: Кэш чтения карт и балансов по user_id - по умолчанию локальный LRU+TTL инстанса (записи других функций
+          видны не позже CACHE_TTL_SECONDS), общий внешний кэш с инвалидацией в транзакции записи - через set_backend()
+Args: CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS - настройки локального кэша из окружения
+Returns: get_cache(), set_backend() для внешнего кэша, get_entry(), put_variant(), invalidate_users(),
+         make_etag(), not_modified()
+'''
+import hashlib
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '1024'))
+CACHE_TTL_SECONDS = float(os.environ.get('CACHE_TTL_SECONDS', '5'))
+
+
+class CacheBackend(ABC):
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    def invalidate(self, cur: Any, keys: List[str]) -> None:
+        for key in keys:
+            self.delete(key)
+
+
+class LocalCache(CacheBackend):
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+_backend: CacheBackend = LocalCache()
+
+
+def get_cache() -> CacheBackend:
+    return _backend
+
+
+def set_backend(backend: CacheBackend) -> None:
+    global _backend
+    _backend = backend
+
+
+def cards_key(user_id: Any) -> str:
+    return f'cards:{user_id}'
+
+
+def get_entry(user_id: Any) -> Dict[str, Tuple[str, str]]:
+    return _backend.get(cards_key(user_id)) or {}
+
+
+def put_variant(user_id: Any, entry: Dict[str, Tuple[str, str]], variant: str, body: str) -> str:
+    etag = make_etag(body)
+    _backend.set(cards_key(user_id), {**entry, variant: (etag, body)}, CACHE_TTL_SECONDS)
+    return etag
+
+
+def invalidate_users(cur: Any, user_ids: Iterable[Any]) -> None:
+    keys = sorted({cards_key(user_id) for user_id in user_ids if user_id is not None})
+    if keys:
+        _backend.invalidate(cur, keys)
+
+
+def make_etag(body: str) -> str:
+    return '"' + hashlib.blake2b(body.encode(), digest_size=12).hexdigest() + '"'
+
+
+def not_modified(event: Dict[str, Any], etag: str) -> bool:
+    for name, value in (event.get('headers') or {}).items():
+        if name.lower() == 'if-none-match':
+            candidates = [tag.strip().removeprefix('W/') for tag in value.split(',')]
+            return etag in candidates or '*' in candidates
+    return False
@@ -0,0 +1,237 @@
+'''
+Business: Удаление аккаунта - мгновенное мягкое удаление в обработчике и фоновая очистка порциями:
+          собственные проводки удаляются, общие с другими клиентами переводы обезличиваются,
+          ноги двойной записи переносятся на счёт closed без привязки к карте, итоги аналитики удаляются вместе с картами,
+          а карты ставятся в очередь archive_redactions для вычистки из архивов (partitions.py redact)
+Args: cur - курсор psycopg2, user_id; DELETION_CHUNK_SIZE - строк журнала за одну транзакцию;
+      CLI: python deletion.py work|status с DATABASE_URL
+Returns: request_deletion()/fetch_progress() для обработчика, process_chunk()/run() для фонового воркера
+'''
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+DELETION_CHUNK_SIZE = int(os.environ.get('DELETION_CHUNK_SIZE', '5000'))
+
+OUTGOING = 'outgoing'
+INCOMING = 'incoming'
+POSTINGS = 'postings'
+BALANCES = 'balances'
+FINALIZE = 'finalize'
+DONE = 'done'
+
+NEXT_PHASE = {OUTGOING: INCOMING, INCOMING: POSTINGS, POSTINGS: BALANCES, BALANCES: FINALIZE}
+
+SOFT_DELETE_SQL = """
+WITH target AS (
+    UPDATE users
+    SET deleted_at = CURRENT_TIMESTAMP, phone = 'deleted-' || id, name = 'Deleted user', default_card_id = NULL
+    WHERE id = %(user_id)s AND deleted_at IS NULL
+    RETURNING id
+),
+closed AS (
+    UPDATE cards SET status = 'closed' WHERE user_id IN (SELECT id FROM target)
+),
+queued AS (
+    INSERT INTO account_deletions (user_id)
+    SELECT id FROM target
+    ON CONFLICT (user_id) DO NOTHING
+)
+SELECT EXISTS (SELECT 1 FROM target)
+"""
+
+PROGRESS_SQL = """
+SELECT phase, purged, anonymized, requested_at, updated_at, completed_at
+FROM account_deletions WHERE user_id = %s
+"""
+
+CLAIM_SQL = """
+SELECT user_id, phase FROM account_deletions
+WHERE completed_at IS NULL
+ORDER BY requested_at
+LIMIT 1
+FOR UPDATE SKIP LOCKED
+"""
+
+LEDGER_CHUNK_SQL = """
+WITH owned AS (SELECT id FROM cards WHERE user_id = %(user_id)s),
+batch AS (
+    SELECT t.id, t.{other} IS NULL OR t.{other} IN (SELECT id FROM owned) AS private
+    FROM transactions t
+    WHERE t.{side} IN (SELECT id FROM owned)
+    LIMIT %(chunk_size)s
+),
+purged AS (
+    DELETE FROM transactions t USING batch b
+    WHERE b.private AND t.id = b.id
+    RETURNING 1
+),
+anonymized AS (
+    UPDATE transactions t SET {side} = NULL
+    FROM batch b
+    WHERE NOT b.private AND t.id = b.id
+    RETURNING 1
+)
+SELECT (SELECT count(*) FROM purged), (SELECT count(*) FROM anonymized)
+"""
+
+LEDGER_SQL = {
+    OUTGOING: LEDGER_CHUNK_SQL.format(side='from_card_id', other='to_card_id'),
+    INCOMING: LEDGER_CHUNK_SQL.format(side='to_card_id', other='from_card_id'),
+}
+
+POSTINGS_CHUNK_SQL = """
+UPDATE postings SET account = 'closed', card_id = NULL
+WHERE id IN (
+    SELECT id FROM postings
+    WHERE card_id IN (SELECT id FROM cards WHERE user_id = %(user_id)s)
+    LIMIT %(chunk_size)s
+)
+"""
+
+BALANCES_CHUNK_SQL = """
+DELETE FROM card_daily_balances
+WHERE (card_id, day) IN (
+    SELECT b.card_id, b.day FROM card_daily_balances b
+    WHERE b.card_id IN (SELECT id FROM cards WHERE user_id = %(user_id)s)
+    LIMIT %(chunk_size)s
+)
+"""
+
+LEDGER_REMAINS_SQL = """
+SELECT EXISTS (
+    SELECT 1 FROM transactions
+    WHERE from_card_id IN (SELECT id FROM cards WHERE user_id = %(user_id)s)
+       OR to_card_id IN (SELECT id FROM cards WHERE user_id = %(user_id)s)
+) OR EXISTS (
+    SELECT 1 FROM postings WHERE card_id IN (SELECT id FROM cards WHERE user_id = %(user_id)s)
+)
+"""
+
+
+def request_deletion(cur: Any, user_id: int) -> bool:
+    cur.execute(SOFT_DELETE_SQL, {'user_id': user_id})
+    return cur.fetchone()[0]
+
+
+def fetch_progress(cur: Any, user_id: int) -> Optional[Dict[str, Any]]:
+    cur.execute(PROGRESS_SQL, (user_id,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    phase, purged, anonymized, requested_at, updated_at, completed_at = row
+    return {
+        'user_id': user_id, 'phase': phase, 'purged': purged, 'anonymized': anonymized,
+        'requested_at': requested_at, 'updated_at': updated_at, 'completed_at': completed_at
+    }
+
+
+def _advance(cur: Any, user_id: int, phase: str, purged: int = 0, anonymized: int = 0) -> None:
+    cur.execute(
+        "UPDATE account_deletions SET phase = %s, purged = purged + %s, anonymized = anonymized + %s, "
+        "updated_at = CURRENT_TIMESTAMP, completed_at = CASE WHEN %s = 'done' THEN CURRENT_TIMESTAMP END "
+        "WHERE user_id = %s",
+        (phase, purged, anonymized, phase, user_id)
+    )
+
+
+def _finalize(cur: Any, user_id: int) -> str:
+    cur.execute(LEDGER_REMAINS_SQL, {'user_id': user_id})
+    if cur.fetchone()[0]:
+        return OUTGOING
+    cur.execute("DELETE FROM spending_rollups WHERE card_id IN (SELECT id FROM cards WHERE user_id = %s)", (user_id,))
+    cur.execute(
+        "INSERT INTO archive_redactions (card_id) SELECT id FROM cards WHERE user_id = %s "
+        "AND EXISTS (SELECT 1 FROM transaction_archives) ON CONFLICT (card_id) DO NOTHING",
+        (user_id,)
+    )
+    cur.execute("DELETE FROM cards WHERE user_id = %s", (user_id,))
+    cur.execute("DELETE FROM users WHERE id = %s AND deleted_at IS NOT NULL", (user_id,))
+    return DONE
+
+
+def process_chunk(conn: Any, chunk_size: int = DELETION_CHUNK_SIZE) -> Optional[Dict[str, Any]]:
+    with conn.cursor() as cur:
+        cur.execute(CLAIM_SQL)
+        claimed = cur.fetchone()
+        if claimed is None:
+            conn.rollback()
+            return None
+        user_id, phase = claimed
+        params = {'user_id': user_id, 'chunk_size': chunk_size}
+        purged = anonymized = 0
+
+        if phase in LEDGER_SQL:
+            cur.execute(LEDGER_SQL[phase], params)
+            purged, anonymized = cur.fetchone()
+            next_phase = phase if purged + anonymized == chunk_size else NEXT_PHASE[phase]
+        elif phase == POSTINGS:
+            cur.execute(POSTINGS_CHUNK_SQL, params)
+            anonymized = cur.rowcount
+            next_phase = phase if anonymized == chunk_size else NEXT_PHASE[phase]
+        elif phase == BALANCES:
+            cur.execute(BALANCES_CHUNK_SQL, params)
+            purged = cur.rowcount
+            next_phase = phase if purged == chunk_size else NEXT_PHASE[phase]
+        else:
+            next_phase = _finalize(cur, user_id)
+
+        _advance(cur, user_id, next_phase, purged, anonymized)
+        conn.commit()
+    return {'user_id': user_id, 'phase': next_phase, 'purged': purged, 'anonymized': anonymized}
+
+
+def run(conn: Any, chunk_size: int = DELETION_CHUNK_SIZE, pause: float = 0.0, poll_interval: float = 5.0,
+        once: bool = False) -> Dict[str, int]:
+    totals = {'chunks': 0, 'purged': 0, 'anonymized': 0, 'completed': 0}
+    while True:
+        result = process_chunk(conn, chunk_size)
+        if result is None:
+            if once:
+                return totals
+            time.sleep(poll_interval)
+            continue
+        totals['chunks'] += 1
+        totals['purged'] += result['purged']
+        totals['anonymized'] += result['anonymized']
+        totals['completed'] += result['phase'] == DONE
+        if pause:
+            time.sleep(pause)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import psycopg2
+
+    parser = argparse.ArgumentParser(description='Purge and anonymize ledger rows of deleted accounts')
+    parser.add_argument('command', choices=['work', 'status'])
+    parser.add_argument('--chunk-size', type=int, default=DELETION_CHUNK_SIZE, help='ledger rows per transaction')
+    parser.add_argument('--pause', type=float, default=0.0, help='seconds to sleep between chunks')
+    parser.add_argument('--poll-interval', type=float, default=5.0)
+    parser.add_argument('--once', action='store_true', help='exit when no deletions are pending')
+    parser.add_argument('--user-id', type=int)
+    args = parser.parse_args(argv)
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        if args.command == 'work':
+            started = time.monotonic()
+            totals = run(conn, args.chunk_size, args.pause, args.poll_interval, args.once)
+            print(json.dumps({**totals, 'elapsed_s': round(time.monotonic() - started, 2)}))
+        elif args.user_id is not None:
+            with conn.cursor() as cur:
+                print(json.dumps(fetch_progress(cur, args.user_id), default=str))
+        else:
+            with conn.cursor() as cur:
+                cur.execute("SELECT count(*), min(requested_at) FROM account_deletions WHERE completed_at IS NULL")
+                pending, oldest = cur.fetchone()
+            print(json.dumps({'pending': pending, 'oldest_requested_at': oldest}, default=str))
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,115 +1,103 @@
 '''
 Business: Регистрация и авторизация пользователей банка
-Args: event - dict с httpMethod, body (phone, name)
+Args: event - dict с httpMethod, body (phone, name);
+            queryStringParameters user_id для DELETE (удаление аккаунта) и GET (ход удаления),
+            заголовок X-Consistency-Token из ответа записи для чтения с реплики
       context - объект с request_id
-Returns: HTTP response с данными пользователя или ошибкой
+Returns: HTTP response с данными пользователя, ходом удаления аккаунта или ошибкой
 '''
-import json
-import os
-import psycopg2
+import db
+import cache
+import deletion
+import ratelimit
+from api import Field, Request, dispatch, error, fetch_record, record_type, respond, validate
 from typing import Dict, Any
 
+LOGIN_RATE = ratelimit.limit('login', 0.5, 5)
+ACCOUNT_RATE = ratelimit.limit('account', 1, 5)
 
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    method: str = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
-    
-    if method == 'DELETE':
-        params = event.get('queryStringParameters') or {}
-        user_id = params.get('user_id')
-        
-        if not user_id:
-            return {
-                'statusCode': 400,
-                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                'body': json.dumps({'error': 'user_id is required'})
-            }
-        
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
-        
-        cur.execute("DELETE FROM transactions WHERE from_card_id IN (SELECT id FROM cards WHERE user_id = %s) OR to_card_id IN (SELECT id FROM cards WHERE user_id = %s)", (user_id, user_id))
-        cur.execute("DELETE FROM cards WHERE user_id = %s", (user_id,))
-        cur.execute("DELETE FROM users WHERE id = %s", (user_id,))
-        
+LOGIN_SCHEMA = {
+    'phone': Field(str, required=True, max_length=20),
+    'name': Field(str, required=True, max_length=100)
+}
+
+DELETE_SCHEMA = {
+    'user_id': Field(int, required=True)
+}
+
+User = record_type('User', ('id', 'phone', 'name'))
+
+
+def delete_account(request: Request) -> Dict[str, Any]:
+    user_id = validate(request.params, DELETE_SCHEMA)['user_id']
+
+    limited = ratelimit.check(ACCOUNT_RATE, user_id)
+    if limited:
+        return limited
+
+    with db.connection() as conn, conn.cursor() as cur:
+        deletion.request_deletion(cur, user_id)
+        progress = deletion.fetch_progress(cur, user_id)
+        cache.invalidate_users(cur, [user_id])
+        conn.commit()
+        headers = db.consistency_headers(conn)
+
+    if progress is None:
+        return error(404, 'User not found')
+
+    return respond(202, {'message': 'Account deletion scheduled', 'deletion': progress}, headers=headers)
+
+
+def get_deletion(request: Request) -> Dict[str, Any]:
+    user_id = validate(request.params, DELETE_SCHEMA)['user_id']
+
+    limited = ratelimit.check(ACCOUNT_RATE, user_id)
+    if limited:
+        return limited
+
+    with db.read_connection(request.headers.get('x-consistency-token')) as conn, conn.cursor() as cur:
+        progress = deletion.fetch_progress(cur, user_id)
+
+    if progress is None:
+        return error(404, 'Account deletion not found')
+
+    return respond(200, {'deletion': progress})
+
+
+def login(request: Request) -> Dict[str, Any]:
+    data = validate(request.body, LOGIN_SCHEMA, 'Phone and name are required')
+
+    limited = ratelimit.check(LOGIN_RATE, data['phone'])
+    if limited:
+        return limited
+
+    with db.connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT id, phone, name FROM users WHERE phone = %s", (data['phone'],))
+        existing_user = fetch_record(cur, User)
+
+        if existing_user:
+            return respond(200, {'user': existing_user, 'message': 'Login successful'})
+
+        cur.execute(
+            "INSERT INTO users (phone, name) VALUES (%s, %s) RETURNING id, phone, name",
+            (data['phone'], data['name'])
+        )
+        new_user = fetch_record(cur, User)
         conn.commit()
-        cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'body': json.dumps({'message': 'Account deleted successfully'})
-        }
-    
-    if method != 'POST':
-        return {
-            'statusCode': 405,
-            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
-    
-    body_data = json.loads(event.get('body', '{}'))
-    phone = body_data.get('phone', '').strip()
-    name = body_data.get('name', '').strip()
-    
-    if not phone or not name:
-        return {
-            'statusCode': 400,
-            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'body': json.dumps({'error': 'Phone and name are required'})
-        }
-    
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
-    cur = conn.cursor()
-    
-    cur.execute("SELECT id, phone, name FROM users WHERE phone = %s", (phone,))
-    existing_user = cur.fetchone()
-    
-    if existing_user:
-        user_data = {
-            'id': existing_user[0],
-            'phone': existing_user[1],
-            'name': existing_user[2]
-        }
-        cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'body': json.dumps({'user': user_data, 'message': 'Login successful'})
-        }
-    
-    cur.execute(
-        "INSERT INTO users (phone, name) VALUES (%s, %s) RETURNING id, phone, name",
-        (phone, name)
-    )
-    new_user = cur.fetchone()
-    conn.commit()
-    
-    user_data = {
-        'id': new_user[0],
-        'phone': new_user[1],
-        'name': new_user[2]
-    }
-    
-    cur.close()
-    conn.close()
-    
-    return {
-        'statusCode': 201,
-        'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-        'body': json.dumps({'user': user_data, 'message': 'Registration successful'})
-    }
\ No newline at end of file
+        headers = db.consistency_headers(conn)
+
+    return respond(201, {'user': new_user, 'message': 'Registration successful'}, headers=headers)
+
+
+ROUTES = {
+    'GET': get_deletion,
+    'POST': login,
+    'DELETE': delete_account
+}
+
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return dispatch(event, context, ROUTES, allow_headers='Content-Type, X-Consistency-Token')
+
+
+db.prewarm()
@@ -0,0 +1,81 @@
+'''
+Business: Сводка для главного экрана - пользователь, его карты и последние операции по каждой карте
+Args: cur - курсор psycopg2, user_id, recent - сколько последних операций вернуть на карту
+Returns: dict с user, cards (у каждой карты recent_transactions) или None, если пользователя нет
+'''
+from typing import Any, Dict, Optional
+
+from api import record_type
+
+DEFAULT_RECENT = 5
+MAX_RECENT = 50
+
+DASHBOARD_SQL = """
+SELECT u.id, u.phone, u.name,
+       c.id, c.card_number, c.card_type, c.card_name, c.card_category, c.is_child_card,
+       c.balance, c.created_at, COALESCE(c.status, 'active'), NULLIF(c.credit_limit, 0), NULLIF(c.credit_used, 0),
+       t.id, t.amount, t.transaction_type, t.description, t.created_at, t.from_card, t.to_card
+FROM users u
+LEFT JOIN cards c ON c.user_id = u.id
+LEFT JOIN LATERAL (
+    SELECT r.id, r.amount, r.transaction_type, r.description, r.created_at,
+           c_from.card_number as from_card, c_to.card_number as to_card
+    FROM (
+        (SELECT id, from_card_id, to_card_id, amount, transaction_type, description, created_at
+         FROM transactions
+         WHERE from_card_id = c.id
+         ORDER BY created_at DESC, id DESC
+         LIMIT %(recent)s)
+        UNION ALL
+        (SELECT id, from_card_id, to_card_id, amount, transaction_type, description, created_at
+         FROM transactions
+         WHERE to_card_id = c.id AND from_card_id IS DISTINCT FROM c.id
+         ORDER BY created_at DESC, id DESC
+         LIMIT %(recent)s)
+    ) r
+    LEFT JOIN cards c_from ON r.from_card_id = c_from.id
+    LEFT JOIN cards c_to ON r.to_card_id = c_to.id
+    ORDER BY r.created_at DESC, r.id DESC
+    LIMIT %(recent)s
+) t ON true
+WHERE u.id = %(user_id)s
+ORDER BY c.created_at DESC, c.id, t.created_at DESC, t.id DESC
+"""
+
+
+CARD_FIELDS = (
+    'id', 'card_number', 'card_type', 'card_name', 'card_category', 'is_child_card',
+    'balance', 'created_at', 'status', 'credit_limit', 'credit_used'
+)
+CARD_SELECT = (
+    "SELECT id, card_number, card_type, card_name, card_category, is_child_card, balance, created_at, "
+    "COALESCE(status, 'active'), NULLIF(credit_limit, 0), NULLIF(credit_used, 0) FROM cards"
+)
+TRANSACTION_FIELDS = ('id', 'amount', 'type', 'description', 'created_at', 'from_card', 'to_card')
+
+Card = record_type('Card', CARD_FIELDS)
+DashboardCard = record_type('DashboardCard', CARD_FIELDS + ('recent_transactions',))
+Transaction = record_type('Transaction', TRANSACTION_FIELDS)
+User = record_type('User', ('id', 'phone', 'name'))
+
+
+def fetch_dashboard(cur: Any, user_id: int, recent: int = DEFAULT_RECENT) -> Optional[Dict[str, Any]]:
+    cur.execute(DASHBOARD_SQL, {'user_id': user_id, 'recent': recent})
+    rows = cur.fetchall()
+    if not rows:
+        return None
+
+    user = User(*rows[0][0:3])
+    cards = []
+    by_id: Dict[int, Any] = {}
+    for row in rows:
+        if row[3] is None:
+            continue
+        card = by_id.get(row[3])
+        if card is None:
+            card = DashboardCard(*row[3:14], [])
+            by_id[row[3]] = card
+            cards.append(card)
+        if row[14] is not None:
+            card.recent_transactions.append(Transaction(*row[14:21]))
+    return {'user': user, 'cards': cards}
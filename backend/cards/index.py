@@ -1,183 +1,169 @@
 '''
 Business: Управление виртуальными картами (создание, просмотр, баланс)
-Args: event - dict с httpMethod, body (user_id), queryStringParameters
+Args: event - dict с httpMethod, body (user_id или cards[] для пакетного выпуска;
+            card_id со status и/или default_receiver для PUT), queryStringParameters
+            (user_id, view=dashboard и recent - сводка для главного экрана),
+            заголовок X-Consistency-Token из ответа записи - чтение с реплики не старее этой записи, мимо кэша
       context - объект с request_id
 Returns: HTTP response с данными карт или ошибкой
 '''
-import json
-import os
-import psycopg2
-import random
+import db
+import cache
+import ratelimit
+from api import Field, Request, ValidationError, dispatch, dumps, error, fetch_records, respond, validate
+from issuance import BATCH_MAX_CARDS, issue_cards
+from dashboard import DEFAULT_RECENT, MAX_RECENT, CARD_SELECT, Card, fetch_dashboard
 from typing import Dict, Any
 
+CARDS_BY_USER = db.Statement('cards_by_user', CARD_SELECT + " WHERE user_id = %(user_id)s ORDER BY created_at DESC", {'user_id': 'integer'})
 
-def generate_card_number() -> str:
-    parts = [str(random.randint(1000, 9999)) for _ in range(4)]
-    return ' '.join(parts)
+POLL_RATE = ratelimit.limit('cards_poll', 5, 20)
+ISSUE_RATE = ratelimit.limit('cards_issue', 0.5, 5)
+UPDATE_RATE = ratelimit.limit('cards_update', 2, 10)
 
+LIST_SCHEMA = {
+    'user_id': Field(int, required=True),
+    'view': Field(str, default='list', choices=['list', 'dashboard']),
+    'recent': Field(int, default=DEFAULT_RECENT, maximum=MAX_RECENT)
+}
 
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    method: str = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
+UPDATE_SCHEMA = {
+    'card_id': Field(int, required=True),
+    'status': Field(str, choices=['active', 'frozen', 'blocked']),
+    'default_receiver': Field(bool, default=False)
+}
+
+CARD_SCHEMA = {
+    'user_id': Field(int, required=True),
+    'card_type': Field(str, default='virtual', max_length=50),
+    'card_name': Field(str, default='Виртуальная карта', max_length=100),
+    'card_category': Field(str, default='debit', max_length=50),
+    'is_child_card': Field(bool, default=False)
+}
+
+
+def list_cards(request: Request) -> Dict[str, Any]:
+    query = validate(request.params, LIST_SCHEMA)
+    user_id = query['user_id']
+    limited = ratelimit.check(POLL_RATE, user_id)
+    if limited:
+        return limited
+
+    variant = 'list' if query['view'] == 'list' else f"dashboard:{query['recent']}"
+
+    token = request.headers.get('x-consistency-token')
+    entry = {} if token else cache.get_entry(user_id)
+    cached = entry.get(variant)
+
+    if cached:
+        etag, body = cached
+    else:
+        with db.read_connection(token) as conn, conn.cursor() as cur:
+            if variant == 'list':
+                db.execute(cur, CARDS_BY_USER, {'user_id': user_id})
+                payload = {'cards': fetch_records(cur, Card)}
+            else:
+                payload = fetch_dashboard(cur, user_id, query['recent'])
+
+        if payload is None:
+            return error(404, 'User not found')
+
+        body = dumps(payload)
+        etag = cache.put_variant(user_id, entry, variant, body)
+
+    if cache.not_modified(request.event, etag):
         return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Max-Age': '86400'
-            },
+            'statusCode': 304,
+            'headers': {'Access-Control-Allow-Origin': '*', 'Access-Control-Expose-Headers': 'ETag', 'ETag': etag},
             'body': ''
         }
-    
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
-    cur = conn.cursor()
-    
-    if method == 'GET':
-        params = event.get('queryStringParameters') or {}
-        user_id = params.get('user_id')
-        
-        if not user_id:
-            cur.close()
-            conn.close()
-            return {
-                'statusCode': 400,
-                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                'body': json.dumps({'error': 'user_id is required'})
-            }
-        
-        cur.execute(
-            "SELECT id, card_number, card_type, card_name, card_category, is_child_card, balance, created_at, status, credit_limit, credit_used FROM cards WHERE user_id = %s ORDER BY created_at DESC",
-            (user_id,)
-        )
-        cards_data = cur.fetchall()
-        
-        cards = []
-        for card in cards_data:
-            cards.append({
-                'id': card[0],
-                'card_number': card[1],
-                'card_type': card[2],
-                'card_name': card[3],
-                'card_category': card[4],
-                'is_child_card': card[5],
-                'balance': float(card[6]),
-                'created_at': card[7].isoformat() if card[7] else None,
-                'status': card[8] or 'active',
-                'credit_limit': float(card[9]) if card[9] else None,
-                'credit_used': float(card[10]) if card[10] else None
-            })
-        
-        cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'body': json.dumps({'cards': cards})
-        }
-    
-    if method == 'PUT':
-        body_data = json.loads(event.get('body', '{}'))
-        card_id = body_data.get('card_id')
-        new_status = body_data.get('status')
-        
-        if not card_id or not new_status:
-            cur.close()
-            conn.close()
-            return {
-                'statusCode': 400,
-                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                'body': json.dumps({'error': 'card_id and status are required'})
-            }
-        
-        if new_status not in ['active', 'frozen', 'blocked']:
-            cur.close()
-            conn.close()
-            return {
-                'statusCode': 400,
-                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                'body': json.dumps({'error': 'Invalid status'})
-            }
-        
-        cur.execute(
-            "UPDATE cards SET status = %s WHERE id = %s",
-            (new_status, card_id)
-        )
+
+    return respond(200, headers={'Access-Control-Expose-Headers': 'ETag', 'ETag': etag}, body=body)
+
+
+def update_card(request: Request) -> Dict[str, Any]:
+    data = validate(request.body, UPDATE_SCHEMA)
+    if data['status'] is None and not data['default_receiver']:
+        raise ValidationError('status or default_receiver is required')
+
+    limited = ratelimit.check(UPDATE_RATE, data['card_id'])
+    if limited:
+        return limited
+
+    with db.connection() as conn, conn.cursor() as cur:
+        updated = None
+        if data['status'] is not None:
+            cur.execute(
+                "UPDATE cards SET status = %s WHERE id = %s AND status IS DISTINCT FROM 'closed' RETURNING user_id",
+                (data['status'], data['card_id'])
+            )
+            updated = cur.fetchone()
+        if data['default_receiver']:
+            cur.execute(
+                "UPDATE users u SET default_card_id = c.id FROM cards c WHERE c.id = %s AND u.id = c.user_id AND u.deleted_at IS NULL RETURNING u.id",
+                (data['card_id'],)
+            )
+            updated = cur.fetchone()
+        if updated:
+            cache.invalidate_users(cur, [updated[0]])
         conn.commit()
-        
-        cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'body': json.dumps({'message': 'Card status updated'})
-        }
-    
-    if method == 'POST':
-        body_data = json.loads(event.get('body', '{}'))
-        user_id = body_data.get('user_id')
-        card_type = body_data.get('card_type', 'virtual')
-        card_name = body_data.get('card_name', 'Виртуальная карта')
-        card_category = body_data.get('card_category', 'debit')
-        is_child_card = body_data.get('is_child_card', False)
-        
-        if not user_id:
-            cur.close()
-            conn.close()
-            return {
-                'statusCode': 400,
-                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                'body': json.dumps({'error': 'user_id is required'})
-            }
-        
-        cur.execute("SELECT COUNT(*) FROM cards WHERE user_id = %s", (user_id,))
-        card_count = cur.fetchone()[0]
-        
-        if card_count >= 10:
-            cur.close()
-            conn.close()
-            return {
-                'statusCode': 400,
-                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                'body': json.dumps({'error': 'Maximum 10 cards allowed'})
-            }
-        
-        card_number = generate_card_number()
-        
-        cur.execute(
-            "INSERT INTO cards (user_id, card_number, card_type, card_name, card_category, is_child_card, balance) VALUES (%s, %s, %s, %s, %s, %s, 0.00) RETURNING id, card_number, card_type, card_name, card_category, is_child_card, balance",
-            (user_id, card_number, card_type, card_name, card_category, is_child_card)
-        )
-        new_card = cur.fetchone()
+        headers = db.consistency_headers(conn)
+
+    if not updated:
+        return error(404, 'Card not found')
+
+    if data['default_receiver']:
+        return respond(200, {'message': 'Default receiving card updated'}, headers=headers)
+
+    return respond(200, {'message': 'Card status updated'}, headers=headers)
+
+
+def create_cards(request: Request) -> Dict[str, Any]:
+    body_data = request.body
+    batch = isinstance(body_data, dict) and 'cards' in body_data
+
+    if batch:
+        items = body_data.get('cards')
+        if not isinstance(items, list) or not items or len(items) > BATCH_MAX_CARDS:
+            raise ValidationError(f'cards must be a list of 1 to {BATCH_MAX_CARDS} items')
+        items = [
+            validate({'user_id': body_data.get('user_id'), **item} if isinstance(item, dict) else None, CARD_SCHEMA)
+            for item in items
+        ]
+    else:
+        items = [validate(body_data, CARD_SCHEMA)]
+
+    limited = ratelimit.check(ISSUE_RATE, items[0]['user_id'])
+    if limited:
+        return limited
+
+    with db.connection() as conn, conn.cursor() as cur:
+        issued, errors = issue_cards(cur, items)
+
+        if errors:
+            conn.rollback()
+            status = 404 if all(e['error'] == 'User not found' for e in errors) else 400
+            return error(status, errors[0]['error'], errors=errors)
+
+        cache.invalidate_users(cur, [item['user_id'] for item in items])
         conn.commit()
-        
-        card_data = {
-            'id': new_card[0],
-            'card_number': new_card[1],
-            'card_type': new_card[2],
-            'card_name': new_card[3],
-            'card_category': new_card[4],
-            'is_child_card': new_card[5],
-            'balance': float(new_card[6])
-        }
-        
-        cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 201,
-            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'body': json.dumps({'card': card_data, 'message': 'Card created successfully'})
-        }
-    
-    cur.close()
-    conn.close()
-    
-    return {
-        'statusCode': 405,
-        'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-        'body': json.dumps({'error': 'Method not allowed'})
-    }
\ No newline at end of file
+        headers = db.consistency_headers(conn)
+
+    if batch:
+        return respond(201, {'cards': issued, 'message': f'{len(issued)} cards created successfully'}, headers=headers)
+
+    return respond(201, {'card': issued[0], 'message': 'Card created successfully'}, headers=headers)
+
+
+ROUTES = {
+    'GET': list_cards,
+    'POST': create_cards,
+    'PUT': update_card
+}
+
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return dispatch(event, context, ROUTES, allow_headers='Content-Type, If-None-Match, X-Consistency-Token')
+
+
+db.prewarm()
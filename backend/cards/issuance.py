@@ -0,0 +1,125 @@
+'''
+Business: Выпуск карт - номера по алгоритму Луна из BIN без коллизий (номера, уже занятые старыми картами,
+          пропускаются) и пакетный выпуск одним запросом
+Args: cur - курсор psycopg2, items - список dict (user_id, card_type, card_name, card_category, is_child_card);
+      CARD_BIN, CARD_NUMBER_MULTIPLIER, CARD_NUMBER_OFFSET, MAX_CARDS_PER_USER - настройки из окружения
+Returns: issue_cards() - (выпущенные карты, None) или (None, ошибки по пользователям);
+         первая выпущенная карта становится картой по умолчанию для входящих переводов
+'''
+import math
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from api import record_type
+
+CARD_BIN = os.environ.get('CARD_BIN', '220001')
+CARD_NUMBER_MULTIPLIER = int(os.environ.get('CARD_NUMBER_MULTIPLIER', '387420489'))
+CARD_NUMBER_OFFSET = int(os.environ.get('CARD_NUMBER_OFFSET', '104729'))
+MAX_CARDS_PER_USER = int(os.environ.get('MAX_CARDS_PER_USER', '10'))
+BATCH_MAX_CARDS = 1000
+
+ACCOUNT_DIGITS = 15 - len(CARD_BIN)
+ACCOUNT_SPACE = 10 ** ACCOUNT_DIGITS
+
+if not CARD_BIN.isdigit() or not 6 <= len(CARD_BIN) <= 8:
+    raise ValueError('CARD_BIN must be 6 to 8 digits')
+if math.gcd(CARD_NUMBER_MULTIPLIER, ACCOUNT_SPACE) != 1:
+    raise ValueError('CARD_NUMBER_MULTIPLIER must be coprime with 10 to keep card numbers unique')
+
+CARD_COLUMNS = ('id', 'card_number', 'card_type', 'card_name', 'card_category', 'is_child_card', 'balance')
+
+IssuedCard = record_type('IssuedCard', CARD_COLUMNS)
+
+DEFAULT_CARD_SQL = """
+UPDATE users u
+SET default_card_id = v.id
+FROM (
+    SELECT DISTINCT ON (user_id) user_id, id
+    FROM cards
+    WHERE id = ANY(%s)
+    ORDER BY user_id, is_child_card, card_category IS DISTINCT FROM 'debit', id
+) v
+WHERE u.id = v.user_id AND u.default_card_id IS NULL
+"""
+
+
+class CardNumbersExhausted(Exception):
+    pass
+
+
+def luhn_check_digit(payload: str) -> str:
+    total = 0
+    for position, char in enumerate(reversed(payload)):
+        digit = int(char)
+        if position % 2 == 0:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return str((10 - total % 10) % 10)
+
+
+def card_number_for(sequence_value: int) -> str:
+    if sequence_value >= ACCOUNT_SPACE:
+        raise CardNumbersExhausted(f'BIN {CARD_BIN} has no free card numbers left')
+    account = (CARD_NUMBER_MULTIPLIER * sequence_value + CARD_NUMBER_OFFSET) % ACCOUNT_SPACE
+    payload = CARD_BIN + str(account).zfill(ACCOUNT_DIGITS)
+    pan = payload + luhn_check_digit(payload)
+    return ' '.join(pan[i:i + 4] for i in range(0, 16, 4))
+
+
+def allocate_card_numbers(cur: Any, count: int) -> List[str]:
+    numbers: List[str] = []
+    while len(numbers) < count:
+        cur.execute("SELECT nextval('card_number_seq') FROM generate_series(1, %s)", (count - len(numbers),))
+        candidates = [card_number_for(value) for (value,) in cur.fetchall()]
+        cur.execute("SELECT pan_digits FROM cards WHERE pan_digits = ANY(%s)", ([n.replace(' ', '') for n in candidates],))
+        taken = {pan for (pan,) in cur.fetchall()}
+        numbers.extend(n for n in candidates if n.replace(' ', '') not in taken)
+    return numbers
+
+
+def issue_cards(cur: Any, items: List[Dict[str, Any]]) -> Tuple[Optional[List[Any]], Optional[List[Dict[str, Any]]]]:
+    from psycopg2.extras import execute_values
+
+    requested: Dict[int, int] = {}
+    for item in items:
+        requested[int(item['user_id'])] = requested.get(int(item['user_id']), 0) + 1
+
+    cur.execute(
+        "SELECT u.id, (SELECT COUNT(*) FROM cards c WHERE c.user_id = u.id) FROM users u WHERE u.id = ANY(%s) AND u.deleted_at IS NULL ORDER BY u.id FOR UPDATE",
+        (sorted(requested),)
+    )
+    existing = dict(cur.fetchall())
+
+    errors = []
+    for user_id, count in sorted(requested.items()):
+        if user_id not in existing:
+            errors.append({'user_id': user_id, 'error': 'User not found'})
+        elif existing[user_id] + count > MAX_CARDS_PER_USER:
+            errors.append({'user_id': user_id, 'error': f'Maximum {MAX_CARDS_PER_USER} cards allowed'})
+    if errors:
+        return None, errors
+
+    numbers = allocate_card_numbers(cur, len(items))
+    rows = [
+        (
+            int(item['user_id']),
+            number,
+            item.get('card_type', 'virtual'),
+            item.get('card_name', 'Виртуальная карта'),
+            item.get('card_category', 'debit'),
+            bool(item.get('is_child_card', False))
+        )
+        for item, number in zip(items, numbers)
+    ]
+    issued = execute_values(
+        cur,
+        f"INSERT INTO cards (user_id, card_number, card_type, card_name, card_category, is_child_card, balance) VALUES %s RETURNING {', '.join(CARD_COLUMNS)}",
+        rows,
+        template='(%s, %s, %s, %s, %s, %s, 0.00)',
+        page_size=len(rows),
+        fetch=True
+    )
+    cur.execute(DEFAULT_CARD_SQL, ([row[0] for row in issued],))
+    return [IssuedCard(*row) for row in issued], None
@@ -0,0 +1,198 @@
+'''
+Business: Общий каркас HTTP-обработчиков - маршрутизация по методу, валидация до подключения к БД,
+          маппинг строк курсора в записи со __slots__, быстрый JSON с Decimal/datetime и трассировка вызова
+Args: event, context - вход функции; routes - dict метод -> обработчик Request
+Returns: dispatch(), respond(), error(), validate(), record_type(), fetch_records(), dumps()
+'''
+import dataclasses
+import json
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from itertools import starmap
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import tracing
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_HEADERS = {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'}
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if hasattr(value, '__dataclass_fields__'):
+        return {name: getattr(value, name) for name in value.__slots__}
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+if orjson is not None:
+    def dumps(payload: Any) -> str:
+        return orjson.dumps(payload, default=_default).decode()
+else:
+    _encoder = json.JSONEncoder(default=_default)
+
+    def dumps(payload: Any) -> str:
+        return _encoder.encode(payload)
+
+
+def record_type(name: str, columns: Sequence[str]) -> type:
+    return dataclasses.make_dataclass(name, list(columns), slots=True)
+
+
+def fetch_records(cur: Any, record: type) -> List[Any]:
+    return list(starmap(record, cur.fetchall()))
+
+
+def fetch_record(cur: Any, record: type) -> Optional[Any]:
+    row = cur.fetchone()
+    return record(*row) if row else None
+
+
+def respond(status: int, payload: Any = None, headers: Optional[Dict[str, str]] = None, body: Optional[str] = None) -> Dict[str, Any]:
+    if body is None:
+        body = dumps(payload) if payload is not None else ''
+    return {
+        'statusCode': status,
+        'headers': {**JSON_HEADERS, **headers} if headers else JSON_HEADERS,
+        'body': body
+    }
+
+
+def error(status: int, message: str, **extra: Any) -> Dict[str, Any]:
+    return respond(status, {'error': message, **extra})
+
+
+class ValidationError(Exception):
+    pass
+
+
+class Field:
+    __slots__ = ('kind', 'required', 'default', 'choices', 'positive', 'minimum', 'maximum', 'max_length', 'places')
+
+    def __init__(self, kind: type = str, required: bool = False, default: Any = None, choices: Optional[Sequence[Any]] = None,
+                 positive: bool = False, minimum: Any = None, maximum: Any = None, max_length: Optional[int] = None,
+                 places: Optional[int] = None) -> None:
+        self.kind = kind
+        self.required = required
+        self.default = default
+        self.choices = choices
+        self.positive = positive
+        self.minimum = minimum
+        self.maximum = maximum
+        self.max_length = max_length
+        self.places = places
+
+    def parse(self, name: str, value: Any) -> Any:
+        if value is None or value == '':
+            if self.required:
+                raise ValidationError(f'{name} is required')
+            return self.default
+        if self.kind is int:
+            if isinstance(value, bool) or not (isinstance(value, int) or (isinstance(value, str) and value.strip().isascii() and value.strip().isdigit())):
+                raise ValidationError(f'{name} must be an integer')
+            value = int(value)
+        elif self.kind is Decimal:
+            if isinstance(value, bool):
+                raise ValidationError(f'{name} must be a number')
+            try:
+                value = Decimal(str(value))
+            except InvalidOperation:
+                raise ValidationError(f'{name} must be a number')
+            if not value.is_finite():
+                raise ValidationError(f'{name} must be a number')
+            if self.places is not None and value.as_tuple().exponent < -self.places:
+                raise ValidationError(f'{name} must have at most {self.places} decimal places')
+        elif self.kind is str:
+            if not isinstance(value, str):
+                raise ValidationError(f'{name} must be a string')
+            value = value.strip()
+            if self.max_length is not None and len(value) > self.max_length:
+                raise ValidationError(f'{name} must be at most {self.max_length} characters')
+            if not value and self.required:
+                raise ValidationError(f'{name} is required')
+        elif self.kind is date:
+            try:
+                value = date.fromisoformat(value) if isinstance(value, str) else None
+            except ValueError:
+                value = None
+            if value is None:
+                raise ValidationError(f'{name} must be a date (YYYY-MM-DD)')
+        elif not isinstance(value, self.kind):
+            raise ValidationError(f'{name} must be of type {self.kind.__name__}')
+        if self.choices is not None and value not in self.choices:
+            raise ValidationError(f'Invalid {name}')
+        if self.positive and value <= 0:
+            raise ValidationError(f'{name} must be positive')
+        if self.minimum is not None and value < self.minimum:
+            raise ValidationError(f'{name} must be at least {self.minimum}')
+        if self.maximum is not None and value > self.maximum:
+            raise ValidationError(f'{name} must be at most {self.maximum}')
+        return value
+
+
+def validate(data: Any, schema: Dict[str, Field], message: Optional[str] = None) -> Dict[str, Any]:
+    if not isinstance(data, dict):
+        raise ValidationError(message or 'Request body must be a JSON object')
+    try:
+        return {name: field.parse(name, data.get(name)) for name, field in schema.items()}
+    except ValidationError as e:
+        raise ValidationError(message or str(e))
+
+
+class Request:
+    __slots__ = ('event', 'context', 'method', 'params', 'headers', 'body')
+
+    def __init__(self, event: Dict[str, Any], context: Any, method: str) -> None:
+        self.event = event
+        self.context = context
+        self.method = method
+        self.params = event.get('queryStringParameters') or {}
+        self.headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+        self.body: Any = None
+
+
+def dispatch(event: Dict[str, Any], context: Any, routes: Dict[str, Callable[[Request], Dict[str, Any]]],
+             default_method: str = 'GET', allow_headers: str = 'Content-Type') -> Dict[str, Any]:
+    method = event.get('httpMethod', default_method)
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': ', '.join(list(routes) + ['OPTIONS']),
+                'Access-Control-Allow-Headers': allow_headers,
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': ''
+        }
+
+    route = routes.get(method)
+    if route is None:
+        return error(405, 'Method not allowed')
+
+    with tracing.invocation(context, route.__name__, method) as outcome:
+        response = _run(route, Request(event, context, method))
+        outcome['status'] = response['statusCode']
+    return response
+
+
+def _run(route: Callable[[Request], Dict[str, Any]], request: Request) -> Dict[str, Any]:
+    if request.method in ('POST', 'PUT', 'DELETE') and request.event.get('body'):
+        try:
+            request.body = json.loads(request.event['body'])
+        except ValueError:
+            return error(400, 'Invalid JSON body')
+    elif request.method in ('POST', 'PUT'):
+        request.body = {}
+
+    try:
+        return route(request)
+    except ValidationError as e:
+        return error(400, str(e))
@@ -0,0 +1,162 @@
+'''
+Business: Кредитный движок - выдача в пределах лимита только по активной карте неудалённого клиента и погашение одним условным UPDATE ... RETURNING
+          вместе с операцией, ногами двойной записи, дневным снимком, итогами аналитики и событием outbox в том же запросе
+Args: cur - курсор psycopg2, card_id, amount (Decimal); DEFAULT_CREDIT_LIMIT - лимит карт без своего лимита
+Returns: CreditResult со статусом, id проводки и новыми значениями баланса, долга и лимита
+'''
+import os
+from decimal import Decimal
+from typing import Any, NamedTuple, Optional
+
+DEFAULT_CREDIT_LIMIT = Decimal(os.environ.get('DEFAULT_CREDIT_LIMIT', '1000000.00'))
+
+OK = 'ok'
+CARD_NOT_FOUND = 'card_not_found'
+LIMIT_EXCEEDED = 'limit_exceeded'
+NO_CREDIT = 'no_credit'
+CARD_INACTIVE = 'card_inactive'
+
+APPROVE_SQL = """
+WITH card AS (
+    SELECT c.id, COALESCE(c.credit_used, 0) AS credit_used, COALESCE(c.credit_limit, %(default_limit)s) AS credit_limit,
+           c.status = 'active' AND u.deleted_at IS NULL AS active
+    FROM cards c JOIN users u ON u.id = c.user_id
+    WHERE c.id = %(card_id)s
+),
+approved AS (
+    UPDATE cards
+    SET balance = balance + %(amount)s,
+        credit_used = COALESCE(credit_used, 0) + %(amount)s,
+        credit_limit = COALESCE(credit_limit, %(default_limit)s),
+        interest_accrued_on = CASE WHEN COALESCE(credit_used, 0) = 0 THEN CURRENT_DATE ELSE interest_accrued_on END,
+        interest_remainder = CASE WHEN COALESCE(credit_used, 0) = 0 THEN 0 ELSE interest_remainder END
+    WHERE id = %(card_id)s
+      AND status = 'active'
+      AND EXISTS (SELECT 1 FROM users u WHERE u.id = cards.user_id AND u.deleted_at IS NULL)
+      AND COALESCE(credit_used, 0) + %(amount)s <= COALESCE(credit_limit, %(default_limit)s)
+    RETURNING id, user_id, balance, credit_used, credit_limit
+),
+snapshot AS (
+    INSERT INTO card_daily_balances (card_id, day, opening_balance, closing_balance, inflow, outflow)
+    SELECT id, CURRENT_DATE, balance - %(amount)s, balance, %(amount)s, 0 FROM approved
+    ON CONFLICT (card_id, day) DO UPDATE
+    SET closing_balance = EXCLUDED.closing_balance,
+        inflow = card_daily_balances.inflow + EXCLUDED.inflow
+),
+ledger AS (
+    INSERT INTO transactions (to_card_id, amount, transaction_type, description)
+    SELECT id, %(amount)s, 'credit', 'Credit approval' FROM approved
+    RETURNING id
+),
+postings AS (
+    INSERT INTO postings (transaction_id, entry_type, account, card_id, amount)
+    SELECT ledger.id, 'credit', 'card', approved.id, %(amount)s FROM ledger, approved
+    UNION ALL
+    SELECT ledger.id, 'credit', 'credit', approved.id, -(%(amount)s::numeric) FROM ledger, approved
+),
+rollup AS (
+    INSERT INTO spending_rollups (card_id, month, category, spent, spent_count, received, received_count)
+    SELECT approved.id, date_trunc('month', CURRENT_DATE)::date, 'credit', 0, 0, %(amount)s, 1 FROM ledger, approved
+    ON CONFLICT (card_id, month, category) DO UPDATE
+    SET spent = spending_rollups.spent + EXCLUDED.spent,
+        spent_count = spending_rollups.spent_count + EXCLUDED.spent_count,
+        received = spending_rollups.received + EXCLUDED.received,
+        received_count = spending_rollups.received_count + EXCLUDED.received_count
+),
+outbox AS (
+    INSERT INTO outbox_events (event_type, aggregate_id, payload)
+    SELECT 'credit.approved', ledger.id, json_build_object(
+        'transaction_id', ledger.id, 'card_id', approved.id, 'user_id', approved.user_id,
+        'amount', %(amount)s::numeric::text, 'new_balance', approved.balance::text
+    )
+    FROM ledger, approved
+)
+SELECT (SELECT id FROM ledger),
+       (SELECT user_id FROM approved),
+       (SELECT balance FROM approved),
+       COALESCE((SELECT credit_used FROM approved), (SELECT credit_used FROM card)),
+       COALESCE((SELECT credit_limit FROM approved), (SELECT credit_limit FROM card)),
+       EXISTS (SELECT 1 FROM card),
+       COALESCE((SELECT active FROM card), FALSE)
+"""
+
+REPAY_SQL = """
+WITH card AS (
+    SELECT id, COALESCE(credit_used, 0) AS credit_used FROM cards WHERE id = %(card_id)s FOR UPDATE
+),
+repaid AS (
+    UPDATE cards
+    SET credit_used = card.credit_used - LEAST(%(amount)s, card.credit_used)
+    FROM card
+    WHERE cards.id = card.id AND card.credit_used > 0
+    RETURNING cards.id, cards.user_id, LEAST(%(amount)s, card.credit_used) AS amount, cards.credit_used, cards.credit_limit
+),
+ledger AS (
+    INSERT INTO transactions (from_card_id, amount, transaction_type, description)
+    SELECT id, amount, 'credit_repayment', 'Credit repayment' FROM repaid
+    RETURNING id
+),
+postings AS (
+    INSERT INTO postings (transaction_id, entry_type, account, card_id, amount)
+    SELECT ledger.id, 'credit_repayment', 'credit', repaid.id, repaid.amount FROM ledger, repaid
+    UNION ALL
+    SELECT ledger.id, 'credit_repayment', 'repayments', NULL, -repaid.amount FROM ledger, repaid
+),
+rollup AS (
+    INSERT INTO spending_rollups (card_id, month, category, spent, spent_count, received, received_count)
+    SELECT repaid.id, date_trunc('month', CURRENT_DATE)::date, 'credit_repayment', repaid.amount, 1, 0, 0 FROM ledger, repaid
+    ON CONFLICT (card_id, month, category) DO UPDATE
+    SET spent = spending_rollups.spent + EXCLUDED.spent,
+        spent_count = spending_rollups.spent_count + EXCLUDED.spent_count,
+        received = spending_rollups.received + EXCLUDED.received,
+        received_count = spending_rollups.received_count + EXCLUDED.received_count
+),
+outbox AS (
+    INSERT INTO outbox_events (event_type, aggregate_id, payload)
+    SELECT 'credit.repaid', ledger.id, json_build_object(
+        'transaction_id', ledger.id, 'card_id', repaid.id, 'user_id', repaid.user_id,
+        'amount', repaid.amount::text, 'remaining_credit', repaid.credit_used::text
+    )
+    FROM ledger, repaid
+)
+SELECT (SELECT id FROM ledger),
+       (SELECT user_id FROM repaid),
+       (SELECT amount FROM repaid),
+       (SELECT credit_used FROM repaid),
+       (SELECT credit_limit FROM repaid),
+       EXISTS (SELECT 1 FROM card)
+"""
+
+
+class CreditResult(NamedTuple):
+    status: str
+    transaction_id: Optional[int] = None
+    user_id: Optional[int] = None
+    amount: Optional[Decimal] = None
+    balance: Optional[Decimal] = None
+    credit_used: Optional[Decimal] = None
+    credit_limit: Optional[Decimal] = None
+
+
+def approve_credit(cur: Any, card_id: int, amount: Decimal) -> CreditResult:
+    cur.execute(APPROVE_SQL, {'card_id': card_id, 'amount': amount, 'default_limit': DEFAULT_CREDIT_LIMIT})
+    transaction_id, user_id, balance, credit_used, credit_limit, card_exists, card_active = cur.fetchone()
+
+    if transaction_id is not None:
+        return CreditResult(OK, transaction_id, user_id, amount, balance, credit_used, credit_limit)
+    if not card_exists:
+        return CreditResult(CARD_NOT_FOUND)
+    if not card_active:
+        return CreditResult(CARD_INACTIVE)
+    return CreditResult(LIMIT_EXCEEDED, credit_used=credit_used, credit_limit=credit_limit)
+
+
+def repay_credit(cur: Any, card_id: int, amount: Decimal) -> CreditResult:
+    cur.execute(REPAY_SQL, {'card_id': card_id, 'amount': amount})
+    transaction_id, user_id, repaid, credit_used, credit_limit, card_exists = cur.fetchone()
+
+    if transaction_id is not None:
+        return CreditResult(OK, transaction_id, user_id, repaid, credit_used=credit_used, credit_limit=credit_limit)
+    if not card_exists:
+        return CreditResult(CARD_NOT_FOUND)
+    return CreditResult(NO_CREDIT)
@@ -0,0 +1,115 @@
+'''
+Business: Ключи идемпотентности для денежных операций - повтор запроса возвращает сохранённый ответ
+Args: event с заголовком Idempotency-Key, cur - курсор открытой транзакции, endpoint - имя операции
+Returns: begin() - готовый ответ (повтор или конфликт) либо None, record() - запись ответа в той же транзакции
+'''
+import hashlib
+import os
+import random
+from typing import Any, Dict, Optional, Tuple
+
+from api import ValidationError, error, respond
+
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', '86400'))
+PURGE_BATCH_SIZE = int(os.environ.get('IDEMPOTENCY_PURGE_BATCH_SIZE', '500'))
+PURGE_PROBABILITY = float(os.environ.get('IDEMPOTENCY_PURGE_PROBABILITY', '0.01'))
+MAX_KEY_LENGTH = 255
+
+CLAIM_SQL = """
+INSERT INTO idempotency_keys (idempotency_key, endpoint, request_hash, expires_at)
+VALUES (%(key)s, %(endpoint)s, %(request_hash)s, CURRENT_TIMESTAMP + %(ttl)s * INTERVAL '1 second')
+ON CONFLICT (idempotency_key, endpoint) DO UPDATE
+SET request_hash = EXCLUDED.request_hash,
+    expires_at = EXCLUDED.expires_at,
+    created_at = CURRENT_TIMESTAMP,
+    status_code = NULL,
+    response_body = NULL
+WHERE idempotency_keys.expires_at < CURRENT_TIMESTAMP
+RETURNING idempotency_key
+"""
+
+PURGE_SQL = """
+DELETE FROM idempotency_keys
+WHERE ctid IN (
+    SELECT ctid FROM idempotency_keys
+    WHERE expires_at < CURRENT_TIMESTAMP
+    LIMIT %s
+)
+"""
+
+
+class IdempotencyConflict(Exception):
+    pass
+
+
+def get_key(event: Dict[str, Any]) -> Optional[str]:
+    for name, value in (event.get('headers') or {}).items():
+        if name.lower() == 'idempotency-key':
+            value = (value or '').strip()
+            if len(value) > MAX_KEY_LENGTH:
+                raise ValidationError(f'Idempotency-Key must be at most {MAX_KEY_LENGTH} characters')
+            return value or None
+    return None
+
+
+def request_hash(event: Dict[str, Any]) -> str:
+    return hashlib.sha256((event.get('body') or '').encode()).hexdigest()
+
+
+def claim(cur: Any, key: str, endpoint: str, event: Dict[str, Any]) -> Optional[Tuple[int, str]]:
+    fingerprint = request_hash(event)
+    cur.execute(CLAIM_SQL, {'key': key, 'endpoint': endpoint, 'request_hash': fingerprint, 'ttl': IDEMPOTENCY_TTL_SECONDS})
+    if cur.fetchone():
+        return None
+
+    cur.execute(
+        "SELECT request_hash, status_code, response_body FROM idempotency_keys WHERE idempotency_key = %s AND endpoint = %s",
+        (key, endpoint)
+    )
+    row = cur.fetchone()
+    if row is None or row[1] is None:
+        raise IdempotencyConflict('A request with this Idempotency-Key is still in progress')
+    stored_hash, status_code, response_body = row
+    if stored_hash != fingerprint:
+        raise IdempotencyConflict('Idempotency-Key was already used with a different request')
+    return status_code, response_body
+
+
+def record(cur: Any, key: Optional[str], endpoint: str, status_code: int, response_body: str) -> None:
+    if not key:
+        return
+    cur.execute(
+        "UPDATE idempotency_keys SET status_code = %s, response_body = %s WHERE idempotency_key = %s AND endpoint = %s",
+        (status_code, response_body, key, endpoint)
+    )
+
+
+def purge_expired(cur: Any, batch_size: int = PURGE_BATCH_SIZE) -> int:
+    cur.execute(PURGE_SQL, (batch_size,))
+    return cur.rowcount
+
+
+def maybe_purge_expired(conn: Any) -> None:
+    if random.random() >= PURGE_PROBABILITY:
+        return
+    with conn.cursor() as cur:
+        purge_expired(cur)
+    conn.commit()
+
+
+def replay_response(stored: Tuple[int, str]) -> Dict[str, Any]:
+    return respond(stored[0], headers={'Idempotent-Replayed': 'true'}, body=stored[1])
+
+
+def begin(conn: Any, cur: Any, key: Optional[str], endpoint: str, event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if not key:
+        return None
+    try:
+        stored = claim(cur, key, endpoint, event)
+    except IdempotencyConflict as e:
+        conn.rollback()
+        return error(409, str(e))
+    if stored is None:
+        return None
+    conn.rollback()
+    return replay_response(stored)
@@ -1,156 +1,124 @@
 '''
 Business: Оформление кредитов с зачислением на карту
-Args: event - dict с httpMethod, body (card_id, amount)
+Args: event - dict с httpMethod, body (card_id, amount) для выдачи или (card_id, repay_amount) для погашения,
+            заголовок Idempotency-Key
       context - объект с request_id
 Returns: HTTP response с результатом кредита
 '''
-import json
-import os
-import psycopg2
+import db
+import cache
+import idempotency
+import engine
+import ratelimit
+from api import Field, Request, dispatch, dumps, error, respond, validate
+from decimal import Decimal
 from typing import Dict, Any
 
+CREDIT_RATE = ratelimit.limit('credit', 1, 5)
 
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    method: str = event.get('httpMethod', 'POST')
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
-    
-    if method == 'PUT':
-        body_data = json.loads(event.get('body', '{}'))
-        card_id = body_data.get('card_id')
-        repay_amount = body_data.get('repay_amount', 0)
-        
-        if not card_id or repay_amount <= 0:
-            return {
-                'statusCode': 400,
-                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                'body': json.dumps({'error': 'Invalid repayment data'})
-            }
-        
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cur = conn.cursor()
-        
-        cur.execute("SELECT id, credit_used FROM cards WHERE id = %s", (card_id,))
-        card = cur.fetchone()
-        
-        if not card:
-            cur.close()
-            conn.close()
-            return {
-                'statusCode': 404,
-                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                'body': json.dumps({'error': 'Card not found'})
-            }
-        
-        credit_used = float(card[1] or 0)
-        
-        if credit_used <= 0:
-            cur.close()
-            conn.close()
-            return {
-                'statusCode': 400,
-                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                'body': json.dumps({'error': 'No credit to repay'})
-            }
-        
-        if repay_amount > credit_used:
-            repay_amount = credit_used
-        
-        cur.execute(
-            "UPDATE cards SET credit_used = credit_used - %s WHERE id = %s",
-            (repay_amount, card_id)
-        )
-        
-        cur.execute(
-            "INSERT INTO transactions (from_card_id, amount, transaction_type, description) VALUES (%s, %s, %s, %s)",
-            (card_id, repay_amount, 'credit_repayment', 'Credit repayment')
-        )
-        
+CREDIT_SCHEMA = {
+    'card_id': Field(int, required=True),
+    'amount': Field(Decimal, required=True, positive=True, places=2)
+}
+
+REPAY_SCHEMA = {
+    'card_id': Field(int, required=True),
+    'repay_amount': Field(Decimal, required=True, positive=True, places=2)
+}
+
+CREDIT_ERRORS = {
+    engine.CARD_NOT_FOUND: (404, 'Card not found'),
+    engine.LIMIT_EXCEEDED: (400, 'Credit limit exceeded'),
+    engine.CARD_INACTIVE: (403, 'Card is not active'),
+    engine.NO_CREDIT: (400, 'No credit to repay'),
+}
+
+
+def credit_error(result: engine.CreditResult) -> Dict[str, Any]:
+    status_code, message = CREDIT_ERRORS[result.status]
+    if result.status == engine.LIMIT_EXCEEDED:
+        return error(status_code, message, credit_limit=result.credit_limit, available_credit=result.credit_limit - result.credit_used)
+    return error(status_code, message)
+
+
+def repay_credit(request: Request) -> Dict[str, Any]:
+    data = validate(request.body, REPAY_SCHEMA, 'Invalid repayment data')
+    idempotency_key = idempotency.get_key(request.event)
+
+    limited = ratelimit.check(CREDIT_RATE, data['card_id'])
+    if limited:
+        return limited
+
+    with db.connection() as conn, conn.cursor() as cur:
+        early_response = idempotency.begin(conn, cur, idempotency_key, 'credit:PUT', request.event)
+        if early_response:
+            return early_response
+
+        result = engine.repay_credit(cur, data['card_id'], data['repay_amount'])
+
+        if result.status != engine.OK:
+            conn.rollback()
+            return credit_error(result)
+
+        response_body = dumps({
+            'message': 'Credit repaid successfully',
+            'repaid_amount': result.amount,
+            'remaining_credit': result.credit_used
+        })
+        idempotency.record(cur, idempotency_key, 'credit:PUT', 200, response_body)
+
+        cache.invalidate_users(cur, [result.user_id])
         conn.commit()
-        
-        cur.execute("SELECT credit_used FROM cards WHERE id = %s", (card_id,))
-        new_credit_used = cur.fetchone()[0]
-        
-        cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'body': json.dumps({
-                'message': 'Credit repaid successfully',
-                'repaid_amount': float(repay_amount),
-                'remaining_credit': float(new_credit_used or 0)
-            })
-        }
-    
-    if method != 'POST':
-        return {
-            'statusCode': 405,
-            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
-    
-    body_data = json.loads(event.get('body', '{}'))
-    card_id = body_data.get('card_id')
-    amount = body_data.get('amount', 0)
-    
-    if not card_id or amount <= 0:
-        return {
-            'statusCode': 400,
-            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'body': json.dumps({'error': 'Invalid credit data'})
-        }
-    
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
-    cur = conn.cursor()
-    
-    cur.execute("SELECT id, balance FROM cards WHERE id = %s", (card_id,))
-    card = cur.fetchone()
-    
-    if not card:
-        cur.close()
-        conn.close()
-        return {
-            'statusCode': 404,
-            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'body': json.dumps({'error': 'Card not found'})
-        }
-    
-    cur.execute(
-        "UPDATE cards SET balance = balance + %s, credit_used = COALESCE(credit_used, 0) + %s, credit_limit = COALESCE(credit_limit, %s) WHERE id = %s",
-        (amount, amount, amount, card_id)
-    )
-    
-    cur.execute(
-        "INSERT INTO transactions (to_card_id, amount, transaction_type, description) VALUES (%s, %s, %s, %s)",
-        (card_id, amount, 'credit', 'Credit approval')
-    )
-    
-    conn.commit()
-    
-    cur.execute("SELECT balance FROM cards WHERE id = %s", (card_id,))
-    new_balance = cur.fetchone()[0]
-    
-    cur.close()
-    conn.close()
-    
-    return {
-        'statusCode': 200,
-        'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-        'body': json.dumps({
+        idempotency.maybe_purge_expired(conn)
+        headers = db.consistency_headers(conn)
+
+    return respond(200, headers=headers, body=response_body)
+
+
+def approve_credit(request: Request) -> Dict[str, Any]:
+    data = validate(request.body, CREDIT_SCHEMA, 'Invalid credit data')
+    idempotency_key = idempotency.get_key(request.event)
+
+    limited = ratelimit.check(CREDIT_RATE, data['card_id'])
+    if limited:
+        return limited
+
+    with db.connection() as conn, conn.cursor() as cur:
+        early_response = idempotency.begin(conn, cur, idempotency_key, 'credit:POST', request.event)
+        if early_response:
+            return early_response
+
+        result = engine.approve_credit(cur, data['card_id'], data['amount'])
+
+        if result.status != engine.OK:
+            conn.rollback()
+            return credit_error(result)
+
+        response_body = dumps({
             'message': 'Credit approved and funds added',
-            'amount': float(amount),
-            'new_balance': float(new_balance)
+            'amount': result.amount,
+            'new_balance': result.balance,
+            'credit_used': result.credit_used,
+            'credit_limit': result.credit_limit
         })
-    }
\ No newline at end of file
+        idempotency.record(cur, idempotency_key, 'credit:POST', 200, response_body)
+
+        cache.invalidate_users(cur, [result.user_id])
+        conn.commit()
+        idempotency.maybe_purge_expired(conn)
+        headers = db.consistency_headers(conn)
+
+    return respond(200, headers=headers, body=response_body)
+
+
+ROUTES = {
+    'POST': approve_credit,
+    'PUT': repay_credit
+}
+
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return dispatch(event, context, ROUTES, default_method='POST', allow_headers='Content-Type, Idempotency-Key')
+
+
+db.prewarm()
@@ -0,0 +1,113 @@
+'''
+Business: Ночное начисление процентов по кредитным картам - пакетные UPDATE по диапазонам id карт,
+          проценты капитализируются в credit_used и пишутся операциями credit_interest с ногами двойной записи
+          и помесячными итогами аналитики; операция датируется временем запуска, день начисления - в accrued_on,
+          доли копейки копятся в interest_remainder, кэш карт затронутых клиентов сбрасывается
+Args: CREDIT_INTEREST_APR - годовая ставка; CLI: python interest.py [--day YYYY-MM-DD] [--batch-size N] с DATABASE_URL
+Returns: accrue() - число карт и сумма начисленных процентов; повторный запуск за тот же день ничего не начисляет
+'''
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+import cache
+
+CREDIT_INTEREST_APR = Decimal(os.environ.get('CREDIT_INTEREST_APR', '0.049'))
+DAYS_IN_YEAR = 365
+
+ACCRUE_SQL = """
+WITH owed AS (
+    SELECT id,
+           credit_used * %(daily_rate)s * (%(day)s::date - COALESCE(interest_accrued_on, %(day)s::date - 1))
+               + interest_remainder AS exact
+    FROM cards
+    WHERE id BETWEEN %(first_id)s AND %(last_id)s
+      AND credit_used > 0
+      AND (interest_accrued_on IS NULL OR interest_accrued_on < %(day)s::date)
+    ORDER BY id
+    FOR UPDATE
+),
+due AS (
+    SELECT id, round(exact, 2) AS interest, exact - round(exact, 2) AS remainder FROM owed
+),
+accrued AS (
+    UPDATE cards
+    SET credit_used = cards.credit_used + due.interest,
+        interest_remainder = due.remainder,
+        interest_accrued_on = %(day)s::date
+    FROM due
+    WHERE cards.id = due.id
+    RETURNING cards.id, cards.user_id, due.interest
+),
+ledger AS (
+    INSERT INTO transactions (from_card_id, amount, transaction_type, description, accrued_on)
+    SELECT id, interest, 'credit_interest', 'Interest accrual ' || %(day)s::date, %(day)s::date
+    FROM accrued
+    WHERE interest > 0
+    RETURNING id, from_card_id, amount
+),
+postings AS (
+    INSERT INTO postings (transaction_id, entry_type, account, card_id, amount)
+    SELECT id, 'credit_interest', 'credit', from_card_id, -amount FROM ledger
+    UNION ALL
+    SELECT id, 'credit_interest', 'interest_income', NULL, amount FROM ledger
+),
+rollup AS (
+    INSERT INTO spending_rollups (card_id, month, category, spent, spent_count, received, received_count)
+    SELECT from_card_id, date_trunc('month', CURRENT_DATE)::date, 'credit_interest', amount, 1, 0, 0 FROM ledger
+    ON CONFLICT (card_id, month, category) DO UPDATE
+    SET spent = spending_rollups.spent + EXCLUDED.spent,
+        spent_count = spending_rollups.spent_count + EXCLUDED.spent_count,
+        received = spending_rollups.received + EXCLUDED.received,
+        received_count = spending_rollups.received_count + EXCLUDED.received_count
+)
+SELECT count(*), COALESCE(sum(interest), 0), array_remove(array_agg(DISTINCT user_id), NULL) FROM accrued
+"""
+
+
+def card_id_batches(cur: Any, batch_size: int) -> List[Tuple[int, int]]:
+    cur.execute("SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), -1) FROM cards")
+    first_id, last_id = cur.fetchone()
+    return [(lo, min(lo + batch_size - 1, last_id)) for lo in range(first_id, last_id + 1, batch_size)]
+
+
+def accrue(conn: Any, day: date, batch_size: int = 5000, apr: Decimal = CREDIT_INTEREST_APR) -> Dict[str, Any]:
+    daily_rate = apr / DAYS_IN_YEAR
+    cards = 0
+    total = Decimal('0')
+    with conn.cursor() as cur:
+        for first_id, last_id in card_id_batches(cur, batch_size):
+            cur.execute(ACCRUE_SQL, {'first_id': first_id, 'last_id': last_id, 'day': day, 'daily_rate': daily_rate})
+            count, interest, user_ids = cur.fetchone()
+            cache.invalidate_users(cur, user_ids)
+            conn.commit()
+            cards += count
+            total += interest
+    return {'day': day.isoformat(), 'cards': cards, 'interest': str(total)}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import psycopg2
+
+    parser = argparse.ArgumentParser(description='Accrue daily interest on outstanding credit')
+    parser.add_argument('--day', type=date.fromisoformat, default=date.today(), help='accrual day, defaults to today')
+    parser.add_argument('--batch-size', type=int, default=5000, help='cards per chunk')
+    args = parser.parse_args(argv)
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        started = time.monotonic()
+        result = accrue(conn, args.day, args.batch_size)
+        print(json.dumps({**result, 'elapsed_s': round(time.monotonic() - started, 2)}))
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,185 @@
+'''
+Business: Аналитика трат - помесячные итоги по карте и типу операции (расход, приход, число операций) в spending_rollups,
+          обновляются в той же транзакции, что и проводка; пересборка из истории одним агрегирующим запросом на диапазон карт
+Args: cur - курсор psycopg2; CLI: python analytics.py rebuild|check [--batch-size N] с DATABASE_URL
+Returns: record_transfer_rollups() для пакетного перевода, fetch_breakdown() для обработчика, rebuild(), check()
+'''
+import argparse
+import json
+import os
+import sys
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from snapshots import card_id_batches
+
+UPSERT_SQL = """
+INSERT INTO spending_rollups (card_id, month, category, spent, spent_count, received, received_count)
+VALUES %s
+ON CONFLICT (card_id, month, category) DO UPDATE
+SET spent = spending_rollups.spent + EXCLUDED.spent,
+    spent_count = spending_rollups.spent_count + EXCLUDED.spent_count,
+    received = spending_rollups.received + EXCLUDED.received,
+    received_count = spending_rollups.received_count + EXCLUDED.received_count
+"""
+
+UPSERT_TEMPLATE = "(%s, date_trunc('month', CURRENT_DATE)::date, %s, %s, %s, %s, %s)"
+
+REPLAY_SQL = """
+WITH legs AS (
+    SELECT from_card_id AS card_id, date_trunc('month', created_at)::date AS month, transaction_type AS category,
+           amount AS spent, 1 AS spent_count, 0::numeric AS received, 0 AS received_count
+    FROM transactions
+    WHERE from_card_id BETWEEN %(first_id)s AND %(last_id)s AND created_at >= %(since)s
+    UNION ALL
+    SELECT to_card_id, date_trunc('month', created_at)::date, transaction_type, 0::numeric, 0, amount, 1
+    FROM transactions
+    WHERE to_card_id BETWEEN %(first_id)s AND %(last_id)s AND created_at >= %(since)s
+)
+SELECT card_id, month, category, SUM(spent), SUM(spent_count), SUM(received), SUM(received_count)
+FROM legs
+GROUP BY card_id, month, category
+"""
+
+CHECK_SQL = """
+WITH replay AS ({replay}),
+stored AS (
+    SELECT card_id, month, category, spent, spent_count, received, received_count
+    FROM spending_rollups
+    WHERE card_id BETWEEN %(first_id)s AND %(last_id)s AND month >= %(since)s
+)
+SELECT COALESCE(r.card_id, s.card_id), COALESCE(r.month, s.month), COALESCE(r.category, s.category),
+       r.spent, s.spent, r.received, s.received
+FROM replay r
+FULL JOIN stored s ON s.card_id = r.card_id AND s.month = r.month AND s.category = r.category
+WHERE r.card_id IS NULL OR s.card_id IS NULL
+   OR (r.spent, r.spent_count, r.received, r.received_count)
+      IS DISTINCT FROM (s.spent, s.spent_count, s.received, s.received_count)
+ORDER BY 1, 2, 3
+"""
+
+BREAKDOWN_SQL = """
+SELECT month, category, SUM(spent), SUM(spent_count), SUM(received), SUM(received_count)
+FROM spending_rollups
+WHERE card_id = ANY(%(card_ids)s) AND month BETWEEN %(month_from)s AND %(month_to)s
+GROUP BY month, category
+ORDER BY month, category
+"""
+
+ARCHIVE_HORIZON_SQL = "SELECT COALESCE(MAX(range_end), '-infinity'::timestamp) FROM transaction_archives"
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def record_transfer_rollups(cur: Any, from_card_id: int, transfers: Iterable[Tuple[int, Decimal]], category: str = 'transfer') -> None:
+    from psycopg2.extras import execute_values
+
+    totals: Dict[int, List[Any]] = defaultdict(lambda: [Decimal(0), 0, Decimal(0), 0])
+    for to_card_id, amount in transfers:
+        totals[from_card_id][0] += amount
+        totals[from_card_id][1] += 1
+        totals[to_card_id][2] += amount
+        totals[to_card_id][3] += 1
+    rows = [(card_id, category, *values) for card_id, values in sorted(totals.items())]
+    if rows:
+        execute_values(cur, UPSERT_SQL, rows, template=UPSERT_TEMPLATE, page_size=len(rows))
+
+
+def fetch_breakdown(cur: Any, card_ids: List[int], date_from: date, date_to: date) -> Dict[str, Any]:
+    month_from, month_to = month_start(date_from), month_start(date_to)
+    cur.execute(BREAKDOWN_SQL, {'card_ids': card_ids, 'month_from': month_from, 'month_to': month_to})
+
+    months: Dict[date, Dict[str, Any]] = {}
+    totals: Dict[str, Dict[str, Any]] = {}
+    for month, category, spent, spent_count, received, received_count in cur.fetchall():
+        entry = months.setdefault(month, {'month': month.isoformat(), 'spent': 0.0, 'received': 0.0, 'categories': []})
+        entry['spent'] += float(spent)
+        entry['received'] += float(received)
+        entry['categories'].append({
+            'category': category,
+            'spent': float(spent),
+            'spent_count': int(spent_count),
+            'received': float(received),
+            'received_count': int(received_count)
+        })
+        total = totals.setdefault(category, {'category': category, 'spent': 0.0, 'spent_count': 0, 'received': 0.0, 'received_count': 0})
+        total['spent'] += float(spent)
+        total['spent_count'] += int(spent_count)
+        total['received'] += float(received)
+        total['received_count'] += int(received_count)
+
+    return {
+        'card_ids': card_ids,
+        'from': month_from.isoformat(),
+        'to': month_to.isoformat(),
+        'months': list(months.values()),
+        'totals': sorted(totals.values(), key=lambda t: t['spent'], reverse=True)
+    }
+
+
+def _archive_horizon(cur: Any) -> Any:
+    cur.execute(ARCHIVE_HORIZON_SQL)
+    return cur.fetchone()[0]
+
+
+def rebuild(conn: Any, batch_size: int = 10000) -> int:
+    rebuilt = 0
+    with conn.cursor() as cur:
+        since = _archive_horizon(cur)
+        for first_id, last_id in card_id_batches(cur, batch_size):
+            params = {'first_id': first_id, 'last_id': last_id, 'since': since}
+            cur.execute("SELECT id FROM cards WHERE id BETWEEN %(first_id)s AND %(last_id)s ORDER BY id FOR UPDATE", params)
+            cur.execute("DELETE FROM spending_rollups WHERE card_id BETWEEN %(first_id)s AND %(last_id)s AND month >= %(since)s", params)
+            cur.execute(
+                "INSERT INTO spending_rollups (card_id, month, category, spent, spent_count, received, received_count) " + REPLAY_SQL,
+                params
+            )
+            rebuilt += cur.rowcount
+            conn.commit()
+    return rebuilt
+
+
+def check(conn: Any, batch_size: int = 10000) -> List[Dict[str, Any]]:
+    drift = []
+    with conn.cursor() as cur:
+        since = _archive_horizon(cur)
+        for first_id, last_id in card_id_batches(cur, batch_size):
+            cur.execute(CHECK_SQL.format(replay=REPLAY_SQL), {'first_id': first_id, 'last_id': last_id, 'since': since})
+            for row in cur.fetchall():
+                drift.append({
+                    'card_id': row[0],
+                    'month': row[1].isoformat(),
+                    'category': row[2],
+                    'expected': [str(v) if v is not None else None for v in (row[3], row[5])],
+                    'stored': [str(v) if v is not None else None for v in (row[4], row[6])]
+                })
+            conn.rollback()
+    return drift
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import psycopg2
+
+    parser = argparse.ArgumentParser(description='Rebuild or verify spending_rollups from the ledger')
+    parser.add_argument('command', choices=['rebuild', 'check'])
+    parser.add_argument('--batch-size', type=int, default=10000, help='cards per chunk')
+    args = parser.parse_args(argv)
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        if args.command == 'rebuild':
+            print(json.dumps({'rebuilt_rows': rebuild(conn, args.batch_size)}))
+            return 0
+        drift = check(conn, args.batch_size)
+        print(json.dumps({'drift_rows': len(drift), 'drift': drift[:100]}))
+        return 1 if drift else 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
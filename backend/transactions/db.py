@@ -0,0 +1,360 @@
+'''
+Business: Пул соединений с БД, переживающий вызовы на тёплом инстансе функции, и маршрутизация чтений на реплику
+          с учётом отставания и откатом на основную БД; драйвер psycopg2 импортируется при первом соединении,
+          горячие запросы готовятся на сервере (PREPARE) один раз на соединение и заново после смены схемы;
+          соединение, закрытое сервером, обнаруживается по сокету при выдаче из пула и заменяется новым
+Args: DATABASE_URL - строка подключения, DB_POOL_* - настройки пула из окружения; DATABASE_REPLICA_URL - реплика,
+      DB_REPLICA_MAX_LAG - допустимое отставание в секундах, X-Consistency-Token - LSN записи от клиента,
+      DB_REPLICA_STATE_TTL - сколько секунд верить запомненному LSN и отставанию реплики на соединении;
+      DB_PREPARE_STATEMENTS=0 - без PREPARE (pgbouncer в режиме transaction), DB_PREWARM=1 - соединение при старте
+Returns: контекстный менеджер connection() с проверенным соединением, read_connection() для чтений,
+         consistency_headers() с LSN после коммита записи, Statement/execute() для подготовленных запросов, prewarm()
+'''
+import os
+import re
+import select
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import tracing
+
+psycopg2: Any = None
+
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+HEALTHCHECK_INTERVAL = float(os.environ.get('DB_HEALTHCHECK_INTERVAL', '30'))
+MAX_CONNECTION_AGE = float(os.environ.get('DB_MAX_CONNECTION_AGE', '1800'))
+REPLICA_MAX_LAG = float(os.environ.get('DB_REPLICA_MAX_LAG', '5'))
+REPLICA_RETRY_AFTER = float(os.environ.get('DB_REPLICA_RETRY_AFTER', '30'))
+REPLICA_STATE_TTL = float(os.environ.get('DB_REPLICA_STATE_TTL', '1'))
+PREPARE_STATEMENTS = os.environ.get('DB_PREPARE_STATEMENTS', '1') != '0'
+PREWARM = os.environ.get('DB_PREWARM', '0') == '1'
+
+CONSISTENCY_HEADER = 'X-Consistency-Token'
+_LSN = re.compile(r'^[0-9A-Fa-f]{1,8}/[0-9A-Fa-f]{1,8}$')
+_PLACEHOLDER = re.compile(r'%\((\w+)\)s')
+STALE_PLAN_CODES = ('0A000', '26000')
+
+REPLICA_STATE_SQL = """
+SELECT pg_is_in_recovery(),
+       CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+       END,
+       pg_last_wal_replay_lsn()::text
+"""
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def driver() -> Any:
+    global psycopg2
+    if psycopg2 is None:
+        import psycopg2.extensions
+    return psycopg2
+
+
+class Statement:
+    __slots__ = ('name', 'sql', 'prepare_sql', 'execute_sql')
+
+    def __init__(self, name: str, sql: str, types: Dict[str, str]) -> None:
+        order = list(dict.fromkeys(_PLACEHOLDER.findall(sql)))
+        positions = {param: f'${i}' for i, param in enumerate(order, 1)}
+        body = _PLACEHOLDER.sub(lambda m: positions[m.group(1)], sql).replace('%%', '%')
+        self.name = name
+        self.sql = sql
+        self.prepare_sql = f"PREPARE {name} ({', '.join(types[param] for param in order)}) AS {body}"
+        self.execute_sql = f"EXECUTE {name} ({', '.join(f'%({param})s' for param in order)})"
+        STATEMENTS[name] = self
+
+
+STATEMENTS: Dict[str, Statement] = {}
+_prepared: Dict[int, Set[str]] = {}
+_replica_state: Dict[int, Tuple[float, bool, Optional[float], Optional[int]]] = {}
+
+
+def _prepare(cur: Any, statement: Statement) -> bool:
+    prepared = _prepared.get(id(cur.connection)) if PREPARE_STATEMENTS else None
+    if prepared is None:
+        return False
+    if statement.name not in prepared:
+        cur.execute(statement.prepare_sql)
+        prepared.add(statement.name)
+    return True
+
+
+def execute(cur: Any, statement: Statement, params: Dict[str, Any]) -> None:
+    conn = cur.connection
+    fresh = conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    if not _prepare(cur, statement):
+        cur.execute(statement.sql, params)
+        return
+    try:
+        cur.execute(statement.execute_sql, params)
+    except psycopg2.Error as e:
+        if e.pgcode not in STALE_PLAN_CODES:
+            raise
+        conn.rollback()
+        cur.execute('DEALLOCATE ALL')
+        _prepared[id(conn)].clear()
+        if not fresh:
+            raise
+        _prepare(cur, statement)
+        cur.execute(statement.execute_sql, params)
+
+
+def _dropped(conn: Any) -> bool:
+    try:
+        readable, _, _ = select.select([conn], [], [], 0)
+        if readable:
+            conn.poll()
+    except (psycopg2.Error, OSError, ValueError):
+        return True
+    return bool(conn.closed)
+
+
+class ConnectionPool:
+    def __init__(self, dsn: str, max_size: int = POOL_MAX_SIZE, timeout: float = POOL_TIMEOUT) -> None:
+        self.dsn = dsn
+        self.max_size = max_size
+        self.timeout = timeout
+        self.stats: Dict[str, int] = {'opened': 0, 'reused': 0, 'discarded': 0}
+        self._idle: List[Tuple[Any, float, float]] = []
+        self._created: Dict[int, float] = {}
+        self._in_use = 0
+        self._cond = threading.Condition()
+
+    def getconn(self) -> Any:
+        started = time.perf_counter()
+        entry = self._reserve()
+        if entry is not None:
+            conn, created, last_used = entry
+            if self._healthy(conn, created, last_used):
+                with self._cond:
+                    self.stats['reused'] += 1
+                tracing.record_connect((time.perf_counter() - started) * 1000, False)
+                return conn
+            self._close(conn)
+        try:
+            conn = driver().connect(self.dsn, cursor_factory=tracing.cursor_factory())
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._created[id(conn)] = time.monotonic()
+            _prepared[id(conn)] = set()
+            self.stats['opened'] += 1
+        tracing.record_connect((time.perf_counter() - started) * 1000, True)
+        return conn
+
+    def putconn(self, conn: Any, discard: bool = False) -> None:
+        if not discard and not conn.closed:
+            status = conn.get_transaction_status()
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                discard = True
+            elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+        with self._cond:
+            self._in_use -= 1
+            created = self._created.get(id(conn), 0.0)
+            if not discard and not conn.closed:
+                self._idle.append((conn, created, time.monotonic()))
+            self._cond.notify()
+        if discard or conn.closed:
+            self._close(conn)
+
+    def closeall(self) -> None:
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn, _, _ in idle:
+            self._close(conn)
+
+    def _reserve(self) -> Optional[Tuple[Any, float, float]]:
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    self._in_use += 1
+                    return self._idle.pop()
+                if self._in_use < self.max_size:
+                    self._in_use += 1
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(f'No free connection after {self.timeout}s (max {self.max_size})')
+                self._cond.wait(remaining)
+
+    def _healthy(self, conn: Any, created: float, last_used: float) -> bool:
+        if conn.closed:
+            return False
+        now = time.monotonic()
+        if now - created > MAX_CONNECTION_AGE:
+            return False
+        if now - last_used < HEALTHCHECK_INTERVAL:
+            return not _dropped(conn)
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def _close(self, conn: Any) -> None:
+        with self._cond:
+            self._created.pop(id(conn), None)
+            _prepared.pop(id(conn), None)
+            _replica_state.pop(id(conn), None)
+            self.stats['discarded'] += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+
+_pool: Optional[ConnectionPool] = None
+_replica_pool: Optional[ConnectionPool] = None
+_replica_down_until = 0.0
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(os.environ['DATABASE_URL'])
+    return _pool
+
+
+def get_replica_pool() -> Optional[ConnectionPool]:
+    global _replica_pool
+    dsn = os.environ.get('DATABASE_REPLICA_URL')
+    if not dsn:
+        return None
+    if _replica_pool is None:
+        with _pool_lock:
+            if _replica_pool is None:
+                _replica_pool = ConnectionPool(dsn)
+    return _replica_pool
+
+
+@contextmanager
+def _lease(pool: ConnectionPool, conn: Any) -> Iterator[Any]:
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        pool.putconn(conn, discard=True)
+        raise
+    except BaseException:
+        pool.putconn(conn)
+        raise
+    else:
+        pool.putconn(conn)
+
+
+@contextmanager
+def connection() -> Iterator[Any]:
+    pool = get_pool()
+    with _lease(pool, pool.getconn()) as conn:
+        yield conn
+
+
+def _mark_replica_down() -> None:
+    global _replica_down_until
+    _replica_down_until = time.monotonic() + REPLICA_RETRY_AFTER
+
+
+def _lsn(value: Optional[str]) -> Optional[int]:
+    if value is None:
+        return None
+    high, low = value.split('/')
+    return (int(high, 16) << 32) | int(low, 16)
+
+
+def _replica_state_of(conn: Any, min_lsn: Optional[int]) -> Tuple[bool, Optional[float], Optional[int]]:
+    cached = _replica_state.get(id(conn))
+    if cached is not None and time.monotonic() < cached[0] and (min_lsn is None or (cached[3] or 0) >= min_lsn):
+        return cached[1:]
+    with conn.cursor() as cur:
+        cur.execute(REPLICA_STATE_SQL)
+        in_recovery, lag, replay_lsn = cur.fetchone()
+    conn.rollback()
+    state = (in_recovery, lag, _lsn(replay_lsn))
+    _replica_state[id(conn)] = (time.monotonic() + REPLICA_STATE_TTL, *state)
+    return state
+
+
+def _replica_connection(pool: ConnectionPool, min_lsn: Optional[str]) -> Optional[Any]:
+    if time.monotonic() < _replica_down_until:
+        return None
+    try:
+        conn = pool.getconn()
+    except PoolTimeout:
+        return None
+    except psycopg2.Error:
+        _mark_replica_down()
+        return None
+    required = _lsn(min_lsn)
+    try:
+        in_recovery, lag, replay_lsn = _replica_state_of(conn, required)
+    except psycopg2.Error:
+        pool.putconn(conn, discard=True)
+        _mark_replica_down()
+        return None
+    if not in_recovery:
+        pool.putconn(conn)
+        _mark_replica_down()
+        return None
+    if lag is None or lag > REPLICA_MAX_LAG or (required is not None and (replay_lsn or 0) < required):
+        pool.putconn(conn)
+        return None
+    return conn
+
+
+@contextmanager
+def read_connection(consistency_token: Optional[str] = None) -> Iterator[Any]:
+    pool = get_replica_pool()
+    conn = None
+    if pool is not None and (consistency_token is None or _LSN.match(consistency_token)):
+        conn = _replica_connection(pool, consistency_token)
+    if conn is None:
+        with connection() as conn:
+            yield conn
+        return
+    with _lease(pool, conn):
+        yield conn
+
+
+def consistency_headers(conn: Any) -> Optional[Dict[str, str]]:
+    if not os.environ.get('DATABASE_REPLICA_URL'):
+        return None
+    with conn.cursor() as cur:
+        cur.execute('SELECT pg_current_wal_lsn()::text')
+        lsn = cur.fetchone()[0]
+    conn.rollback()
+    return {CONSISTENCY_HEADER: lsn, 'Access-Control-Expose-Headers': CONSISTENCY_HEADER}
+
+
+def prewarm() -> None:
+    if not PREWARM or not os.environ.get('DATABASE_URL'):
+        return
+
+    def warm() -> None:
+        try:
+            with connection() as conn, conn.cursor() as cur:
+                for statement in list(STATEMENTS.values()):
+                    _prepare(cur, statement)
+                conn.rollback()
+        except Exception:
+            pass
+
+    threading.Thread(target=warm, name='db-prewarm', daemon=True).start()
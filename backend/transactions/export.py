@@ -0,0 +1,129 @@
+'''
+Business: Потоковая выгрузка истории операций карты или всех карт клиента за период в CSV или NDJSON
+          через COPY ... TO STDOUT - строки сериализует Postgres, память не зависит от числа строк
+Args: cur - курсор psycopg2, out - бинарный файл, card_id или user_id, период, формат csv|ndjson, gzip;
+      EXPORT_MAX_BYTES - предел сжатого ответа API; CLI: python export.py --card-id|--user-id --from --to
+Returns: число выгруженных строк; в CLI - поток в stdout или файл и статистика скорости в stderr
+'''
+import argparse
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, BinaryIO, List, Optional
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+FORMATS = (CSV, NDJSON)
+CONTENT_TYPES = {CSV: 'text/csv; charset=utf-8', NDJSON: 'application/x-ndjson'}
+
+EXPORT_MAX_BYTES = int(os.environ.get('EXPORT_MAX_BYTES', str(3 * 1024 * 1024)))
+EXPORT_MAX_DAYS = 366
+COPY_CHUNK_BYTES = 1 << 16
+
+EXPORT_SQL = """
+SELECT t.id, t.created_at, t.transaction_type AS type, t.amount,
+       c_from.card_number AS from_card, c_to.card_number AS to_card, t.description
+FROM transactions t
+LEFT JOIN cards c_from ON c_from.id = t.from_card_id
+LEFT JOIN cards c_to ON c_to.id = t.to_card_id
+WHERE (t.from_card_id = ANY(%(card_ids)s) OR t.to_card_id = ANY(%(card_ids)s))
+  AND t.created_at >= %(range_start)s AND t.created_at < %(range_end)s
+ORDER BY t.created_at, t.id
+"""
+
+COPY_CSV = "COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)"
+COPY_NDJSON = "COPY (SELECT row_to_json(e)::text FROM ({query}) e) TO STDOUT WITH (FORMAT csv, QUOTE e'\\x01', DELIMITER e'\\x02')"
+
+
+class ExportTooLarge(Exception):
+    pass
+
+
+def card_ids_for(cur: Any, card_id: Optional[int], user_id: Optional[int]) -> List[int]:
+    if card_id is not None:
+        cur.execute("SELECT id FROM cards WHERE id = %s", (card_id,))
+    else:
+        cur.execute("SELECT id FROM cards WHERE user_id = %s", (user_id,))
+    return [row[0] for row in cur.fetchall()]
+
+
+def copy_export(cur: Any, out: BinaryIO, card_ids: List[int], date_from: date, date_to: date, fmt: str = CSV) -> int:
+    query = cur.mogrify(EXPORT_SQL, {
+        'card_ids': card_ids,
+        'range_start': datetime.combine(date_from, datetime.min.time()),
+        'range_end': datetime.combine(date_to + timedelta(days=1), datetime.min.time())
+    }).decode()
+    copy = COPY_NDJSON if fmt == NDJSON else COPY_CSV
+    cur.copy_expert(copy.format(query=query), out, size=COPY_CHUNK_BYTES)
+    return cur.rowcount
+
+
+class _CappedWriter:
+    def __init__(self, target: BinaryIO, limit: int) -> None:
+        self.target = target
+        self.limit = limit
+        self.written = 0
+
+    def write(self, data: bytes) -> int:
+        self.written += len(data)
+        if self.written > self.limit:
+            raise ExportTooLarge(f'export exceeds {self.limit} compressed bytes')
+        return self.target.write(data)
+
+    def flush(self) -> None:
+        self.target.flush()
+
+
+def export_gzip(cur: Any, card_ids: List[int], date_from: date, date_to: date, fmt: str = CSV,
+                max_bytes: int = EXPORT_MAX_BYTES) -> bytes:
+    with tempfile.SpooledTemporaryFile(max_size=COPY_CHUNK_BYTES) as spool:
+        with gzip.GzipFile(fileobj=_CappedWriter(spool, max_bytes), mode='wb', compresslevel=6) as compressed:
+            copy_export(cur, compressed, card_ids, date_from, date_to, fmt)
+        spool.seek(0)
+        return spool.read()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import psycopg2
+
+    parser = argparse.ArgumentParser(description='Stream card or user transaction history as CSV or NDJSON')
+    owner = parser.add_mutually_exclusive_group(required=True)
+    owner.add_argument('--card-id', type=int)
+    owner.add_argument('--user-id', type=int)
+    parser.add_argument('--from', dest='date_from', type=date.fromisoformat, required=True)
+    parser.add_argument('--to', dest='date_to', type=date.fromisoformat, required=True)
+    parser.add_argument('--format', choices=FORMATS, default=CSV)
+    parser.add_argument('--gzip', action='store_true', help='compress the output stream')
+    parser.add_argument('--output', '-o', help='file to write, stdout by default')
+    args = parser.parse_args(argv)
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    started = time.monotonic()
+    try:
+        with conn.cursor() as cur:
+            card_ids = card_ids_for(cur, args.card_id, args.user_id)
+            if args.gzip:
+                with gzip.GzipFile(fileobj=out, mode='wb', compresslevel=6) as compressed:
+                    rows = copy_export(cur, compressed, card_ids, args.date_from, args.date_to, args.format)
+            else:
+                rows = copy_export(cur, out, card_ids, args.date_from, args.date_to, args.format)
+        out.flush()
+    finally:
+        if args.output:
+            out.close()
+        conn.close()
+
+    elapsed = time.monotonic() - started
+    sys.stderr.write(json.dumps({
+        'rows': rows, 'elapsed_s': round(elapsed, 2), 'rows_per_minute': round(rows / elapsed * 60) if elapsed else None
+    }) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+'''
+Business: Keyset-пагинация истории операций карты по (created_at, id)
+Args: cur - курсор psycopg2, card_id, limit - размер страницы, after - (created_at, id) из decode_cursor()
+      HISTORY_HOT_DAYS - окно свежих партиций: сначала читается только оно, старые партиции - если страница не набралась
+Returns: строки страницы и next_cursor (None, если страница последняя)
+'''
+import base64
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Any, List, Optional, Tuple
+
+import db
+from api import fetch_records, record_type
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+HISTORY_HOT_DAYS = int(os.environ.get('HISTORY_HOT_DAYS', '90'))
+
+HISTORY_SQL = """
+SELECT t.id, t.amount, t.transaction_type, t.description, t.created_at,
+       c_from.card_number as from_card, c_to.card_number as to_card
+FROM (
+    (SELECT id, from_card_id, to_card_id, amount, transaction_type, description, created_at
+     FROM transactions
+     WHERE from_card_id = %(card_id)s {bounds}
+     ORDER BY created_at DESC, id DESC
+     LIMIT %(limit)s)
+    UNION ALL
+    (SELECT id, from_card_id, to_card_id, amount, transaction_type, description, created_at
+     FROM transactions
+     WHERE to_card_id = %(card_id)s AND from_card_id IS DISTINCT FROM %(card_id)s {bounds}
+     ORDER BY created_at DESC, id DESC
+     LIMIT %(limit)s)
+) t
+LEFT JOIN cards c_from ON t.from_card_id = c_from.id
+LEFT JOIN cards c_to ON t.to_card_id = c_to.id
+ORDER BY t.created_at DESC, t.id DESC
+LIMIT %(limit)s
+"""
+
+Transaction = record_type('Transaction', ('id', 'amount', 'type', 'description', 'created_at', 'from_card', 'to_card'))
+
+AFTER_CURSOR = "AND (created_at, id) < (%(after_created_at)s, %(after_id)s)"
+HOT_BOUND = "AND created_at >= %(hot_since)s"
+COLD_BOUND = "AND created_at < %(hot_since)s"
+
+
+HISTORY_TYPES = {
+    'card_id': 'integer', 'limit': 'integer', 'hot_since': 'timestamp', 'after_created_at': 'timestamp', 'after_id': 'bigint'
+}
+HISTORY_STATEMENTS = {
+    (hot, paged): db.Statement(
+        f"history_{'hot' if hot else 'cold'}{'_after' if paged else ''}",
+        HISTORY_SQL.format(bounds=' '.join([HOT_BOUND if hot else COLD_BOUND] + ([AFTER_CURSOR] if paged else []))),
+        HISTORY_TYPES
+    )
+    for hot in (True, False)
+    for paged in (False, True)
+}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at: datetime, tx_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), tx_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, tx_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(tx_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(str(e))
+
+
+def _fetch_page(cur: Any, card_id: int, limit: int, after: Optional[Tuple[datetime, int]], hot_since: datetime, hot: bool) -> List[Any]:
+    params = {'card_id': card_id, 'limit': limit, 'hot_since': hot_since}
+    if after:
+        params['after_created_at'], params['after_id'] = after
+    db.execute(cur, HISTORY_STATEMENTS[hot, bool(after)], params)
+    return fetch_records(cur, Transaction)
+
+
+def fetch_history(cur: Any, card_id: int, limit: int, after: Optional[Tuple[datetime, int]] = None) -> Tuple[List[Any], Optional[str]]:
+    hot_since = (after[0] if after else datetime.now()) - timedelta(days=HISTORY_HOT_DAYS)
+    rows = _fetch_page(cur, card_id, limit + 1, after, hot_since, hot=True)
+    if len(rows) <= limit:
+        rows += _fetch_page(cur, card_id, limit + 1 - len(rows), after, hot_since, hot=False)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, next_cursor
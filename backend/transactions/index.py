@@ -1,173 +1,290 @@
 '''
 Business: Переводы между картами по номеру карты или телефону
-Args: event - dict с httpMethod, body (from_card_id, to_identifier, amount, type)
+Args: event - dict с httpMethod, queryStringParameters (card_id, limit, cursor;
+            view=statement, from, to - выписка за период;
+            view=export, card_id или user_id, from, to, format - gzip-выгрузка CSV/NDJSON;
+            view=analytics, card_id или user_id, from, to - траты и поступления по месяцам и типам операций;
+            view=recipients, identifiers, identifier_type - предпросмотр получателей),
+            body (from_card_id, to_identifier, amount, type)
+            или body (from_card_id, transfers[], mode) для пакетного перевода,
+            заголовок Idempotency-Key для безопасных повторов POST,
+            заголовок X-Consistency-Token из ответа записи - чтение с реплики не старее этой записи
       context - объект с request_id
-Returns: HTTP response с результатом транзакции
+Returns: HTTP response с результатом транзакции; 403 с именем правила, если перевод отклонён антифродом
 '''
-import json
-import os
-import psycopg2
-from typing import Dict, Any
+import base64
+import db
+import cache
+import analytics
+import export
+import idempotency
+import ratelimit
+import recipients
+from api import Field, Request, ValidationError, dispatch, dumps, error, respond, validate
+from typing import Dict, Any, Optional
+from datetime import date
 from decimal import Decimal
+from history import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursor, decode_cursor, fetch_history
+from risk import RULE_DENIED
+from snapshots import MAX_STATEMENT_DAYS, fetch_statement
+from transfer import (
+    OK, SOURCE_NOT_FOUND, RECIPIENT_NOT_FOUND, SAME_CARD, INSUFFICIENT_FUNDS, NOT_APPLIED,
+    BATCH_MAX_ITEMS, MODE_ATOMIC, MODE_BEST_EFFORT, execute_transfer, execute_batch_transfer
+)
 
+TRANSFER_ERRORS = {
+    SOURCE_NOT_FOUND: (404, 'Source card not found'),
+    RECIPIENT_NOT_FOUND: (404, 'Recipient not found'),
+    SAME_CARD: (400, 'Cannot transfer to the same card'),
+    INSUFFICIENT_FUNDS: (400, 'Insufficient funds'),
+    NOT_APPLIED: (400, 'Batch rejected, no transfers applied'),
+    RULE_DENIED: (403, 'Transfer declined by risk rules'),
+}
 
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    method: str = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': ''
-        }
-    
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
-    cur = conn.cursor()
-    
-    if method == 'GET':
-        params = event.get('queryStringParameters') or {}
-        card_id = params.get('card_id')
-        
-        if not card_id:
-            cur.close()
-            conn.close()
-            return {
-                'statusCode': 400,
-                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                'body': json.dumps({'error': 'card_id is required'})
-            }
-        
-        cur.execute(
-            """
-            SELECT t.id, t.amount, t.transaction_type, t.description, t.created_at,
-                   c_from.card_number as from_card, c_to.card_number as to_card
-            FROM transactions t
-            LEFT JOIN cards c_from ON t.from_card_id = c_from.id
-            LEFT JOIN cards c_to ON t.to_card_id = c_to.id
-            WHERE t.from_card_id = %s OR t.to_card_id = %s
-            ORDER BY t.created_at DESC
-            LIMIT 50
-            """,
-            (card_id, card_id)
-        )
-        transactions_data = cur.fetchall()
-        
-        transactions = []
-        for tx in transactions_data:
-            transactions.append({
-                'id': tx[0],
-                'amount': float(tx[1]),
-                'type': tx[2],
-                'description': tx[3],
-                'created_at': tx[4].isoformat() if tx[4] else None,
-                'from_card': tx[5],
-                'to_card': tx[6]
-            })
-        
-        cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'body': json.dumps({'transactions': transactions})
-        }
-    
-    if method == 'POST':
-        body_data = json.loads(event.get('body', '{}'))
-        from_card_id = body_data.get('from_card_id')
-        to_identifier = body_data.get('to_identifier', '').strip()
-        amount = body_data.get('amount', 0)
-        identifier_type = body_data.get('identifier_type', 'card')
-        
-        if not from_card_id or not to_identifier or amount <= 0:
-            cur.close()
-            conn.close()
-            return {
-                'statusCode': 400,
-                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                'body': json.dumps({'error': 'Invalid transfer data'})
-            }
-        
-        cur.execute("SELECT balance FROM cards WHERE id = %s", (from_card_id,))
-        from_card = cur.fetchone()
-        
-        if not from_card:
-            cur.close()
-            conn.close()
-            return {
-                'statusCode': 404,
-                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                'body': json.dumps({'error': 'Source card not found'})
-            }
-        
-        if from_card[0] < Decimal(str(amount)):
-            cur.close()
-            conn.close()
-            return {
-                'statusCode': 400,
-                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                'body': json.dumps({'error': 'Insufficient funds'})
-            }
-        
-        if identifier_type == 'phone':
-            cur.execute(
-                "SELECT c.id FROM cards c JOIN users u ON c.user_id = u.id WHERE u.phone = %s LIMIT 1",
-                (to_identifier,)
-            )
-        else:
-            cur.execute("SELECT id FROM cards WHERE card_number = %s", (to_identifier,))
-        
-        to_card = cur.fetchone()
-        
-        if not to_card:
-            cur.close()
-            conn.close()
-            return {
-                'statusCode': 404,
-                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                'body': json.dumps({'error': 'Recipient not found'})
-            }
-        
-        to_card_id = to_card[0]
-        
-        cur.execute(
-            "UPDATE cards SET balance = balance - %s WHERE id = %s",
-            (amount, from_card_id)
-        )
-        
-        cur.execute(
-            "UPDATE cards SET balance = balance + %s WHERE id = %s",
-            (amount, to_card_id)
-        )
-        
-        cur.execute(
-            "INSERT INTO transactions (from_card_id, to_card_id, amount, transaction_type, description) VALUES (%s, %s, %s, %s, %s) RETURNING id",
-            (from_card_id, to_card_id, amount, 'transfer', f'Transfer via {identifier_type}')
-        )
-        
-        transaction_id = cur.fetchone()[0]
+HISTORY_RATE = ratelimit.limit('history', 10, 30)
+EXPORT_RATE = ratelimit.limit('export', 0.05, 3)
+TRANSFER_RATE = ratelimit.limit('transfer', 5, 20)
+BATCH_RATE = ratelimit.limit('transfer_batch', 0.2, 5)
+
+VIEW_SCHEMA = {
+    'view': Field(str, default='history', choices=['history', 'statement', 'export', 'recipients', 'analytics'])
+}
+
+CARD_QUERY_SCHEMA = {
+    'card_id': Field(int, required=True)
+}
+
+RECIPIENTS_SCHEMA = {
+    'identifiers': Field(str, required=True, max_length=2000),
+    'identifier_type': Field(str, choices=[recipients.CARD, recipients.PHONE])
+}
+
+HISTORY_SCHEMA = {
+    'limit': Field(int, default=DEFAULT_PAGE_SIZE, minimum=1, maximum=MAX_PAGE_SIZE),
+    'cursor': Field(str)
+}
+
+STATEMENT_SCHEMA = {
+    'from': Field(date),
+    'to': Field(date)
+}
+
+EXPORT_SCHEMA = {
+    'card_id': Field(int),
+    'user_id': Field(int),
+    'from': Field(date, required=True),
+    'to': Field(date, required=True),
+    'format': Field(str, default=export.CSV, choices=export.FORMATS)
+}
+
+ANALYTICS_SCHEMA = {
+    'card_id': Field(int),
+    'user_id': Field(int),
+    'from': Field(date, required=True),
+    'to': Field(date, required=True)
+}
+
+TRANSFER_SCHEMA = {
+    'from_card_id': Field(int, required=True),
+    'to_identifier': Field(str, required=True, max_length=32),
+    'amount': Field(Decimal, required=True, positive=True, places=2),
+    'identifier_type': Field(str, default='card', choices=['card', 'phone'])
+}
+
+BATCH_SCHEMA = {
+    'from_card_id': Field(int, required=True),
+    'transfers': Field(list, required=True),
+    'mode': Field(str, default=MODE_ATOMIC, choices=[MODE_ATOMIC, MODE_BEST_EFFORT])
+}
+
+
+def get_statement(card_id: int, params: Dict[str, Any], token: Optional[str]) -> Dict[str, Any]:
+    period = validate(params, STATEMENT_SCHEMA, 'Invalid statement period')
+    date_to = period['to'] or date.today()
+    date_from = period['from'] or date_to.replace(day=1)
+    if date_from > date_to or (date_to - date_from).days > MAX_STATEMENT_DAYS:
+        raise ValidationError('Invalid statement period')
+
+    with db.read_connection(token) as conn, conn.cursor() as cur:
+        statement = fetch_statement(cur, card_id, date_from, date_to)
+
+    return respond(200, {'statement': statement})
+
+
+def get_export(params: Dict[str, Any], token: Optional[str]) -> Dict[str, Any]:
+    query = validate(params, EXPORT_SCHEMA, 'Invalid export parameters')
+    if (query['card_id'] is None) == (query['user_id'] is None):
+        raise ValidationError('Exactly one of card_id or user_id is required')
+    if query['from'] > query['to'] or (query['to'] - query['from']).days > export.EXPORT_MAX_DAYS:
+        raise ValidationError('Invalid export parameters')
+
+    limited = ratelimit.check(EXPORT_RATE, f"card:{query['card_id']}" if query['card_id'] is not None else f"user:{query['user_id']}")
+    if limited:
+        return limited
+
+    try:
+        with db.read_connection(token) as conn, conn.cursor() as cur:
+            card_ids = export.card_ids_for(cur, query['card_id'], query['user_id'])
+            if not card_ids:
+                return error(404, 'Card not found')
+            data = export.export_gzip(cur, card_ids, query['from'], query['to'], query['format'])
+    except export.ExportTooLarge:
+        return error(413, 'Export is too large, narrow the period or use the export CLI')
+
+    response = respond(200, headers={
+        'Content-Type': export.CONTENT_TYPES[query['format']],
+        'Content-Encoding': 'gzip',
+        'Content-Disposition': f'attachment; filename="transactions.{query["format"]}"'
+    }, body=base64.b64encode(data).decode())
+    response['isBase64Encoded'] = True
+    return response
+
+
+def get_analytics(params: Dict[str, Any], token: Optional[str]) -> Dict[str, Any]:
+    query = validate(params, ANALYTICS_SCHEMA, 'Invalid analytics parameters')
+    if (query['card_id'] is None) == (query['user_id'] is None):
+        raise ValidationError('Exactly one of card_id or user_id is required')
+    if query['from'] > query['to']:
+        raise ValidationError('Invalid analytics parameters')
+
+    limited = ratelimit.check(HISTORY_RATE, f"card:{query['card_id']}" if query['card_id'] is not None else f"user:{query['user_id']}")
+    if limited:
+        return limited
+
+    with db.read_connection(token) as conn, conn.cursor() as cur:
+        card_ids = export.card_ids_for(cur, query['card_id'], query['user_id'])
+        if not card_ids:
+            return error(404, 'Card not found')
+        breakdown = analytics.fetch_breakdown(cur, card_ids, query['from'], query['to'])
+
+    return respond(200, {'analytics': breakdown})
+
+
+def get_recipients(params: Dict[str, Any], token: Optional[str]) -> Dict[str, Any]:
+    query = validate(params, RECIPIENTS_SCHEMA)
+    values = [value.strip() for value in query['identifiers'].split(',') if value.strip()]
+    if not values or len(values) > recipients.PREVIEW_MAX_IDENTIFIERS:
+        raise ValidationError(f'identifiers must list 1 to {recipients.PREVIEW_MAX_IDENTIFIERS} values')
+    identifiers = [(query['identifier_type'] or recipients.detect_type(value), value) for value in values]
+
+    with db.read_connection(token) as conn, conn.cursor() as cur:
+        previews = recipients.preview(cur, identifiers)
+
+    return respond(200, {'recipients': previews})
+
+
+def get_transactions(request: Request) -> Dict[str, Any]:
+    view = validate(request.params, VIEW_SCHEMA)['view']
+    token = request.headers.get('x-consistency-token')
+
+    if view == 'recipients':
+        return get_recipients(request.params, token)
+
+    if view == 'export':
+        return get_export(request.params, token)
+
+    if view == 'analytics':
+        return get_analytics(request.params, token)
+
+    query = validate(request.params, CARD_QUERY_SCHEMA)
+
+    limited = ratelimit.check(HISTORY_RATE, query['card_id'])
+    if limited:
+        return limited
+
+    if view == 'statement':
+        return get_statement(query['card_id'], request.params, token)
+
+    page = validate(request.params, HISTORY_SCHEMA, 'Invalid limit or cursor')
+    try:
+        after = decode_cursor(page['cursor']) if page['cursor'] else None
+    except InvalidCursor:
+        raise ValidationError('Invalid limit or cursor')
+
+    with db.read_connection(token) as conn, conn.cursor() as cur:
+        transactions, next_cursor = fetch_history(cur, query['card_id'], page['limit'], after)
+
+    return respond(200, {'transactions': transactions, 'next_cursor': next_cursor})
+
+
+def create_batch_transfer(request: Request, idempotency_key: Any) -> Dict[str, Any]:
+    data = validate(request.body, BATCH_SCHEMA, 'Invalid batch transfer data')
+    if not data['transfers'] or len(data['transfers']) > BATCH_MAX_ITEMS:
+        raise ValidationError('Invalid batch transfer data')
+
+    limited = ratelimit.check(BATCH_RATE, data['from_card_id'])
+    if limited:
+        return limited
+
+    with db.connection() as conn, conn.cursor() as cur:
+        early_response = idempotency.begin(conn, cur, idempotency_key, 'transactions:POST', request.event)
+        if early_response:
+            return early_response
+
+        batch_status, results, user_ids = execute_batch_transfer(cur, data['from_card_id'], data['transfers'], data['mode'])
+
+        if batch_status != OK:
+            conn.rollback()
+            status_code, message = TRANSFER_ERRORS[batch_status]
+            return error(status_code, message, results=results)
+
+        applied = sum(1 for r in results if r['status'] == OK)
+        response_body = dumps({'message': 'Batch processed', 'applied': applied, 'failed': len(results) - applied, 'results': results})
+        idempotency.record(cur, idempotency_key, 'transactions:POST', 200, response_body)
+
+        cache.invalidate_users(cur, user_ids)
         conn.commit()
-        
-        cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'body': json.dumps({'message': 'Transfer successful', 'transaction_id': transaction_id})
-        }
-    
-    cur.close()
-    conn.close()
-    
-    return {
-        'statusCode': 405,
-        'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-        'body': json.dumps({'error': 'Method not allowed'})
-    }
+        idempotency.maybe_purge_expired(conn)
+        headers = db.consistency_headers(conn)
+
+    return respond(200, headers=headers, body=response_body)
+
+
+def create_transfer(request: Request) -> Dict[str, Any]:
+    idempotency_key = idempotency.get_key(request.event)
+
+    if isinstance(request.body, dict) and 'transfers' in request.body:
+        return create_batch_transfer(request, idempotency_key)
+
+    data = validate(request.body, TRANSFER_SCHEMA, 'Invalid transfer data')
+
+    limited = ratelimit.check(TRANSFER_RATE, data['from_card_id'])
+    if limited:
+        return limited
+
+    with db.connection() as conn, conn.cursor() as cur:
+        early_response = idempotency.begin(conn, cur, idempotency_key, 'transactions:POST', request.event)
+        if early_response:
+            return early_response
+
+        result = execute_transfer(cur, data['from_card_id'], data['to_identifier'], data['identifier_type'], data['amount'])
+
+        if result.status != OK:
+            conn.rollback()
+            status_code, message = TRANSFER_ERRORS[result.status]
+            if result.rule:
+                return error(status_code, message, rule=result.rule)
+            return error(status_code, message)
+
+        response_body = dumps({'message': 'Transfer successful', 'transaction_id': result.transaction_id})
+        idempotency.record(cur, idempotency_key, 'transactions:POST', 200, response_body)
+
+        cache.invalidate_users(cur, result.user_ids)
+        conn.commit()
+        idempotency.maybe_purge_expired(conn)
+        headers = db.consistency_headers(conn)
+
+    return respond(200, headers=headers, body=response_body)
+
+
+ROUTES = {
+    'GET': get_transactions,
+    'POST': create_transfer
+}
+
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return dispatch(event, context, ROUTES, allow_headers='Content-Type, Idempotency-Key, X-Consistency-Token')
+
+
+db.prewarm()
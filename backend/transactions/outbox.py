@@ -0,0 +1,233 @@
+'''
+Business: Outbox побочных эффектов денежных операций - событие пишется в той же транзакции, что и проводка,
+          а уведомления, аналитика и кэшбэк выполняются отдельным воркером с доставкой "хотя бы один раз"
+Args: cur - курсор открытой транзакции; OUTBOX_BATCH_SIZE, OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_BASE_SECONDS,
+      OUTBOX_RETENTION_HOURS - настройки воркера из окружения
+Returns: enqueue()/enqueue_many() для обработчиков, consumer() для регистрации потребителей,
+         drain_batch()/run() и CLI (python outbox.py work|purge|stats) для воркера
+'''
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+TRANSFER_COMPLETED = 'transfer.completed'
+CREDIT_APPROVED = 'credit.approved'
+CREDIT_REPAID = 'credit.repaid'
+
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '100'))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '10'))
+OUTBOX_RETRY_BASE_SECONDS = float(os.environ.get('OUTBOX_RETRY_BASE_SECONDS', '5'))
+OUTBOX_RETRY_MAX_SECONDS = float(os.environ.get('OUTBOX_RETRY_MAX_SECONDS', '3600'))
+OUTBOX_RETENTION_HOURS = int(os.environ.get('OUTBOX_RETENTION_HOURS', '168'))
+PURGE_BATCH_SIZE = 5000
+
+CLAIM_SQL = """
+SELECT id, event_type, aggregate_id, payload, attempts, created_at
+FROM outbox_events
+WHERE processed_at IS NULL AND failed_at IS NULL AND available_at <= CURRENT_TIMESTAMP
+ORDER BY available_at, id
+LIMIT %s
+FOR UPDATE SKIP LOCKED
+"""
+
+RETRY_SQL = """
+UPDATE outbox_events o
+SET attempts = o.attempts + 1,
+    last_error = v.error,
+    available_at = CURRENT_TIMESTAMP + LEAST(power(2, o.attempts) * %(base)s, %(max)s) * INTERVAL '1 second',
+    failed_at = CASE WHEN o.attempts + 1 >= %(max_attempts)s THEN CURRENT_TIMESTAMP END
+FROM (VALUES %%s) AS v(id, error)
+WHERE o.id = v.id
+"""
+
+PURGE_SQL = """
+DELETE FROM outbox_events
+WHERE ctid IN (
+    SELECT ctid FROM outbox_events
+    WHERE processed_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 hour'
+    LIMIT %s
+)
+"""
+
+STATS_SQL = """
+SELECT count(*) FILTER (WHERE processed_at IS NULL AND failed_at IS NULL),
+       count(*) FILTER (WHERE failed_at IS NOT NULL),
+       EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - min(created_at) FILTER (WHERE processed_at IS NULL AND failed_at IS NULL))
+FROM outbox_events
+"""
+
+Consumer = Callable[[Any, Dict[str, Any]], None]
+CONSUMERS: Dict[str, List[Consumer]] = {}
+
+
+def _json(payload: Dict[str, Any]) -> str:
+    return json.dumps(payload, default=str)
+
+
+def enqueue(cur: Any, event_type: str, aggregate_id: Optional[int], payload: Dict[str, Any]) -> None:
+    cur.execute(
+        "INSERT INTO outbox_events (event_type, aggregate_id, payload) VALUES (%s, %s, %s)",
+        (event_type, aggregate_id, _json(payload))
+    )
+
+
+def enqueue_many(cur: Any, events: Iterable[Tuple[str, Optional[int], Dict[str, Any]]]) -> None:
+    from psycopg2.extras import execute_values
+
+    rows = [(event_type, aggregate_id, _json(payload)) for event_type, aggregate_id, payload in events]
+    if rows:
+        execute_values(cur, "INSERT INTO outbox_events (event_type, aggregate_id, payload) VALUES %s", rows, page_size=len(rows))
+
+
+def consumer(*event_types: str) -> Callable[[Consumer], Consumer]:
+    def register(fn: Consumer) -> Consumer:
+        for event_type in event_types:
+            CONSUMERS.setdefault(event_type, []).append(fn)
+        return fn
+    return register
+
+
+@consumer(TRANSFER_COMPLETED, CREDIT_APPROVED, CREDIT_REPAID)
+def log_event(cur: Any, event: Dict[str, Any]) -> None:
+    sys.stdout.write(json.dumps({'type': 'outbox_event', **event}, default=str) + '\n')
+
+
+def deliver(cur: Any, event: Dict[str, Any]) -> None:
+    for fn in CONSUMERS.get(event['event_type'], []) + CONSUMERS.get('*', []):
+        fn(cur, event)
+
+
+def drain_batch(conn: Any, batch_size: int = OUTBOX_BATCH_SIZE) -> Tuple[int, int]:
+    from psycopg2.extras import execute_values
+
+    with conn.cursor() as cur:
+        cur.execute(CLAIM_SQL, (batch_size,))
+        rows = cur.fetchall()
+        if not rows:
+            conn.rollback()
+            return 0, 0
+
+        delivered: List[int] = []
+        failed: List[Tuple[int, str]] = []
+        for event_id, event_type, aggregate_id, payload, attempts, created_at in rows:
+            event = {
+                'id': event_id,
+                'event_type': event_type,
+                'aggregate_id': aggregate_id,
+                'payload': payload,
+                'attempt': attempts + 1,
+                'created_at': created_at
+            }
+            cur.execute('SAVEPOINT outbox_event')
+            try:
+                deliver(cur, event)
+            except Exception as e:
+                cur.execute('ROLLBACK TO SAVEPOINT outbox_event')
+                failed.append((event_id, f'{type(e).__name__}: {e}'[:1000]))
+            else:
+                cur.execute('RELEASE SAVEPOINT outbox_event')
+                delivered.append(event_id)
+
+        if delivered:
+            cur.execute("UPDATE outbox_events SET processed_at = CURRENT_TIMESTAMP WHERE id = ANY(%s)", (delivered,))
+        if failed:
+            execute_values(
+                cur,
+                RETRY_SQL % {'base': OUTBOX_RETRY_BASE_SECONDS, 'max': OUTBOX_RETRY_MAX_SECONDS, 'max_attempts': OUTBOX_MAX_ATTEMPTS},
+                failed,
+                template='(%s::bigint, %s)',
+                page_size=len(failed)
+            )
+        conn.commit()
+    return len(delivered), len(failed)
+
+
+def purge(conn: Any, retention_hours: int = OUTBOX_RETENTION_HOURS) -> int:
+    purged = 0
+    with conn.cursor() as cur:
+        while True:
+            cur.execute(PURGE_SQL, (retention_hours, PURGE_BATCH_SIZE))
+            deleted = cur.rowcount
+            conn.commit()
+            purged += deleted
+            if deleted < PURGE_BATCH_SIZE:
+                return purged
+
+
+def stats(conn: Any) -> Dict[str, Any]:
+    with conn.cursor() as cur:
+        cur.execute(STATS_SQL)
+        pending, failed, oldest = cur.fetchone()
+    conn.rollback()
+    return {'pending': pending, 'failed': failed, 'oldest_pending_seconds': float(oldest) if oldest is not None else None}
+
+
+def run(dsn: str, consumers: int = 4, batch_size: int = OUTBOX_BATCH_SIZE, poll_interval: float = 1.0,
+        once: bool = False, stop: Optional[threading.Event] = None) -> Dict[str, int]:
+    import psycopg2
+
+    stop = stop or threading.Event()
+    totals = {'delivered': 0, 'failed': 0}
+    lock = threading.Lock()
+
+    def consume() -> None:
+        conn = psycopg2.connect(dsn)
+        try:
+            while not stop.is_set():
+                delivered, failed = drain_batch(conn, batch_size)
+                with lock:
+                    totals['delivered'] += delivered
+                    totals['failed'] += failed
+                if not delivered and not failed:
+                    if once:
+                        return
+                    stop.wait(poll_interval)
+        finally:
+            conn.close()
+
+    with ThreadPoolExecutor(max_workers=consumers) as pool:
+        futures = [pool.submit(consume) for _ in range(consumers)]
+        try:
+            for future in futures:
+                future.result()
+        except KeyboardInterrupt:
+            stop.set()
+    return totals
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import psycopg2
+
+    parser = argparse.ArgumentParser(description='Deliver outbox events to side-effect consumers')
+    parser.add_argument('command', choices=['work', 'purge', 'stats'])
+    parser.add_argument('--consumers', type=int, default=4, help='parallel consumers, each with its own connection')
+    parser.add_argument('--batch-size', type=int, default=OUTBOX_BATCH_SIZE)
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    parser.add_argument('--once', action='store_true', help='exit when the outbox is drained')
+    args = parser.parse_args(argv)
+
+    dsn = os.environ['DATABASE_URL']
+    if args.command == 'work':
+        started = time.monotonic()
+        totals = run(dsn, args.consumers, args.batch_size, args.poll_interval, args.once)
+        print(json.dumps({**totals, 'elapsed_s': round(time.monotonic() - started, 2)}))
+        return 0
+
+    conn = psycopg2.connect(dsn)
+    try:
+        if args.command == 'purge':
+            print(json.dumps({'purged': purge(conn)}))
+        else:
+            print(json.dumps(stats(conn)))
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
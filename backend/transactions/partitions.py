@@ -0,0 +1,319 @@
+'''
+Business: Помесячные партиции transactions по created_at - создание будущих партиций, онлайн-перенос
+          старой таблицы пачками, архивирование холодных партиций в gzip CSV, выгрузка из архива только из CLI
+          и вычистка из архивов операций удалённых аккаунтов (очередь archive_redactions)
+Args: ARCHIVE_DIR - каталог архива на хосте CLI; CLI: python partitions.py maintain|migrate|cutover|archive|export|redact
+      с DATABASE_URL
+Returns: ensure_partitions(), migrate_batches(), archive_partitions(), export_archived(), redact_archives()
+'''
+import argparse
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', '/var/lib/bank/archive')
+PARTITIONS_AHEAD = 3
+ARCHIVE_COLUMNS = ('id', 'from_card_id', 'to_card_id', 'amount', 'transaction_type', 'description', 'created_at', 'accrued_on')
+
+PARTITION_NAME = re.compile(r'^transactions_p(\d{4})(\d{2})$')
+
+BACKFILL_SQL = """
+INSERT INTO transactions_partitioned (id, from_card_id, to_card_id, amount, transaction_type, description, created_at, accrued_on)
+SELECT id, from_card_id, to_card_id, amount, transaction_type, description, COALESCE(created_at, TIMESTAMP '1970-01-01'), accrued_on
+FROM transactions
+WHERE id > %(last_id)s AND id <= %(upper_id)s
+ON CONFLICT DO NOTHING
+"""
+
+PARTITIONS_SQL = """
+SELECT c.relname
+FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid
+WHERE i.inhparent = transactions_parent()::regclass
+ORDER BY c.relname
+"""
+
+ARCHIVES_SQL = """
+SELECT partition_name, path, row_count, sha256
+FROM transaction_archives
+WHERE range_end > %(date_from)s AND range_start < %(date_to)s
+ORDER BY range_start
+"""
+
+PENDING_REDACTIONS_SQL = "SELECT card_id FROM archive_redactions WHERE redacted_at IS NULL ORDER BY card_id FOR UPDATE"
+
+
+class ArchiveUnavailable(LookupError):
+    pass
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def ensure_partitions(conn: Any, first: date, last: date) -> List[str]:
+    created = []
+    month = month_start(first)
+    with conn.cursor() as cur:
+        while month <= last:
+            cur.execute("SELECT ensure_transaction_partition(%s)", (month,))
+            created.append(cur.fetchone()[0])
+            conn.commit()
+            month = add_months(month, 1)
+    return created
+
+
+def maintain(conn: Any, ahead: int = PARTITIONS_AHEAD) -> List[str]:
+    today = date.today()
+    return ensure_partitions(conn, today, add_months(today, ahead))
+
+
+def migration_state(cur: Any) -> Optional[Tuple[int, int, Optional[datetime]]]:
+    cur.execute("SELECT last_id, target_id, completed_at FROM transactions_migration")
+    return cur.fetchone()
+
+
+def migrate_batches(conn: Any, batch_size: int = 10000, pause: float = 0.0) -> Dict[str, Any]:
+    with conn.cursor() as cur:
+        state = migration_state(cur)
+        if state is None or state[2] is not None:
+            conn.rollback()
+            return {'status': 'nothing to migrate'}
+        cur.execute("SELECT min(created_at)::date FROM transactions")
+        oldest = cur.fetchone()[0]
+        conn.commit()
+        if oldest:
+            ensure_partitions(conn, oldest, date.today())
+
+        last_id, target_id, _ = state
+        copied = 0
+        while last_id < target_id:
+            upper_id = min(last_id + batch_size, target_id)
+            cur.execute(BACKFILL_SQL, {'last_id': last_id, 'upper_id': upper_id})
+            copied += cur.rowcount
+            cur.execute("UPDATE transactions_migration SET last_id = %s", (upper_id,))
+            conn.commit()
+            last_id = upper_id
+            if pause:
+                time.sleep(pause)
+    return {'status': 'backfilled', 'copied': copied, 'last_id': last_id, 'target_id': target_id}
+
+
+def cutover(conn: Any) -> Dict[str, Any]:
+    with conn.cursor() as cur:
+        state = migration_state(cur)
+        if state is None or state[2] is not None:
+            conn.rollback()
+            return {'status': 'already partitioned'}
+        if state[0] < state[1]:
+            conn.rollback()
+            return {'status': 'backfill incomplete', 'last_id': state[0], 'target_id': state[1]}
+        cur.execute("SET LOCAL lock_timeout = '5s'")
+        cur.execute("SELECT cutover_transactions_partitioning()")
+        copied = cur.fetchone()[0]
+        conn.commit()
+    return {'status': 'cut over', 'copied_during_cutover': copied}
+
+
+def list_partitions(cur: Any) -> List[Tuple[str, date]]:
+    cur.execute(PARTITIONS_SQL)
+    partitions = []
+    for (name,) in cur.fetchall():
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return partitions
+
+
+def _count_archived_rows(path: str) -> Tuple[int, str]:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+        rows = sum(1 for _ in csv.reader(f)) - 1
+    return rows, digest.hexdigest()
+
+
+def archive_partition(conn: Any, name: str, start: date, archive_dir: str) -> Dict[str, Any]:
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f'{name}.csv.gz')
+    tmp_path = path + '.tmp'
+    with conn.cursor() as cur:
+        cur.execute(f'SELECT count(*) FROM "{name}"')
+        expected = cur.fetchone()[0]
+        with gzip.open(tmp_path, 'wb') as raw, io.TextIOWrapper(raw, encoding='utf-8', newline='') as out:
+            cur.copy_expert(
+                f'COPY (SELECT {", ".join(ARCHIVE_COLUMNS)} FROM "{name}" ORDER BY created_at, id) TO STDOUT WITH (FORMAT csv, HEADER)',
+                out
+            )
+        rows, sha256 = _count_archived_rows(tmp_path)
+        if rows != expected:
+            os.remove(tmp_path)
+            conn.rollback()
+            raise RuntimeError(f'{name}: archived {rows} rows, expected {expected}')
+        os.replace(tmp_path, path)
+
+        cur.execute("SET LOCAL lock_timeout = '5s'")
+        cur.execute(
+            "INSERT INTO transaction_archives (partition_name, range_start, range_end, path, row_count, sha256) VALUES (%s, %s, %s, %s, %s, %s)",
+            (name, start, add_months(start, 1), path, rows, sha256)
+        )
+        cur.execute(f'ALTER TABLE transactions DETACH PARTITION "{name}"')
+        cur.execute(f'DROP TABLE "{name}"')
+        conn.commit()
+    return {'partition': name, 'rows': rows, 'path': path}
+
+
+def archive_partitions(conn: Any, older_than_months: int, archive_dir: str = ARCHIVE_DIR) -> List[Dict[str, Any]]:
+    with conn.cursor() as cur:
+        cur.execute("SELECT transactions_parent()")
+        if cur.fetchone()[0] != 'transactions':
+            conn.rollback()
+            raise RuntimeError('transactions is not partitioned yet, run migrate and cutover first')
+        cutoff = add_months(month_start(date.today()), -older_than_months)
+        partitions = [(name, start) for name, start in list_partitions(cur) if add_months(start, 1) <= cutoff]
+        conn.rollback()
+    return [archive_partition(conn, name, start, archive_dir) for name, start in partitions]
+
+
+def _read_archive(path: str) -> Iterator[Dict[str, Any]]:
+    with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            yield {
+                'id': int(row['id']),
+                'from_card_id': int(row['from_card_id']) if row['from_card_id'] else None,
+                'to_card_id': int(row['to_card_id']) if row['to_card_id'] else None,
+                'amount': Decimal(row['amount']),
+                'type': row['transaction_type'],
+                'description': row['description'] or None,
+                'created_at': datetime.fromisoformat(row['created_at'])
+            }
+
+
+def _check_archives(archives: List[Tuple[Any, ...]]) -> None:
+    missing = [archive[0] for archive in archives if not os.path.isfile(archive[1])]
+    if missing:
+        raise ArchiveUnavailable(missing)
+
+
+def export_archived(cur: Any, card_id: Optional[int], date_from: date, date_to: date) -> Iterator[Dict[str, Any]]:
+    range_end = datetime.combine(date_to + timedelta(days=1), datetime.min.time())
+    range_start = datetime.combine(date_from, datetime.min.time())
+    cur.execute(ARCHIVES_SQL, {'date_from': range_start, 'date_to': range_end})
+    archives = cur.fetchall()
+    _check_archives(archives)
+    for _, path, _, _ in archives:
+        for row in _read_archive(path):
+            if not range_start <= row['created_at'] < range_end:
+                continue
+            if card_id is not None and card_id not in (row['from_card_id'], row['to_card_id']):
+                continue
+            yield row
+
+
+def _redact_archive(path: str, card_ids: Set[str]) -> Tuple[int, int]:
+    tmp_path = path + '.tmp'
+    purged = anonymized = 0
+    with gzip.open(path, 'rt', encoding='utf-8', newline='') as src, \
+            gzip.open(tmp_path, 'wt', encoding='utf-8', newline='') as dst:
+        writer = csv.DictWriter(dst, fieldnames=ARCHIVE_COLUMNS, lineterminator='\n')
+        writer.writeheader()
+        for row in csv.DictReader(src):
+            owned = [side for side in ('from_card_id', 'to_card_id') if row[side] in card_ids]
+            if not owned:
+                writer.writerow(row)
+            elif all(row[side] in card_ids or not row[side] for side in ('from_card_id', 'to_card_id')):
+                purged += 1
+            else:
+                row.update({side: '' for side in owned})
+                writer.writerow(row)
+                anonymized += 1
+    if purged or anonymized:
+        os.replace(tmp_path, path)
+    else:
+        os.remove(tmp_path)
+    return purged, anonymized
+
+
+def redact_archives(conn: Any) -> Dict[str, Any]:
+    with conn.cursor() as cur:
+        cur.execute(PENDING_REDACTIONS_SQL)
+        card_ids = [card_id for (card_id,) in cur.fetchall()]
+        if not card_ids:
+            conn.rollback()
+            return {'cards': 0, 'purged': 0, 'anonymized': 0}
+        cur.execute("SELECT partition_name, path FROM transaction_archives ORDER BY range_start FOR UPDATE")
+        archives = cur.fetchall()
+        _check_archives(archives)
+
+        pending = {str(card_id) for card_id in card_ids}
+        totals = {'cards': len(card_ids), 'purged': 0, 'anonymized': 0}
+        for name, path in archives:
+            purged, anonymized = _redact_archive(path, pending)
+            if purged or anonymized:
+                rows, sha256 = _count_archived_rows(path)
+                cur.execute("UPDATE transaction_archives SET row_count = %s, sha256 = %s WHERE partition_name = %s", (rows, sha256, name))
+            totals['purged'] += purged
+            totals['anonymized'] += anonymized
+        cur.execute("UPDATE archive_redactions SET redacted_at = CURRENT_TIMESTAMP WHERE card_id = ANY(%s)", (card_ids,))
+        conn.commit()
+    return totals
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import psycopg2
+
+    parser = argparse.ArgumentParser(description='Maintain, migrate, archive and export transaction partitions')
+    parser.add_argument('command', choices=['maintain', 'migrate', 'cutover', 'archive', 'export', 'redact'])
+    parser.add_argument('--ahead', type=int, default=PARTITIONS_AHEAD, help='months of future partitions to keep')
+    parser.add_argument('--batch-size', type=int, default=10000, help='rows per backfill batch')
+    parser.add_argument('--pause', type=float, default=0.0, help='seconds to sleep between backfill batches')
+    parser.add_argument('--older-than-months', type=int, default=24, help='archive partitions that ended this many months ago')
+    parser.add_argument('--archive-dir', default=ARCHIVE_DIR)
+    parser.add_argument('--card-id', type=int)
+    parser.add_argument('--from', dest='date_from', type=date.fromisoformat)
+    parser.add_argument('--to', dest='date_to', type=date.fromisoformat)
+    args = parser.parse_args(argv)
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        if args.command == 'maintain':
+            print(json.dumps({'partitions': maintain(conn, args.ahead)}))
+        elif args.command == 'migrate':
+            print(json.dumps(migrate_batches(conn, args.batch_size, args.pause)))
+        elif args.command == 'cutover':
+            result = cutover(conn)
+            print(json.dumps(result))
+            return 0 if result['status'] != 'backfill incomplete' else 1
+        elif args.command == 'archive':
+            print(json.dumps({'archived': archive_partitions(conn, args.older_than_months, args.archive_dir)}))
+        elif args.command == 'redact':
+            print(json.dumps(redact_archives(conn)))
+        else:
+            if not args.date_from or not args.date_to:
+                parser.error('export requires --from and --to')
+            with conn.cursor() as cur:
+                for row in export_archived(cur, args.card_id, args.date_from, args.date_to):
+                    sys.stdout.write(json.dumps(row, default=str) + '\n')
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
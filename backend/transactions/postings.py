@@ -0,0 +1,167 @@
+'''
+Business: Двойная запись - каждая операция пишет проводки (ноги) с суммой ноль по счетам карт и банка,
+          сверка пересчитывает баланс и долг каждой карты из проводок параллельно по диапазонам id
+Args: cur - курсор открытой транзакции; CLI: python postings.py reconcile [--workers N] [--batch-size N] с DATABASE_URL
+Returns: record_postings() для пакетной записи ног, reconcile() - расхождения баланса, несбалансированные операции
+'''
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from snapshots import card_id_batches
+
+CARD = 'card'
+CREDIT = 'credit'
+REPAYMENTS = 'repayments'
+INTEREST_INCOME = 'interest_income'
+OPENING_EQUITY = 'opening_equity'
+CLOSED = 'closed'
+
+RECONCILE_BATCH_SIZE = 20000
+DRIFT_REPORT_LIMIT = 100
+
+INSERT_SQL = "INSERT INTO postings (transaction_id, entry_type, account, card_id, amount) VALUES %s"
+
+CARD_DRIFT_SQL = """
+WITH derived AS (
+    SELECT card_id,
+           COALESCE(SUM(amount) FILTER (WHERE account = 'card'), 0) AS balance,
+           -COALESCE(SUM(amount) FILTER (WHERE account = 'credit'), 0) AS credit_used
+    FROM postings
+    WHERE card_id BETWEEN %(first_id)s AND %(last_id)s
+    GROUP BY card_id
+),
+stored AS (
+    SELECT id, COALESCE(balance, 0) AS balance, COALESCE(credit_used, 0) AS credit_used
+    FROM cards
+    WHERE id BETWEEN %(first_id)s AND %(last_id)s
+)
+SELECT COALESCE(s.id, d.card_id), s.balance, COALESCE(d.balance, 0), s.credit_used, COALESCE(d.credit_used, 0)
+FROM stored s
+FULL JOIN derived d ON d.card_id = s.id
+WHERE s.id IS NULL
+   OR s.balance <> COALESCE(d.balance, 0)
+   OR s.credit_used <> COALESCE(d.credit_used, 0)
+"""
+
+UNBALANCED_SQL = """
+SELECT transaction_id, SUM(amount)
+FROM postings
+WHERE transaction_id BETWEEN %(first_id)s AND %(last_id)s
+GROUP BY transaction_id
+HAVING SUM(amount) <> 0
+"""
+
+TRANSACTION_RANGE_SQL = "SELECT COALESCE(MIN(transaction_id), 0), COALESCE(MAX(transaction_id), -1) FROM postings"
+UNATTRIBUTED_SQL = "SELECT COALESCE(SUM(amount), 0) FROM postings WHERE transaction_id IS NULL"
+
+
+def record_postings(cur: Any, legs: Iterable[Tuple[Optional[int], str, str, Optional[int], Decimal]]) -> None:
+    from psycopg2.extras import execute_values
+
+    legs = list(legs)
+    if legs:
+        execute_values(cur, INSERT_SQL, legs, page_size=len(legs))
+
+
+def transfer_legs(transaction_id: int, from_card_id: int, to_card_id: int, amount: Decimal,
+                  entry_type: str = 'transfer') -> List[Tuple[int, str, str, int, Decimal]]:
+    return [
+        (transaction_id, entry_type, CARD, from_card_id, -amount),
+        (transaction_id, entry_type, CARD, to_card_id, amount)
+    ]
+
+
+def id_batches(first_id: int, last_id: int, batch_size: int) -> List[Tuple[int, int]]:
+    return [(lo, min(lo + batch_size - 1, last_id)) for lo in range(first_id, last_id + 1, batch_size)]
+
+
+def reconcile(dsn: str, workers: int = 4, batch_size: int = RECONCILE_BATCH_SIZE) -> Dict[str, Any]:
+    import psycopg2
+
+    started = time.monotonic()
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            card_ranges = card_id_batches(cur, batch_size)
+            cur.execute("SELECT count(*) FROM cards")
+            cards_checked = cur.fetchone()[0]
+            cur.execute(TRANSACTION_RANGE_SQL)
+            transaction_ranges = id_batches(*cur.fetchone(), batch_size * 10)
+            cur.execute(UNATTRIBUTED_SQL)
+            unattributed = cur.fetchone()[0]
+        conn.rollback()
+    finally:
+        conn.close()
+
+    local = threading.local()
+    connections: List[Any] = []
+    lock = threading.Lock()
+
+    def scan(sql: str, bounds: Tuple[int, int]) -> List[Tuple[Any, ...]]:
+        worker_conn = getattr(local, 'conn', None)
+        if worker_conn is None:
+            worker_conn = local.conn = psycopg2.connect(dsn)
+            worker_conn.set_session(readonly=True)
+            with lock:
+                connections.append(worker_conn)
+        with worker_conn.cursor() as cur:
+            cur.execute(sql, {'first_id': bounds[0], 'last_id': bounds[1]})
+            rows = cur.fetchall()
+        worker_conn.rollback()
+        return rows
+
+    drift: List[Dict[str, Any]] = []
+    drift_count = 0
+    unbalanced: List[Dict[str, Any]] = []
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for rows in pool.map(lambda bounds: scan(CARD_DRIFT_SQL, bounds), card_ranges):
+                for card_id, balance, derived_balance, credit_used, derived_credit in rows:
+                    drift_count += 1
+                    if len(drift) < DRIFT_REPORT_LIMIT:
+                        drift.append({
+                            'card_id': card_id,
+                            'balance': str(balance) if balance is not None else None,
+                            'derived_balance': str(derived_balance),
+                            'credit_used': str(credit_used) if credit_used is not None else None,
+                            'derived_credit_used': str(derived_credit)
+                        })
+            for rows in pool.map(lambda bounds: scan(UNBALANCED_SQL, bounds), transaction_ranges):
+                unbalanced.extend({'transaction_id': tx_id, 'imbalance': str(total)} for tx_id, total in rows)
+    finally:
+        for worker_conn in connections:
+            worker_conn.close()
+
+    return {
+        'cards_checked': cards_checked,
+        'drift_count': drift_count,
+        'drift': drift,
+        'unbalanced_transactions': unbalanced[:DRIFT_REPORT_LIMIT],
+        'unbalanced_count': len(unbalanced),
+        'unattributed_imbalance': str(unattributed),
+        'elapsed_s': round(time.monotonic() - started, 2)
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Reconcile card balances against double-entry postings')
+    parser.add_argument('command', choices=['reconcile'])
+    parser.add_argument('--workers', type=int, default=4, help='parallel scanners, each with its own connection')
+    parser.add_argument('--batch-size', type=int, default=RECONCILE_BATCH_SIZE, help='cards per chunk')
+    args = parser.parse_args(argv)
+
+    report = reconcile(os.environ['DATABASE_URL'], args.workers, args.batch_size)
+    print(json.dumps(report))
+    clean = not report['drift_count'] and not report['unbalanced_count'] and Decimal(report['unattributed_imbalance']) == 0
+    return 0 if clean else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
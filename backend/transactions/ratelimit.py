@@ -0,0 +1,143 @@
+'''
+Business: Ограничение частоты запросов - token bucket по user_id или card_id с отдельным бюджетом на каждый эндпоинт,
+          отказ 429 с Retry-After до любого тяжёлого запроса к БД
+Args: RATE_LIMIT_ENABLED, RATE_LIMIT_BACKEND (local|postgres), RATE_LIMIT_MAX_KEYS;
+      RATE_LIMIT_<ИМЯ> = "rate:burst" - переопределение бюджета эндпоинта (токенов в секунду и ёмкость)
+Returns: limit() для объявления бюджета, check() - None или готовый ответ 429, set_backend() для общего хранилища
+'''
+import math
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+from api import respond
+
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') != '0'
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'local')
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', '10000'))
+PURGE_PROBABILITY = 0.001
+PURGE_BATCH_SIZE = 500
+
+ACQUIRE_SQL = """
+INSERT INTO rate_limit_buckets AS b (key, tokens, updated_at)
+VALUES (%(key)s, %(burst)s - %(cost)s, clock_timestamp())
+ON CONFLICT (key) DO UPDATE
+SET tokens = LEAST(%(burst)s, b.tokens + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at) * %(rate)s) - %(cost)s,
+    updated_at = clock_timestamp()
+WHERE LEAST(%(burst)s, b.tokens + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at) * %(rate)s) >= %(cost)s
+RETURNING tokens
+"""
+
+PURGE_SQL = """
+DELETE FROM rate_limit_buckets
+WHERE ctid IN (
+    SELECT ctid FROM rate_limit_buckets
+    WHERE updated_at < clock_timestamp() - INTERVAL '1 hour'
+    LIMIT %s
+)
+"""
+
+AVAILABLE_SQL = """
+SELECT LEAST(%(burst)s, tokens + EXTRACT(EPOCH FROM clock_timestamp() - updated_at) * %(rate)s)
+FROM rate_limit_buckets WHERE key = %(key)s
+"""
+
+
+class Limit(NamedTuple):
+    name: str
+    rate: float
+    burst: float
+
+
+def limit(name: str, rate: float, burst: float) -> Limit:
+    override = os.environ.get(f'RATE_LIMIT_{name.upper()}')
+    if override:
+        rate_text, _, burst_text = override.partition(':')
+        rate, burst = float(rate_text), float(burst_text or rate_text)
+    return Limit(name, rate, burst)
+
+
+class RateLimitBackend(ABC):
+    @abstractmethod
+    def acquire(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        ...
+
+
+class LocalBuckets(RateLimitBackend):
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS) -> None:
+        self.max_keys = max_keys
+        self._buckets: 'OrderedDict[str, Tuple[float, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._buckets.get(key)
+            if entry is None:
+                tokens = burst
+            else:
+                tokens = min(burst, entry[0] + (now - entry[1]) * rate)
+                self._buckets.move_to_end(key)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            return (cost - tokens) / rate
+
+
+class PostgresBuckets(RateLimitBackend):
+    def __init__(self, connection: Callable[[], Any]) -> None:
+        self.connection = connection
+
+    def acquire(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        params = {'key': key, 'rate': rate, 'burst': burst, 'cost': cost}
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute(ACQUIRE_SQL, params)
+            granted = cur.fetchone() is not None
+            if not granted:
+                cur.execute(AVAILABLE_SQL, params)
+                row = cur.fetchone()
+            elif random.random() < PURGE_PROBABILITY:
+                cur.execute(PURGE_SQL, (PURGE_BATCH_SIZE,))
+            conn.commit()
+        if granted:
+            return 0.0
+        available = float(row[0]) if row else 0.0
+        return max(cost - available, 0.0) / rate
+
+
+_backend: Optional[RateLimitBackend] = None
+
+
+def get_backend() -> RateLimitBackend:
+    global _backend
+    if _backend is None:
+        if RATE_LIMIT_BACKEND == 'postgres':
+            import db
+            _backend = PostgresBuckets(db.connection)
+        else:
+            _backend = LocalBuckets()
+    return _backend
+
+
+def set_backend(backend: RateLimitBackend) -> None:
+    global _backend
+    _backend = backend
+
+
+def check(budget: Limit, key: Any, cost: float = 1.0) -> Optional[Dict[str, Any]]:
+    if not RATE_LIMIT_ENABLED or key is None:
+        return None
+    retry_after = get_backend().acquire(f'{budget.name}:{key}', budget.rate, budget.burst, cost)
+    if not retry_after:
+        return None
+    return respond(429, {'error': 'Too many requests', 'retry_after': round(retry_after, 3)}, headers={
+        'Retry-After': str(max(1, math.ceil(retry_after))),
+        'Access-Control-Expose-Headers': 'Retry-After'
+    })
@@ -0,0 +1,105 @@
+'''
+Business: Справочник получателей - нормализованные телефон и номер карты, карта по умолчанию для входящих
+          переводов, пакетное разрешение идентификаторов одним запросом и предпросмотр получателя
+Args: cur - курсор psycopg2, identifiers - пары (тип, идентификатор)
+Returns: resolve() - dict (тип, идентификатор) -> Recipient, preview() - маскированные данные для подтверждения
+'''
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from api import record_type
+
+PREVIEW_MAX_IDENTIFIERS = 50
+
+CARD = 'card'
+PHONE = 'phone'
+
+_NON_DIGITS = re.compile(r'\D')
+
+RESOLVE_SQL = """
+SELECT 'card', c.pan_digits, c.id, u.name, c.card_number
+FROM cards c JOIN users u ON u.id = c.user_id
+WHERE c.pan_digits = ANY(%(pans)s) AND c.status IS DISTINCT FROM 'closed'
+UNION ALL
+SELECT 'phone', u.phone_normalized, c.id, u.name, c.card_number
+FROM (
+    SELECT DISTINCT ON (phone_normalized) phone_normalized, name, default_card_id
+    FROM users
+    WHERE phone_normalized = ANY(%(phones)s) AND default_card_id IS NOT NULL
+    ORDER BY phone_normalized, id
+) u
+JOIN cards c ON c.id = u.default_card_id
+"""
+
+BY_CARD_SQL = "SELECT id FROM cards WHERE pan_digits = %(to_identifier)s AND status IS DISTINCT FROM 'closed'"
+BY_PHONE_SQL = (
+    "SELECT default_card_id AS id FROM users "
+    "WHERE phone_normalized = %(to_identifier)s AND default_card_id IS NOT NULL ORDER BY id LIMIT 1"
+)
+
+Recipient = record_type('Recipient', ('card_id', 'name', 'card_number'))
+
+
+def normalize_phone(value: str) -> Optional[str]:
+    digits = _NON_DIGITS.sub('', value or '')
+    if len(digits) == 11 and digits[0] == '8':
+        digits = '7' + digits[1:]
+    elif len(digits) == 10:
+        digits = '7' + digits
+    return digits if 11 <= len(digits) <= 15 else None
+
+
+def normalize_pan(value: str) -> Optional[str]:
+    digits = _NON_DIGITS.sub('', value or '')
+    return digits if 13 <= len(digits) <= 19 else None
+
+
+def normalize(identifier_type: str, value: str) -> Optional[str]:
+    return normalize_phone(value) if identifier_type == PHONE else normalize_pan(value)
+
+
+def detect_type(value: str) -> str:
+    return CARD if len(_NON_DIGITS.sub('', value or '')) >= 16 else PHONE
+
+
+def resolve(cur: Any, identifiers: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], Recipient]:
+    resolved: Dict[Tuple[str, str], Recipient] = {}
+    wanted: Dict[Tuple[str, str], List[Tuple[str, str]]] = {}
+    for identifier_type, value in identifiers:
+        key = (identifier_type, normalize(identifier_type, value))
+        if key[1] is not None:
+            wanted.setdefault(key, []).append((identifier_type, value))
+
+    if wanted:
+        cur.execute(RESOLVE_SQL, {
+            'pans': [normalized for kind, normalized in wanted if kind == CARD],
+            'phones': [normalized for kind, normalized in wanted if kind == PHONE]
+        })
+        for kind, normalized, card_id, name, card_number in cur.fetchall():
+            recipient = Recipient(card_id, name, card_number)
+            for original in wanted.get((kind, normalized), []):
+                resolved[original] = recipient
+    return resolved
+
+
+def mask_name(name: str) -> str:
+    parts = (name or '').split()
+    if len(parts) < 2:
+        return parts[0] if parts else ''
+    return f'{parts[0]} {parts[1][0]}.'
+
+
+def mask_card(card_number: str) -> str:
+    return '**** ' + _NON_DIGITS.sub('', card_number)[-4:]
+
+
+def preview(cur: Any, identifiers: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+    resolved = resolve(cur, identifiers)
+    previews = []
+    for identifier_type, value in identifiers:
+        recipient = resolved.get((identifier_type, value))
+        entry: Dict[str, Any] = {'identifier': value, 'identifier_type': identifier_type, 'found': recipient is not None}
+        if recipient is not None:
+            entry.update({'name': mask_name(recipient.name), 'card': mask_card(recipient.card_number)})
+        previews.append(entry)
+    return previews
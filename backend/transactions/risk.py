@@ -0,0 +1,46 @@
+'''
+Business: Антифрод на пути перевода - статус карты, дневные лимиты детских карт и окна скорости (число и сумма
+          за последние N секунд) считаются в БД функцией check_transfer_rules() по счётчикам card_velocity,
+          которые обновляются при записи; пакетная выплата - одно решение по сумме и числу позиций с правилами
+          scope='batch' и своими окнами; правила лежат в таблице transfer_rules
+Args: VELOCITY_WINDOW_SECONDS - длина окна скорости; решения пишутся JSON-строкой в stdout или в set_sink()
+Returns: log_decision() - запись решения с правилом и задержкой оценки, RULE_DENIED/RECIPIENT_BLOCKED для обработчика
+'''
+import json
+import os
+import sys
+from decimal import Decimal
+from typing import Any, Callable, Dict, Optional
+
+import tracing
+
+VELOCITY_WINDOW_SECONDS = int(os.environ.get('VELOCITY_WINDOW_SECONDS', '600'))
+
+RULE_DENIED = 'rule_denied'
+RECIPIENT_BLOCKED = 'recipient_blocked'
+
+
+def _stdout_sink(record: Dict[str, Any]) -> None:
+    sys.stdout.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+
+
+_sink: Callable[[Dict[str, Any]], None] = _stdout_sink
+
+
+def set_sink(sink: Callable[[Dict[str, Any]], None]) -> None:
+    global _sink
+    _sink = sink
+
+
+def log_decision(card_id: int, amount: Decimal, rule: Optional[str], latency_ms: Optional[float], items: int = 1) -> None:
+    trace = tracing.current()
+    _sink({
+        'type': 'transfer_decision',
+        'request_id': trace.request_id if trace else None,
+        'card_id': card_id,
+        'amount': str(amount),
+        'items': items,
+        'decision': 'deny' if rule else 'allow',
+        'rule': rule,
+        'latency_ms': round(latency_ms, 3) if latency_ms is not None else None
+    })
@@ -0,0 +1,190 @@
+'''
+Business: Дневные снимки баланса карт (входящий/исходящий остаток, приход, расход) и выписки по ним
+Args: cur - курсор psycopg2; CLI: python snapshots.py rebuild|check [--batch-size N] с DATABASE_URL
+Returns: record_daily_balances() для записи в транзакции перевода, fetch_statement(), rebuild(), check()
+'''
+import argparse
+import json
+import os
+import sys
+from datetime import date
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+NON_BALANCE_TYPES = ['credit_repayment', 'credit_interest']
+MAX_STATEMENT_DAYS = 3660
+
+UPSERT_SQL = """
+INSERT INTO card_daily_balances (card_id, day, opening_balance, closing_balance, inflow, outflow)
+VALUES %s
+ON CONFLICT (card_id, day) DO UPDATE
+SET closing_balance = EXCLUDED.closing_balance,
+    inflow = card_daily_balances.inflow + EXCLUDED.inflow,
+    outflow = card_daily_balances.outflow + EXCLUDED.outflow
+"""
+
+UPSERT_TEMPLATE = "(%s, CURRENT_DATE, %s::numeric - %s::numeric, %s, GREATEST(%s::numeric, 0), GREATEST(-%s::numeric, 0))"
+
+REPLAY_SQL = """
+WITH legs AS (
+    SELECT from_card_id AS card_id, created_at::date AS day, 0::numeric AS inflow, amount AS outflow
+    FROM transactions
+    WHERE from_card_id BETWEEN %(first_id)s AND %(last_id)s AND transaction_type <> ALL(%(skip_types)s)
+    UNION ALL
+    SELECT to_card_id, created_at::date, amount, 0::numeric
+    FROM transactions
+    WHERE to_card_id BETWEEN %(first_id)s AND %(last_id)s AND transaction_type <> ALL(%(skip_types)s)
+),
+daily AS (
+    SELECT card_id, day, SUM(inflow) AS inflow, SUM(outflow) AS outflow
+    FROM legs
+    GROUP BY card_id, day
+),
+running AS (
+    SELECT card_id, day, inflow, outflow,
+           SUM(inflow - outflow) OVER (PARTITION BY card_id ORDER BY day) AS cumulative,
+           SUM(inflow - outflow) OVER (PARTITION BY card_id) AS total
+    FROM daily
+)
+SELECT r.card_id, r.day,
+       c.balance - r.total + r.cumulative - (r.inflow - r.outflow) AS opening_balance,
+       c.balance - r.total + r.cumulative AS closing_balance,
+       r.inflow, r.outflow
+FROM running r
+JOIN cards c ON c.id = r.card_id
+"""
+
+CHECK_SQL = """
+WITH replay AS ({replay}),
+stored AS (
+    SELECT card_id, day, opening_balance, closing_balance, inflow, outflow
+    FROM card_daily_balances
+    WHERE card_id BETWEEN %(first_id)s AND %(last_id)s
+)
+SELECT COALESCE(r.card_id, s.card_id), COALESCE(r.day, s.day),
+       r.opening_balance, s.opening_balance, r.closing_balance, s.closing_balance,
+       r.inflow, s.inflow, r.outflow, s.outflow
+FROM replay r
+FULL JOIN stored s ON s.card_id = r.card_id AND s.day = r.day
+WHERE r.card_id IS NULL OR s.card_id IS NULL
+   OR (r.opening_balance, r.closing_balance, r.inflow, r.outflow)
+      IS DISTINCT FROM (s.opening_balance, s.closing_balance, s.inflow, s.outflow)
+ORDER BY 1, 2
+"""
+
+STATEMENT_SQL = """
+(SELECT day, opening_balance, closing_balance, inflow, outflow
+ FROM card_daily_balances
+ WHERE card_id = %(card_id)s AND day < %(date_from)s
+ ORDER BY day DESC
+ LIMIT 1)
+UNION ALL
+(SELECT day, opening_balance, closing_balance, inflow, outflow
+ FROM card_daily_balances
+ WHERE card_id = %(card_id)s AND day BETWEEN %(date_from)s AND %(date_to)s
+ ORDER BY day)
+"""
+
+
+def record_daily_balances(cur: Any, movements: Iterable[Tuple[int, Decimal, Decimal]]) -> None:
+    from psycopg2.extras import execute_values
+
+    rows = [(card_id, balance, delta, balance, delta, delta) for card_id, delta, balance in sorted(movements)]
+    if rows:
+        execute_values(cur, UPSERT_SQL, rows, template=UPSERT_TEMPLATE, page_size=len(rows))
+
+
+def fetch_statement(cur: Any, card_id: int, date_from: date, date_to: date) -> Dict[str, Any]:
+    cur.execute(STATEMENT_SQL, {'card_id': card_id, 'date_from': date_from, 'date_to': date_to})
+    rows = sorted(cur.fetchall())
+    previous = rows[0] if rows and rows[0][0] < date_from else None
+    days = rows[1:] if previous else rows
+
+    if days:
+        opening = days[0][1]
+        closing = days[-1][2]
+    else:
+        opening = closing = previous[2] if previous else Decimal('0')
+
+    return {
+        'card_id': int(card_id),
+        'from': date_from.isoformat(),
+        'to': date_to.isoformat(),
+        'opening_balance': float(opening),
+        'closing_balance': float(closing),
+        'inflow': float(sum((d[3] for d in days), Decimal('0'))),
+        'outflow': float(sum((d[4] for d in days), Decimal('0'))),
+        'days': [
+            {
+                'day': d[0].isoformat(),
+                'opening_balance': float(d[1]),
+                'closing_balance': float(d[2]),
+                'inflow': float(d[3]),
+                'outflow': float(d[4])
+            }
+            for d in days
+        ]
+    }
+
+
+def card_id_batches(cur: Any, batch_size: int) -> List[Tuple[int, int]]:
+    cur.execute("SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), -1) FROM cards")
+    first_id, last_id = cur.fetchone()
+    return [(lo, min(lo + batch_size - 1, last_id)) for lo in range(first_id, last_id + 1, batch_size)]
+
+
+def rebuild(conn: Any, batch_size: int = 10000) -> int:
+    rebuilt = 0
+    with conn.cursor() as cur:
+        for first_id, last_id in card_id_batches(cur, batch_size):
+            params = {'first_id': first_id, 'last_id': last_id, 'skip_types': NON_BALANCE_TYPES}
+            cur.execute("SELECT id FROM cards WHERE id BETWEEN %(first_id)s AND %(last_id)s ORDER BY id FOR UPDATE", params)
+            cur.execute("DELETE FROM card_daily_balances WHERE card_id BETWEEN %(first_id)s AND %(last_id)s", params)
+            cur.execute(
+                "INSERT INTO card_daily_balances (card_id, day, opening_balance, closing_balance, inflow, outflow) " + REPLAY_SQL,
+                params
+            )
+            rebuilt += cur.rowcount
+            conn.commit()
+    return rebuilt
+
+
+def check(conn: Any, batch_size: int = 10000) -> List[Dict[str, Any]]:
+    drift = []
+    with conn.cursor() as cur:
+        for first_id, last_id in card_id_batches(cur, batch_size):
+            params = {'first_id': first_id, 'last_id': last_id, 'skip_types': NON_BALANCE_TYPES}
+            cur.execute(CHECK_SQL.format(replay=REPLAY_SQL), params)
+            for row in cur.fetchall():
+                drift.append({
+                    'card_id': row[0],
+                    'day': row[1].isoformat(),
+                    'expected': [str(v) if v is not None else None for v in (row[2], row[4], row[6], row[8])],
+                    'stored': [str(v) if v is not None else None for v in (row[3], row[5], row[7], row[9])]
+                })
+            conn.rollback()
+    return drift
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import psycopg2
+
+    parser = argparse.ArgumentParser(description='Rebuild or verify card_daily_balances from the ledger')
+    parser.add_argument('command', choices=['rebuild', 'check'])
+    parser.add_argument('--batch-size', type=int, default=10000, help='cards per chunk')
+    args = parser.parse_args(argv)
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        if args.command == 'rebuild':
+            print(json.dumps({'rebuilt_rows': rebuild(conn, args.batch_size)}))
+            return 0
+        drift = check(conn, args.batch_size)
+        print(json.dumps({'drift_rows': len(drift), 'drift': drift[:100]}))
+        return 1 if drift else 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
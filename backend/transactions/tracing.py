@@ -0,0 +1,171 @@
+'''
+Business: Трассировка вызова - время подключения, нормализованные запросы с длительностью и числом строк,
+          общее время обработчика с привязкой к context.request_id
+Args: TRACE_SAMPLE_RATE - доля вызовов с полной трассой; TRACE_SLOW_QUERY_MS, TRACE_SLOW_REQUEST_MS - пороги,
+      превышение которых пишется всегда; TRACE_MAX_QUERIES - сколько запросов хранить на вызов
+Returns: invocation() вокруг обработчика, cursor_factory() для psycopg2, record_connect(), set_sink() для своего приёмника
+'''
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0.01'))
+TRACE_SLOW_QUERY_MS = float(os.environ.get('TRACE_SLOW_QUERY_MS', '100'))
+TRACE_SLOW_REQUEST_MS = float(os.environ.get('TRACE_SLOW_REQUEST_MS', '500'))
+TRACE_MAX_QUERIES = int(os.environ.get('TRACE_MAX_QUERIES', '200'))
+MAX_STATEMENT_LENGTH = 1000
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_VALUES_LIST = re.compile(r'\((?:\s*\?\s*,?)+\)(?:\s*,\s*\((?:\s*\?\s*,?)+\))+')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_PLACEHOLDER = re.compile(r'%(?:\(\w+\))?s')
+_WHITESPACE = re.compile(r'\s+')
+
+
+class Trace:
+    __slots__ = ('request_id', 'route', 'method', 'sampled', 'started', 'connect_ms', 'connections_opened', 'queries', 'query_count')
+
+    def __init__(self, request_id: str, route: str, method: str, sampled: bool) -> None:
+        self.request_id = request_id
+        self.route = route
+        self.method = method
+        self.sampled = sampled
+        self.started = time.perf_counter()
+        self.connect_ms = 0.0
+        self.connections_opened = 0
+        self.queries: List[Tuple[Any, float, int]] = []
+        self.query_count = 0
+
+
+def _stdout_sink(record: Dict[str, Any]) -> None:
+    sys.stdout.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+
+
+_sink: Callable[[Dict[str, Any]], None] = _stdout_sink
+_local = threading.local()
+
+
+def set_sink(sink: Callable[[Dict[str, Any]], None]) -> None:
+    global _sink
+    _sink = sink
+
+
+def current() -> Optional[Trace]:
+    return getattr(_local, 'trace', None)
+
+
+def normalize(query: Any) -> str:
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    elif not isinstance(query, str):
+        query = str(query)
+    query = _STRING.sub('?', query)
+    query = _NUMBER.sub('?', query)
+    query = _PLACEHOLDER.sub('?', query).replace('%%', '%')
+    query = _VALUES_LIST.sub('(...)', query)
+    query = _IN_LIST.sub('(...)', query)
+    query = _WHITESPACE.sub(' ', query).strip()
+    return query[:MAX_STATEMENT_LENGTH]
+
+
+def record_query(query: Any, duration_ms: float, rows: int) -> None:
+    trace = current()
+    if trace is None:
+        return
+    trace.query_count += 1
+    if len(trace.queries) < TRACE_MAX_QUERIES or duration_ms >= TRACE_SLOW_QUERY_MS:
+        trace.queries.append((query, duration_ms, rows))
+
+
+def record_connect(duration_ms: float, opened: bool) -> None:
+    trace = current()
+    if trace is None:
+        return
+    trace.connect_ms += duration_ms
+    trace.connections_opened += opened
+
+
+_cursor_class: Optional[type] = None
+
+
+def cursor_factory() -> type:
+    global _cursor_class
+    if _cursor_class is None:
+        import psycopg2.extensions
+
+        class TracingCursor(psycopg2.extensions.cursor):
+            def execute(self, query: Any, vars: Any = None) -> Any:
+                if current() is None:
+                    return super().execute(query, vars)
+                started = time.perf_counter()
+                try:
+                    return super().execute(query, vars)
+                finally:
+                    record_query(query, (time.perf_counter() - started) * 1000, self.rowcount)
+
+            def executemany(self, query: Any, vars_list: Any) -> Any:
+                if current() is None:
+                    return super().executemany(query, vars_list)
+                started = time.perf_counter()
+                try:
+                    return super().executemany(query, vars_list)
+                finally:
+                    record_query(query, (time.perf_counter() - started) * 1000, self.rowcount)
+
+        _cursor_class = TracingCursor
+    return _cursor_class
+
+
+def emit(trace: Trace, outcome: Dict[str, Any], total_ms: float) -> None:
+    slow_queries = [q for q in trace.queries if q[1] >= TRACE_SLOW_QUERY_MS]
+    slow_request = total_ms >= TRACE_SLOW_REQUEST_MS
+    failed = 'error' in outcome or (outcome['status'] or 0) >= 500
+    if not (trace.sampled or slow_request or slow_queries or failed):
+        return
+    queries = trace.queries if trace.sampled or slow_request or failed else slow_queries
+    _sink({
+        'type': 'invocation',
+        'request_id': trace.request_id,
+        'route': trace.route,
+        'method': trace.method,
+        'status': outcome['status'],
+        'error': outcome.get('error'),
+        'total_ms': round(total_ms, 3),
+        'connect_ms': round(trace.connect_ms, 3),
+        'connections_opened': trace.connections_opened,
+        'query_count': trace.query_count,
+        'db_ms': round(sum(q[1] for q in trace.queries), 3),
+        'sampled': trace.sampled,
+        'slow': slow_request or bool(slow_queries),
+        'queries': [
+            {'sql': normalize(query), 'ms': round(duration_ms, 3), 'rows': rows}
+            for query, duration_ms, rows in queries
+        ]
+    })
+
+
+@contextmanager
+def invocation(context: Any, route: str, method: str) -> Iterator[Dict[str, Any]]:
+    request_id = getattr(context, 'request_id', None) or ''
+    trace = Trace(request_id, route, method, random.random() < TRACE_SAMPLE_RATE)
+    _local.trace = trace
+    outcome: Dict[str, Any] = {'status': None}
+    try:
+        yield outcome
+    except BaseException as e:
+        outcome['error'] = type(e).__name__
+        raise
+    finally:
+        _local.trace = None
+        total_ms = (time.perf_counter() - trace.started) * 1000
+        try:
+            emit(trace, outcome, total_ms)
+        except Exception as e:
+            sys.stderr.write(f'trace sink failed: {e}\n')
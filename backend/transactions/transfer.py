@@ -0,0 +1,278 @@
+'''
+Business: Атомарный перевод между картами за один запрос к БД (правила антифрода, операция, две ноги двойной
+          записи, снимок, помесячные итоги аналитики и событие outbox) и пакетные выплаты
+Args: cur - курсор psycopg2, from_card_id, to_identifier, identifier_type, amount (Decimal)
+      или список items и режим atomic/best_effort для пакета
+Returns: TransferResult для одиночного перевода, (статус, результаты по позициям, затронутые user_id) для пакета
+'''
+import time
+from decimal import Decimal
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import db
+import recipients
+import risk
+from analytics import record_transfer_rollups
+from outbox import TRANSFER_COMPLETED, enqueue_many
+from postings import record_postings, transfer_legs
+from snapshots import record_daily_balances
+
+OK = 'ok'
+SOURCE_NOT_FOUND = 'source_not_found'
+RECIPIENT_NOT_FOUND = 'recipient_not_found'
+SAME_CARD = 'same_card'
+INSUFFICIENT_FUNDS = 'insufficient_funds'
+
+TRANSFER_SQL = """
+WITH recipient AS ({recipient}),
+locked AS (
+    SELECT id, status FROM cards
+    WHERE id = %(from_card_id)s OR id = (SELECT id FROM recipient)
+    ORDER BY id
+    FOR UPDATE
+),
+verdict AS (
+    SELECT r.rule, extract(epoch FROM clock_timestamp() - s.started) * 1000 AS latency_ms
+    FROM (SELECT clock_timestamp() AS started OFFSET 0) s,
+    LATERAL (
+        SELECT CASE
+                   WHEN EXISTS (SELECT 1 FROM locked WHERE id <> %(from_card_id)s AND status IN ('blocked', 'closed'))
+                       THEN 'recipient_blocked'
+                   ELSE check_transfer_rules(%(from_card_id)s, %(amount)s, %(window_seconds)s)
+               END AS rule
+        WHERE s.started IS NOT NULL
+        OFFSET 0
+    ) r
+    WHERE (SELECT count(*) FROM locked) = 2
+),
+debit AS (
+    UPDATE cards SET balance = balance - %(amount)s
+    WHERE id = %(from_card_id)s
+      AND balance >= %(amount)s
+      AND EXISTS (SELECT 1 FROM verdict WHERE rule IS NULL)
+    RETURNING id, balance, user_id
+),
+credit AS (
+    UPDATE cards SET balance = cards.balance + %(amount)s
+    FROM debit, recipient
+    WHERE cards.id = recipient.id
+    RETURNING cards.id, cards.user_id, cards.balance
+),
+snapshot AS (
+    INSERT INTO card_daily_balances (card_id, day, opening_balance, closing_balance, inflow, outflow)
+    SELECT id, CURRENT_DATE, balance + %(amount)s, balance, 0, %(amount)s FROM debit
+    UNION ALL
+    SELECT id, CURRENT_DATE, balance - %(amount)s, balance, %(amount)s, 0 FROM credit
+    ON CONFLICT (card_id, day) DO UPDATE
+    SET closing_balance = EXCLUDED.closing_balance,
+        inflow = card_daily_balances.inflow + EXCLUDED.inflow,
+        outflow = card_daily_balances.outflow + EXCLUDED.outflow
+),
+ledger AS (
+    INSERT INTO transactions (from_card_id, to_card_id, amount, transaction_type, description)
+    SELECT debit.id, credit.id, %(amount)s, 'transfer', %(description)s
+    FROM debit, credit
+    RETURNING id
+),
+postings AS (
+    INSERT INTO postings (transaction_id, entry_type, account, card_id, amount)
+    SELECT ledger.id, 'transfer', 'card', debit.id, -(%(amount)s::numeric) FROM ledger, debit
+    UNION ALL
+    SELECT ledger.id, 'transfer', 'card', credit.id, %(amount)s FROM ledger, credit
+),
+rollup AS (
+    INSERT INTO spending_rollups (card_id, month, category, spent, spent_count, received, received_count)
+    SELECT debit.id, date_trunc('month', CURRENT_DATE)::date, 'transfer', %(amount)s, 1, 0, 0 FROM ledger, debit
+    UNION ALL
+    SELECT credit.id, date_trunc('month', CURRENT_DATE)::date, 'transfer', 0, 0, %(amount)s, 1 FROM ledger, credit
+    ON CONFLICT (card_id, month, category) DO UPDATE
+    SET spent = spending_rollups.spent + EXCLUDED.spent,
+        spent_count = spending_rollups.spent_count + EXCLUDED.spent_count,
+        received = spending_rollups.received + EXCLUDED.received,
+        received_count = spending_rollups.received_count + EXCLUDED.received_count
+),
+outbox AS (
+    INSERT INTO outbox_events (event_type, aggregate_id, payload)
+    SELECT 'transfer.completed', ledger.id, json_build_object(
+        'transaction_id', ledger.id, 'from_card_id', debit.id, 'to_card_id', credit.id,
+        'from_user_id', debit.user_id, 'to_user_id', credit.user_id, 'amount', %(amount)s::numeric::text
+    )
+    FROM ledger, debit, credit
+)
+SELECT (SELECT id FROM ledger),
+       (SELECT balance FROM debit),
+       EXISTS (SELECT 1 FROM locked WHERE id = %(from_card_id)s),
+       (SELECT id FROM recipient),
+       (SELECT user_id FROM debit),
+       (SELECT user_id FROM credit),
+       (SELECT rule FROM verdict),
+       (SELECT latency_ms FROM verdict)
+"""
+
+
+TRANSFER_TYPES = {
+    'from_card_id': 'integer', 'to_identifier': 'text', 'amount': 'numeric', 'description': 'text', 'window_seconds': 'integer'
+}
+TRANSFER_BY_CARD = db.Statement('transfer_by_card', TRANSFER_SQL.format(recipient=recipients.BY_CARD_SQL), TRANSFER_TYPES)
+TRANSFER_BY_PHONE = db.Statement('transfer_by_phone', TRANSFER_SQL.format(recipient=recipients.BY_PHONE_SQL), TRANSFER_TYPES)
+
+
+class TransferResult(NamedTuple):
+    status: str
+    transaction_id: Optional[int] = None
+    balance: Optional[Decimal] = None
+    to_card_id: Optional[int] = None
+    user_ids: Tuple[int, ...] = ()
+    rule: Optional[str] = None
+
+
+def execute_transfer(cur: Any, from_card_id: int, to_identifier: str, identifier_type: str, amount: Decimal) -> TransferResult:
+    db.execute(
+        cur,
+        TRANSFER_BY_PHONE if identifier_type == recipients.PHONE else TRANSFER_BY_CARD,
+        {
+            'from_card_id': from_card_id,
+            'to_identifier': recipients.normalize(identifier_type, to_identifier) or '',
+            'amount': amount,
+            'description': f'Transfer via {identifier_type}',
+            'window_seconds': risk.VELOCITY_WINDOW_SECONDS
+        }
+    )
+    transaction_id, balance, source_exists, to_card_id, from_user_id, to_user_id, rule, latency_ms = cur.fetchone()
+    if latency_ms is not None:
+        risk.log_decision(from_card_id, amount, rule, float(latency_ms))
+
+    if transaction_id is not None:
+        return TransferResult(OK, transaction_id, balance, to_card_id, (from_user_id, to_user_id))
+    if not source_exists:
+        return TransferResult(SOURCE_NOT_FOUND)
+    if to_card_id is None:
+        return TransferResult(RECIPIENT_NOT_FOUND)
+    if to_card_id == int(from_card_id):
+        return TransferResult(SAME_CARD)
+    if rule is not None:
+        return TransferResult(risk.RULE_DENIED, rule=rule)
+    return TransferResult(INSUFFICIENT_FUNDS)
+
+
+BATCH_MAX_ITEMS = 5000
+AMOUNT_PLACES = 2
+MODE_ATOMIC = 'atomic'
+MODE_BEST_EFFORT = 'best_effort'
+INVALID_ITEM = 'invalid_item'
+NOT_APPLIED = 'not_applied'
+
+BATCH_RULES_SQL = "SELECT check_transfer_rules(%s, %s, %s, %s, %s)"
+
+def execute_batch_transfer(cur: Any, from_card_id: int, items: List[Dict[str, Any]], mode: str) -> Tuple[str, List[Dict[str, Any]], List[int]]:
+    from psycopg2.extras import execute_values
+
+    from_card_id = int(from_card_id)
+    results: List[Dict[str, Any]] = []
+    parsed: List[Tuple[int, str, str, Decimal]] = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            results.append({'index': index, 'status': INVALID_ITEM})
+            continue
+        identifier_type = item.get('identifier_type', 'card')
+        to_identifier = str(item.get('to_identifier') or '').strip()
+        try:
+            amount = Decimal(str(item.get('amount', 0)))
+        except ArithmeticError:
+            amount = Decimal(0)
+        if (not to_identifier or identifier_type not in ('card', 'phone') or not amount.is_finite() or amount <= 0
+                or amount.as_tuple().exponent < -AMOUNT_PLACES):
+            results.append({'index': index, 'status': INVALID_ITEM})
+            continue
+        results.append({'index': index, 'status': NOT_APPLIED})
+        parsed.append((index, identifier_type, to_identifier, amount))
+
+    directory = recipients.resolve(cur, [(p[1], p[2]) for p in parsed])
+
+    resolved: List[Tuple[int, int, Decimal, str]] = []
+    for index, identifier_type, to_identifier, amount in parsed:
+        recipient = directory.get((identifier_type, to_identifier))
+        to_card_id = recipient.card_id if recipient else None
+        if to_card_id is None:
+            results[index]['status'] = RECIPIENT_NOT_FOUND
+        elif to_card_id == from_card_id:
+            results[index]['status'] = SAME_CARD
+        else:
+            resolved.append((index, to_card_id, amount, identifier_type))
+
+    cur.execute(
+        "SELECT id, balance, user_id, status FROM cards WHERE id = ANY(%s) ORDER BY id FOR UPDATE",
+        ([from_card_id] + sorted({r[1] for r in resolved}),)
+    )
+    locked = cur.fetchall()
+    balances = {card_id: balance for card_id, balance, _, _ in locked}
+    owners = {card_id: user_id for card_id, _, user_id, _ in locked}
+    blocked = {card_id for card_id, _, _, status in locked if status in ('blocked', 'closed')}
+    if from_card_id not in balances:
+        return SOURCE_NOT_FOUND, results, []
+
+    available = balances[from_card_id]
+    accepted: List[Tuple[int, int, Decimal, str]] = []
+    for entry in resolved:
+        if entry[1] not in balances:
+            results[entry[0]]['status'] = RECIPIENT_NOT_FOUND
+        elif entry[1] in blocked:
+            results[entry[0]].update({'status': risk.RULE_DENIED, 'rule': risk.RECIPIENT_BLOCKED})
+        elif entry[2] <= available:
+            available -= entry[2]
+            accepted.append(entry)
+        else:
+            results[entry[0]]['status'] = INSUFFICIENT_FUNDS
+
+    if accepted:
+        total = sum(entry[2] for entry in accepted)
+        started = time.perf_counter()
+        cur.execute(BATCH_RULES_SQL, (from_card_id, total, risk.VELOCITY_WINDOW_SECONDS,
+                                      len(accepted), max(entry[2] for entry in accepted)))
+        rule = cur.fetchone()[0]
+        risk.log_decision(from_card_id, total, rule, (time.perf_counter() - started) * 1000, items=len(accepted))
+        if rule is not None:
+            for entry in accepted:
+                results[entry[0]].update({'status': risk.RULE_DENIED, 'rule': rule})
+            accepted = []
+
+    if mode == MODE_ATOMIC and len(accepted) != len(results):
+        return NOT_APPLIED, results, []
+    if not accepted:
+        return OK, results, []
+
+    deltas: Dict[int, Decimal] = {from_card_id: -sum(entry[2] for entry in accepted)}
+    for _, to_card_id, amount, _ in accepted:
+        deltas[to_card_id] = deltas.get(to_card_id, Decimal(0)) + amount
+
+    execute_values(
+        cur,
+        "UPDATE cards SET balance = cards.balance + v.delta FROM (VALUES %s) AS v(id, delta) WHERE cards.id = v.id",
+        sorted(deltas.items()),
+        template='(%s::integer, %s::numeric)',
+        page_size=len(deltas)
+    )
+    rows = execute_values(
+        cur,
+        "INSERT INTO transactions (from_card_id, to_card_id, amount, transaction_type, description) VALUES %s RETURNING id",
+        [(from_card_id, to_card_id, amount, 'transfer', f'Batch transfer via {identifier_type}') for _, to_card_id, amount, identifier_type in accepted],
+        page_size=len(accepted),
+        fetch=True
+    )
+    record_daily_balances(cur, [(card_id, delta, balances[card_id] + delta) for card_id, delta in deltas.items()])
+    record_postings(cur, [
+        leg
+        for (_, to_card_id, amount, _), (transaction_id,) in zip(accepted, rows)
+        for leg in transfer_legs(transaction_id, from_card_id, to_card_id, amount)
+    ])
+    record_transfer_rollups(cur, from_card_id, [(to_card_id, amount) for _, to_card_id, amount, _ in accepted])
+    for (index, to_card_id, _, _), (transaction_id,) in zip(accepted, rows):
+        results[index].update({'status': OK, 'transaction_id': transaction_id, 'to_card_id': to_card_id})
+    enqueue_many(cur, [
+        (TRANSFER_COMPLETED, transaction_id, {
+            'transaction_id': transaction_id, 'from_card_id': from_card_id, 'to_card_id': to_card_id,
+            'from_user_id': owners[from_card_id], 'to_user_id': owners[to_card_id], 'amount': amount
+        })
+        for (_, to_card_id, amount, _), (transaction_id,) in zip(accepted, rows)
+    ])
+    return OK, results, [owners[card_id] for card_id in deltas]
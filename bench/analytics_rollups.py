@@ -0,0 +1,94 @@
+'''
+Business: Аналитика трат на больших объёмах - пересборка spending_rollups из миллионов операций, сверка с историей
+          и время ответа view=analytics за весь период по одной карте и по пользователю со многими картами
+Args: BENCH_DATABASE_URL - одноразовая локальная БД; --cards N; --transactions M; --queries Q
+Returns: JSON со временем пересборки, операциями в секунду и задержками запроса; код 1 при расхождении или ошибке
+'''
+import argparse
+import json
+import statistics
+import sys
+import time
+
+import psycopg2
+
+from common import bench_dsn, invoke, load_handler, reset_database
+
+SEED_CHUNK = 1000000
+TYPES = "(ARRAY['transfer', 'transfer', 'transfer', 'credit', 'credit_repayment', 'credit_interest'])"
+
+
+def seed(dsn: str, cards: int, transactions: int) -> None:
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute("INSERT INTO users (phone, name) VALUES ('+70000000001', 'Analytics')")
+    cur.execute(
+        "INSERT INTO cards (user_id, card_number, balance) "
+        "SELECT 1, lpad(i::text, 16, '0'), 0 FROM generate_series(1, %s) i",
+        (cards,)
+    )
+    for start in range(0, transactions, SEED_CHUNK):
+        cur.execute(
+            f"""
+            INSERT INTO transactions (from_card_id, to_card_id, amount, transaction_type, description, created_at)
+            SELECT 1 + floor(random() * %(cards)s)::int, 1 + floor(random() * %(cards)s)::int,
+                   round((1 + random() * 5000)::numeric, 2), {TYPES}[1 + floor(random() * 6)::int], 'Seed',
+                   now() - random() * interval '700 days'
+            FROM generate_series(1, %(count)s)
+            """,
+            {'cards': cards, 'count': min(SEED_CHUNK, transactions - start)}
+        )
+    cur.execute('ANALYZE')
+    conn.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cards', type=int, default=10000)
+    parser.add_argument('--transactions', type=int, default=5000000)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    dsn = bench_dsn()
+    reset_database(dsn)
+    seed(dsn, args.cards, args.transactions)
+
+    module = load_handler('transactions')
+    conn = psycopg2.connect(dsn)
+    started = time.monotonic()
+    rows = module.analytics.rebuild(conn)
+    rebuild_s = time.monotonic() - started
+    drift = module.analytics.check(conn)
+    conn.close()
+
+    report = {
+        'transactions': args.transactions,
+        'rollup_rows': rows,
+        'rebuild_s': round(rebuild_s, 2),
+        'transactions_per_second': round(args.transactions / rebuild_s) if rebuild_s else None,
+        'drift_rows': len(drift)
+    }
+    errors = 0
+    for name, scope in (('card', {'card_id': '1'}), ('user', {'user_id': '1'})):
+        latencies = []
+        for _ in range(args.queries):
+            event = {
+                'httpMethod': 'GET',
+                'queryStringParameters': {'view': 'analytics', 'from': '2000-01-01', 'to': '2100-01-01', **scope}
+            }
+            query_started = time.perf_counter()
+            response = invoke(module, event)
+            latencies.append((time.perf_counter() - query_started) * 1000)
+            errors += response['statusCode'] != 200
+        report[f'{name}_query_p50_ms'] = round(statistics.median(latencies), 2)
+        report[f'{name}_query_p99_ms'] = round(sorted(latencies)[int(len(latencies) * 0.99) - 1], 2)
+    report['errors'] = errors
+    module.db.get_pool().closeall()
+
+    print(json.dumps(report, indent=2))
+    return 1 if drift or errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
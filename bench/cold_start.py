@@ -0,0 +1,129 @@
+'''
+Business: Холодный старт функций - каждая функция запускается в новом процессе: время импорта index, OPTIONS,
+          ответа с ошибкой валидации (оба без драйвера БД), первого и второго запроса к БД, с DB_PREWARM и без
+Args: BENCH_DATABASE_URL - необязательная одноразовая локальная БД (без неё меряются только импорт, OPTIONS и валидация);
+      --runs N - запусков на функцию и режим; --idle S - пауза между импортом и первым запросом
+Returns: JSON с медианами по функциям; код 1, если драйвер загружается до первого запроса к БД или запрос упал
+'''
+import argparse
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+from common import BACKEND, FakeContext, reset_database
+
+FUNCTIONS = ('auth', 'cards', 'credit', 'transactions')
+
+INVALID_EVENTS = {
+    'auth': {'httpMethod': 'POST', 'body': '{}'},
+    'cards': {'httpMethod': 'GET', 'queryStringParameters': {}},
+    'credit': {'httpMethod': 'POST', 'body': '{}'},
+    'transactions': {'httpMethod': 'GET', 'queryStringParameters': {}},
+}
+
+DB_EVENTS = {
+    'auth': {'httpMethod': 'POST', 'body': json.dumps({'phone': '+70000000001', 'name': 'Cold'})},
+    'cards': {'httpMethod': 'GET', 'queryStringParameters': {'user_id': '1'}},
+    'credit': {'httpMethod': 'POST', 'body': json.dumps({'card_id': 1, 'amount': 1})},
+    'transactions': {'httpMethod': 'GET', 'queryStringParameters': {'card_id': '1'}},
+}
+
+
+def timed(handler: Any, event: Dict[str, Any]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    response = handler(event, FakeContext())
+    return {'ms': (time.perf_counter() - started) * 1000, 'status': response['statusCode']}
+
+
+def child(name: str, idle: float) -> None:
+    started = time.perf_counter()
+    sys.path.insert(0, str(BACKEND / name))
+    index = importlib.import_module('index')
+    result: Dict[str, Any] = {'import_ms': (time.perf_counter() - started) * 1000}
+
+    options = timed(index.handler, {'httpMethod': 'OPTIONS'})
+    invalid = timed(index.handler, INVALID_EVENTS[name])
+    result.update({
+        'options_ms': options['ms'],
+        'invalid_ms': invalid['ms'],
+        'invalid_status': invalid['status'],
+        'driver_before_db': 'psycopg2' in sys.modules and not index.db.PREWARM
+    })
+
+    if os.environ.get('DATABASE_URL'):
+        time.sleep(idle)
+        first = timed(index.handler, DB_EVENTS[name])
+        second = timed(index.handler, DB_EVENTS[name])
+        result.update({
+            'first_db_ms': first['ms'],
+            'second_db_ms': second['ms'],
+            'db_status': [first['status'], second['status']]
+        })
+    print(json.dumps(result))
+
+
+def run(name: str, runs: int, idle: float, prewarm: bool) -> Dict[str, Any]:
+    env = {**os.environ, 'DB_PREWARM': '1' if prewarm else '0'}
+    samples: List[Dict[str, Any]] = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, __file__, '--child', name, '--idle', str(idle)],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    summary: Dict[str, Any] = {'function': name, 'prewarm': prewarm}
+    for key in ('import_ms', 'options_ms', 'invalid_ms', 'first_db_ms', 'second_db_ms'):
+        values = [sample[key] for sample in samples if key in sample]
+        if values:
+            summary[key] = round(statistics.median(values), 2)
+    summary['driver_before_db'] = any(sample['driver_before_db'] for sample in samples)
+    summary['failed'] = any(
+        sample['invalid_status'] != 400 or any(status >= 400 for status in sample.get('db_status', []))
+        for sample in samples
+    )
+    return summary
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--idle', type=float, default=0.2)
+    parser.add_argument('--child')
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.idle)
+        return 0
+
+    dsn = os.environ.get('BENCH_DATABASE_URL')
+    os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+    if dsn:
+        os.environ['DATABASE_URL'] = dsn
+        reset_database(dsn)
+        import psycopg2
+
+        conn = psycopg2.connect(dsn)
+        with conn.cursor() as cur:
+            cur.execute("INSERT INTO users (phone, name) VALUES ('+70000000001', 'Cold')")
+            cur.execute("INSERT INTO cards (user_id, card_number, balance) VALUES (1, '1000 0000 0000 0001', 0)")
+        conn.commit()
+        conn.close()
+    else:
+        os.environ.pop('DATABASE_URL', None)
+
+    report = [run(name, args.runs, args.idle, False) for name in FUNCTIONS]
+    if dsn:
+        report += [run(name, args.runs, args.idle, True) for name in FUNCTIONS]
+
+    print(json.dumps(report, indent=2))
+    return 1 if any(r['driver_before_db'] or r['failed'] for r in report) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
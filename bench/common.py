@@ -0,0 +1,65 @@
+'''
+Business: Общие утилиты стенда - загрузка функций backend/* и подготовка локальной БД
+Args: BENCH_DATABASE_URL - строка подключения к одноразовой локальной БД (будет очищена);
+      лимитер запросов на стенде выключен, если RATE_LIMIT_ENABLED не задан явно
+Returns: load_handler(), reset_database(), FakeContext
+'''
+import importlib.util
+import os
+import sys
+import uuid
+from pathlib import Path
+from types import ModuleType
+from typing import Dict, Any
+
+ROOT = Path(__file__).resolve().parent.parent
+BACKEND = ROOT / 'backend'
+MIGRATIONS = ROOT / 'db_migrations'
+
+
+class FakeContext:
+    def __init__(self) -> None:
+        self.request_id = str(uuid.uuid4())
+
+
+def bench_dsn() -> str:
+    dsn = os.environ.get('BENCH_DATABASE_URL')
+    if not dsn:
+        sys.exit('BENCH_DATABASE_URL is required (a throwaway local database, it will be wiped)')
+    os.environ['DATABASE_URL'] = dsn
+    os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+    return dsn
+
+
+def load_handler(name: str) -> ModuleType:
+    fn_dir = BACKEND / name
+    local_modules = {path.stem for path in fn_dir.glob('*.py')}
+    for module_name in local_modules:
+        sys.modules.pop(module_name, None)
+    sys.path.insert(0, str(fn_dir))
+    try:
+        spec = importlib.util.spec_from_file_location(f'{name}_index', fn_dir / 'index.py')
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(str(fn_dir))
+        for module_name in local_modules:
+            sys.modules.pop(module_name, None)
+    return module
+
+
+def reset_database(dsn: str) -> None:
+    import psycopg2
+
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute('DROP SCHEMA public CASCADE; CREATE SCHEMA public;')
+    for path in sorted(MIGRATIONS.glob('V*.sql')):
+        cur.execute(path.read_text(encoding='utf-8'))
+    cur.close()
+    conn.close()
+
+
+def invoke(module: ModuleType, event: Dict[str, Any]) -> Dict[str, Any]:
+    return module.handler(event, FakeContext())
@@ -0,0 +1,107 @@
+'''
+Business: Скорость и память потоковой выгрузки истории - COPY в CSV/NDJSON (с gzip и без) по одной карте
+          с миллионами проводок; пиковая память процесса не должна расти с числом строк
+Args: BENCH_DATABASE_URL - одноразовая локальная БД; --rows N; --min-rows-per-minute - порог успеха
+Returns: JSON со строками в минуту, байтами и приростом RSS по каждому режиму; код 1 при недоборе порога
+'''
+import argparse
+import gzip
+import json
+import resource
+import sys
+import time
+from datetime import date, timedelta
+
+import psycopg2
+
+from common import bench_dsn, load_handler, reset_database
+
+SEED_CHUNK = 500000
+
+
+class CountingSink:
+    def __init__(self) -> None:
+        self.bytes = 0
+
+    def write(self, data: bytes) -> int:
+        self.bytes += len(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+
+def seed(dsn: str, rows: int) -> None:
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute("INSERT INTO users (phone, name) VALUES ('+70000000001', 'Export')")
+    cur.execute(
+        "INSERT INTO cards (user_id, card_number, balance) VALUES (1, '1000 0000 0000 0000', 0), (1, '2000 0000 0000 0000', 0)"
+    )
+    for start in range(0, rows, SEED_CHUNK):
+        cur.execute(
+            """
+            INSERT INTO transactions (from_card_id, to_card_id, amount, transaction_type, description, created_at)
+            SELECT 1, 2, round((1 + random() * 5000)::numeric, 2), 'transfer', 'Seed transfer',
+                   now() - random() * interval '300 days'
+            FROM generate_series(1, %s)
+            """,
+            (min(SEED_CHUNK, rows - start),)
+        )
+    cur.execute('ANALYZE')
+    conn.close()
+
+
+def max_rss_kb() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--min-rows-per-minute', type=int, default=1000000)
+    args = parser.parse_args()
+
+    dsn = bench_dsn()
+    reset_database(dsn)
+    seed(dsn, args.rows)
+
+    export = load_handler('transactions').export
+    conn = psycopg2.connect(dsn)
+    date_to = date.today()
+    date_from = date_to - timedelta(days=365)
+
+    report = {}
+    for fmt in export.FORMATS:
+        for compressed in (False, True):
+            sink = CountingSink()
+            rss_before = max_rss_kb()
+            started = time.monotonic()
+            with conn.cursor() as cur:
+                if compressed:
+                    with gzip.GzipFile(fileobj=sink, mode='wb', compresslevel=6) as out:
+                        rows = export.copy_export(cur, out, [1], date_from, date_to, fmt)
+                else:
+                    rows = export.copy_export(cur, sink, [1], date_from, date_to, fmt)
+            conn.rollback()
+            elapsed = time.monotonic() - started
+            report[fmt + ('+gzip' if compressed else '')] = {
+                'rows': rows,
+                'bytes': sink.bytes,
+                'elapsed_s': round(elapsed, 2),
+                'rows_per_minute': round(rows / elapsed * 60),
+                'rss_growth_kb': max_rss_kb() - rss_before
+            }
+    conn.close()
+
+    print(json.dumps(report, indent=2))
+    slow = [mode for mode, result in report.items() if result['rows_per_minute'] < args.min_rows_per_minute]
+    if slow:
+        print(f'below {args.min_rows_per_minute} rows/min: {", ".join(slow)}', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
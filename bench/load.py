@@ -0,0 +1,289 @@
+'''
+Business: Нагрузочный стенд - смешанная нагрузка на реальные handler() всех четырёх функций
+          на одноразовой локальной БД с реалистичным объёмом данных
+Args: BENCH_DATABASE_URL - одноразовая локальная БД; --users, --cards-per-user, --transactions - объём данных;
+      --skip-seed - переиспользовать уже засеянную БД; --mix login=20,dashboard=40,history=15,transfer=15,credit=10;
+      --concurrency C; --duration S или --requests N; --output FILE; --baseline FILE, --max-regression P
+Returns: JSON-отчёт (p50/p95/p99, запросов к БД на вызов и открытых соединений по трассам tracing);
+         код выхода 1 при ошибках 5xx или регрессии p95 относительно --baseline больше P процентов
+'''
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+import psycopg2
+
+from common import ROOT, bench_dsn, invoke, load_handler, reset_database
+
+DEFAULT_MIX = 'login=20,dashboard=40,history=15,transfer=15,credit=10'
+SEED_CHUNK = 1000000
+
+_counter = threading.local()
+
+
+def count_invocation(record: Dict[str, Any]) -> None:
+    _counter.queries = record['query_count']
+    _counter.opened = record['connections_opened']
+
+
+def seed(dsn: str, users: int, cards_per_user: int, transactions: int) -> None:
+    cards = users * cards_per_user
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO users (phone, name) SELECT '+7' || lpad(i::text, 10, '0'), 'User ' || i FROM generate_series(1, %s) i",
+        (users,)
+    )
+    cur.execute(
+        """
+        INSERT INTO cards (user_id, card_number, card_type, card_name, card_category, balance, created_at)
+        SELECT (i - 1) / %(per_user)s + 1,
+               '9' || substr(n, 2, 3) || ' ' || substr(n, 5, 4) || ' ' || substr(n, 9, 4) || ' ' || substr(n, 13, 4),
+               'virtual', 'Карта ' || i, CASE WHEN i %% 4 = 0 THEN 'credit' ELSE 'debit' END,
+               1000000.00, now() - interval '400 days'
+        FROM generate_series(1, %(cards)s) i, lpad(i::text, 16, '0') n
+        """,
+        {'per_user': cards_per_user, 'cards': cards}
+    )
+    for start in range(0, transactions, SEED_CHUNK):
+        cur.execute(
+            """
+            INSERT INTO transactions (from_card_id, to_card_id, amount, transaction_type, description, created_at)
+            SELECT 1 + floor(random() * %(cards)s)::int, 1 + floor(random() * %(cards)s)::int,
+                   round((1 + random() * 5000)::numeric, 2), 'transfer', 'Seed transfer',
+                   now() - random() * interval '365 days'
+            FROM generate_series(1, %(count)s)
+            """,
+            {'cards': cards, 'count': min(SEED_CHUNK, transactions - start)}
+        )
+    cur.execute('ANALYZE')
+    cur.close()
+    conn.close()
+
+
+def dataset_size(dsn: str) -> Dict[str, int]:
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    cur.execute("SELECT (SELECT max(id) FROM users), (SELECT max(id) FROM cards), (SELECT count(*) FROM transactions)")
+    users, cards, transactions = cur.fetchone()
+    cur.close()
+    conn.close()
+    return {'users': users or 0, 'cards': cards or 0, 'transactions': transactions}
+
+
+def parse_mix(spec: str) -> List[Tuple[str, int]]:
+    mix = []
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        if name not in WORKLOADS or not weight.isdigit():
+            raise argparse.ArgumentTypeError(f'invalid mix entry: {part}')
+        mix.append((name, int(weight)))
+    return mix
+
+
+def card_number(card_id: int) -> str:
+    n = str(card_id).zfill(16)
+    return f'9{n[1:4]} {n[4:8]} {n[8:12]} {n[12:16]}'
+
+
+def login_event(rng: random.Random, size: Dict[str, int]) -> Dict[str, Any]:
+    user_id = rng.randint(1, size['users'])
+    return {'httpMethod': 'POST', 'body': json.dumps({'phone': '+7' + str(user_id).zfill(10), 'name': f'User {user_id}'})}
+
+
+def dashboard_event(rng: random.Random, size: Dict[str, int]) -> Dict[str, Any]:
+    user_id = rng.randint(1, size['users'])
+    return {'httpMethod': 'GET', 'queryStringParameters': {'user_id': str(user_id), 'view': 'dashboard', 'recent': '50'}}
+
+
+def history_event(rng: random.Random, size: Dict[str, int]) -> Dict[str, Any]:
+    return {'httpMethod': 'GET', 'queryStringParameters': {'card_id': str(rng.randint(1, size['cards'])), 'limit': '50'}}
+
+
+def transfer_event(rng: random.Random, size: Dict[str, int]) -> Dict[str, Any]:
+    from_card, to_card = rng.sample(range(1, size['cards'] + 1), 2)
+    body = {'from_card_id': from_card, 'to_identifier': card_number(to_card), 'amount': rng.randint(1, 500)}
+    return {'httpMethod': 'POST', 'body': json.dumps(body)}
+
+
+def credit_event(rng: random.Random, size: Dict[str, int]) -> Dict[str, Any]:
+    return {'httpMethod': 'POST', 'body': json.dumps({'card_id': rng.randint(1, size['cards']), 'amount': rng.randint(100, 10000)})}
+
+
+WORKLOADS: Dict[str, Tuple[str, Callable[[random.Random, Dict[str, int]], Dict[str, Any]]]] = {
+    'login': ('auth', login_event),
+    'dashboard': ('cards', dashboard_event),
+    'history': ('transactions', history_event),
+    'transfer': ('transactions', transfer_event),
+    'credit': ('credit', credit_event),
+}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+
+def summarize(samples: List[Tuple[float, int, int, int]], elapsed: float) -> Dict[str, Any]:
+    latencies = sorted(s[0] for s in samples)
+    queries = [s[1] for s in samples]
+    statuses: Dict[str, int] = {}
+    for _, _, _, status in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'count': len(samples),
+        'throughput_rps': round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        'statuses': statuses,
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(latencies[-1], 3) if latencies else 0.0,
+        'queries_per_invocation': round(sum(queries) / len(queries), 2) if queries else 0.0,
+        'max_queries': max(queries) if queries else 0,
+        'connections_opened': sum(s[2] for s in samples)
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(report: Dict[str, Any], baseline_path: str, max_regression: float) -> List[str]:
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = []
+    for name, current in report['workloads'].items():
+        previous = baseline.get('workloads', {}).get(name)
+        if not previous or not previous['p95_ms']:
+            continue
+        change = (current['p95_ms'] - previous['p95_ms']) / previous['p95_ms'] * 100
+        current['p95_change_pct'] = round(change, 1)
+        if change > max_regression:
+            regressions.append(f"{name}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms (+{change:.1f}%)")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--cards-per-user', type=int, default=5)
+    parser.add_argument('--transactions', type=int, default=10000000)
+    parser.add_argument('--skip-seed', action='store_true')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--requests', type=int, default=0)
+    parser.add_argument('--warmup', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output')
+    parser.add_argument('--baseline')
+    parser.add_argument('--max-regression', type=float, default=20.0)
+    args = parser.parse_args()
+    mix = args.mix
+
+    dsn = bench_dsn()
+    os.environ['DB_POOL_MAX_SIZE'] = str(args.concurrency)
+    if not args.skip_seed:
+        reset_database(dsn)
+        started = time.monotonic()
+        seed(dsn, args.users, args.cards_per_user, args.transactions)
+        print(f'seeded in {time.monotonic() - started:.1f}s', file=sys.stderr)
+    size = dataset_size(dsn)
+    if size['cards'] < 2:
+        sys.exit('database has no seeded cards, run without --skip-seed')
+
+    os.environ['TRACE_SAMPLE_RATE'] = '1'
+    modules = {function: load_handler(function) for function in {WORKLOADS[name][0] for name, _ in mix}}
+    for module in modules.values():
+        module.db.tracing.set_sink(count_invocation)
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+
+    def run_one(rng: random.Random) -> Tuple[str, float, int, int, int]:
+        name = rng.choices(names, weights)[0]
+        function, make_event = WORKLOADS[name]
+        event = make_event(rng, size)
+        _counter.queries = _counter.opened = 0
+        started = time.perf_counter()
+        try:
+            status = invoke(modules[function], event)['statusCode']
+        except Exception as e:
+            print(f'{name}: {type(e).__name__}: {e}', file=sys.stderr)
+            status = 599
+        return name, (time.perf_counter() - started) * 1000, _counter.queries, _counter.opened, status
+
+    warmup_rng = random.Random(args.seed - 1)
+    for _ in range(args.warmup):
+        run_one(warmup_rng)
+    opened_before = {function: module.db.get_pool().stats['opened'] for function, module in modules.items()}
+
+    samples: Dict[str, List[Tuple[float, int, int, int]]] = {name: [] for name in names}
+    lock = threading.Lock()
+    issued = [0]
+    deadline = time.monotonic() + args.duration
+
+    def worker(worker_id: int) -> None:
+        rng = random.Random(args.seed * 1000 + worker_id)
+        while True:
+            with lock:
+                if args.requests and issued[0] >= args.requests:
+                    return
+                issued[0] += 1
+            if not args.requests and time.monotonic() >= deadline:
+                return
+            name, latency, queries, opened, status = run_one(rng)
+            with lock:
+                samples[name].append((latency, queries, opened, status))
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for future in [pool.submit(worker, i) for i in range(args.concurrency)]:
+            future.result()
+    elapsed = time.monotonic() - started
+
+    report: Dict[str, Any] = {
+        'commit': git_commit(),
+        'concurrency': args.concurrency,
+        'mix': dict(mix),
+        'dataset': size,
+        'elapsed_s': round(elapsed, 2),
+        'workloads': {name: summarize(values, elapsed) for name, values in samples.items()},
+        'total': summarize([s for values in samples.values() for s in values], elapsed),
+        'connections_opened': {
+            function: module.db.get_pool().stats['opened'] - opened_before[function] for function, module in modules.items()
+        },
+        'pool_stats': {function: module.db.get_pool().stats for function, module in modules.items()}
+    }
+
+    regressions = compare(report, args.baseline, args.max_regression) if args.baseline else []
+    server_errors = sum(count for status, count in report['total']['statuses'].items() if int(status) >= 500)
+    report['ok'] = not regressions and not server_errors
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    print(output)
+    for line in regressions:
+        print(f'regression: {line}', file=sys.stderr)
+
+    for module in modules.values():
+        module.db.get_pool().closeall()
+    return 0 if report['ok'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+'''
+Business: Проверка outbox - каждый успешный перевод порождает событие, параллельные воркеры со SKIP LOCKED
+          доставляют все события хотя бы один раз, в том числе после сбоев потребителя
+Args: BENCH_DATABASE_URL - одноразовая локальная БД; --transfers N; --consumers C; --failure-rate F;
+      --sources S - карт-отправителей, переводы идут по кругу, чтобы не упираться в окно скорости антифрода
+Returns: код выхода 1, если какое-то событие потеряно, не создано или осталось в очереди
+'''
+import argparse
+import importlib.util
+import json
+import os
+import random
+import sys
+import threading
+import time
+from typing import Any, Dict
+
+import psycopg2
+
+from common import BACKEND, bench_dsn, invoke, load_handler, reset_database
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--transfers', type=int, default=2000)
+    parser.add_argument('--consumers', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--failure-rate', type=float, default=0.2)
+    parser.add_argument('--sources', type=int, default=250)
+    args = parser.parse_args()
+
+    dsn = bench_dsn()
+    os.environ['OUTBOX_RETRY_BASE_SECONDS'] = '0'
+    reset_database(dsn)
+
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    cur.execute("INSERT INTO users (phone, name) VALUES ('+70000000001', 'Outbox') RETURNING id")
+    user_id = cur.fetchone()[0]
+    cur.execute(
+        "INSERT INTO cards (user_id, card_number, balance) "
+        "SELECT %s, '1000 0000 0000 ' || lpad(i::text, 4, '0'), 1000000 FROM generate_series(1, %s) i RETURNING id",
+        (user_id, args.sources)
+    )
+    source_ids = [row[0] for row in cur.fetchall()]
+    cur.execute("INSERT INTO cards (user_id, card_number, balance) VALUES (%s, '2000 0000 0000 0000', 0)", (user_id,))
+    conn.commit()
+
+    module = load_handler('transactions')
+    started = time.monotonic()
+    for i in range(args.transfers):
+        body = {'from_card_id': source_ids[i % len(source_ids)], 'to_identifier': '2000 0000 0000 0000', 'amount': 1}
+        invoke(module, {'httpMethod': 'POST', 'body': json.dumps(body)})
+    transfer_s = time.monotonic() - started
+    module.db.get_pool().closeall()
+
+    spec = importlib.util.spec_from_file_location('bench_outbox', BACKEND / 'transactions' / 'outbox.py')
+    outbox = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(outbox)
+    outbox.CONSUMERS.clear()
+
+    deliveries: Dict[Any, int] = {}
+    lock = threading.Lock()
+    rng = random.Random(1)
+
+    @outbox.consumer(outbox.TRANSFER_COMPLETED)
+    def flaky(cur: Any, event: Dict[str, Any]) -> None:
+        with lock:
+            fail = rng.random() < args.failure_rate
+            if not fail:
+                deliveries[event['payload']['transaction_id']] = deliveries.get(event['payload']['transaction_id'], 0) + 1
+        if fail:
+            raise RuntimeError('simulated consumer failure')
+
+    started = time.monotonic()
+    totals = {'delivered': 0, 'failed': 0}
+    while True:
+        batch = outbox.run(dsn, args.consumers, args.batch_size, once=True)
+        totals['delivered'] += batch['delivered']
+        totals['failed'] += batch['failed']
+        pending = outbox.stats(conn)
+        if not pending['pending'] or not batch['delivered'] and not batch['failed']:
+            break
+    drain_s = time.monotonic() - started
+
+    cur.execute("SELECT id FROM transactions WHERE transaction_type = 'transfer'")
+    ledger_ids = {row[0] for row in cur.fetchall()}
+    cur.execute("SELECT count(*) FROM outbox_events WHERE event_type = 'transfer.completed'")
+    events = cur.fetchone()[0]
+    conn.rollback()
+    cur.close()
+    conn.close()
+
+    ok = ledger_ids == set(deliveries) and events == len(ledger_ids) and pending['pending'] == 0 and pending['failed'] == 0
+    print(json.dumps({
+        'transfers': len(ledger_ids),
+        'events': events,
+        'delivered_events': len(deliveries),
+        'redelivered': sum(count - 1 for count in deliveries.values()),
+        'consumer_failures': totals['failed'],
+        'transfer_s': round(transfer_s, 2),
+        'drain_s': round(drain_s, 2),
+        'events_per_s': round(events / drain_s, 1) if drain_s else None,
+        'outbox': pending,
+        'ok': ok
+    }))
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,64 @@
+'''
+Business: Проверка пула соединений - 1000 последовательных вызовов должны открыть лишь несколько соединений
+Args: BENCH_DATABASE_URL - одноразовая локальная БД; --invocations N; --max-connections M
+Returns: код выхода 1, если какая-то функция открыла больше M соединений
+'''
+import argparse
+import json
+import sys
+
+import psycopg2
+
+from common import bench_dsn, invoke, load_handler, reset_database
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--invocations', type=int, default=1000)
+    parser.add_argument('--max-connections', type=int, default=4)
+    args = parser.parse_args()
+
+    dsn = bench_dsn()
+    reset_database(dsn)
+
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    cur.execute("INSERT INTO users (phone, name) VALUES ('+70000000001', 'Bench') RETURNING id")
+    user_id = cur.fetchone()[0]
+    cur.execute("INSERT INTO cards (user_id, card_number, balance) VALUES (%s, '0000 0000 0000 0001', 100) RETURNING id", (user_id,))
+    card_id = cur.fetchone()[0]
+    conn.commit()
+
+    workloads = {
+        'auth': {'httpMethod': 'POST', 'body': json.dumps({'phone': '+70000000001', 'name': 'Bench'})},
+        'cards': {'httpMethod': 'GET', 'queryStringParameters': {'user_id': str(user_id)}},
+        'transactions': {'httpMethod': 'GET', 'queryStringParameters': {'card_id': str(card_id)}},
+    }
+
+    failed = False
+    for name, event in workloads.items():
+        module = load_handler(name)
+        errors = 0
+        for i in range(args.invocations):
+            if i == args.invocations // 2:
+                cur.execute('SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE datname = current_database() AND pid <> pg_backend_pid()')
+                conn.commit()
+            try:
+                response = invoke(module, event)
+                if response['statusCode'] >= 500:
+                    errors += 1
+            except psycopg2.OperationalError:
+                errors += 1
+        stats = module.db.get_pool().stats
+        ok = stats['opened'] <= args.max_connections and errors <= 1
+        failed = failed or not ok
+        print(json.dumps({'function': name, 'invocations': args.invocations, 'errors_after_backend_kill': errors, **stats, 'ok': ok}))
+        module.db.get_pool().closeall()
+
+    cur.close()
+    conn.close()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
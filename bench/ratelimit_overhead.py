@@ -0,0 +1,96 @@
+'''
+Business: Накладные расходы лимитера на горячем пути - check() с локальными корзинами для одного ключа, для потока
+          разных ключей с вытеснением и под конкуренцией потоков; с --postgres ещё и общий бэкенд на таблице
+Args: --iterations K; --threads T; --max-overhead-us - порог успеха; --postgres - нужен BENCH_DATABASE_URL
+Returns: JSON с мкс на вызов по каждому сценарию; код выхода 1, если локальный путь дороже порога
+'''
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+from common import BACKEND
+
+os.environ['RATE_LIMIT_ENABLED'] = '1'
+sys.path.insert(0, str(BACKEND / 'transactions'))
+import ratelimit  # noqa: E402
+
+
+def per_call_us(fn: Callable[[int], Any], iterations: int) -> float:
+    started = time.perf_counter()
+    for i in range(iterations):
+        fn(i)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def threaded_us(fn: Callable[[int], Any], iterations: int, threads: int) -> float:
+    barrier = threading.Barrier(threads + 1)
+
+    def worker() -> None:
+        barrier.wait()
+        for i in range(iterations):
+            fn(i)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in pool:
+        thread.join()
+    return (time.perf_counter() - started) / (iterations * threads) * 1e6
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    return {
+        'p50_ms': round(samples[len(samples) // 2], 3),
+        'p99_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 3)
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=200000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--max-overhead-us', type=float, default=20.0)
+    parser.add_argument('--postgres', action='store_true')
+    args = parser.parse_args()
+
+    generous = ratelimit.Limit('bench', 1e9, 1e9)
+    tight = ratelimit.Limit('bench_tight', 1.0, 5.0)
+    report: Dict[str, Any] = {}
+
+    ratelimit.set_backend(ratelimit.LocalBuckets())
+    report['local_hot_key_us'] = round(per_call_us(lambda i: ratelimit.check(generous, 42), args.iterations), 3)
+    report['local_distinct_keys_us'] = round(per_call_us(lambda i: ratelimit.check(generous, i), args.iterations), 3)
+    report['local_rejected_us'] = round(per_call_us(lambda i: ratelimit.check(tight, 42), args.iterations), 3)
+    report['local_threads_us'] = round(threaded_us(lambda i: ratelimit.check(generous, i % 1000), args.iterations // args.threads, args.threads), 3)
+
+    if args.postgres:
+        from common import bench_dsn, reset_database
+        import db
+
+        reset_database(bench_dsn())
+        ratelimit.set_backend(ratelimit.PostgresBuckets(db.connection))
+        samples = []
+        for i in range(min(args.iterations, 5000)):
+            started = time.perf_counter()
+            ratelimit.check(generous, i % 100)
+            samples.append((time.perf_counter() - started) * 1000)
+        report['postgres'] = percentiles(samples)
+        db.get_pool().closeall()
+
+    print(json.dumps(report, indent=2))
+    local = [value for key, value in report.items() if key.startswith('local_')]
+    if max(local) > args.max_overhead_us:
+        print(f'limiter overhead above {args.max_overhead_us} us per call', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
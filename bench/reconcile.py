@@ -0,0 +1,97 @@
+'''
+Business: Сверка балансов с двойной записью на больших объёмах - генерирует десятки миллионов ног,
+          портит баланс у части карт и проверяет, что параллельная сверка находит ровно их и укладывается во время
+Args: BENCH_DATABASE_URL - одноразовая локальная БД; --cards N; --postings M; --drift K; --workers W
+Returns: JSON со временем сверки и ног в секунду; код выхода 1, если найдено не K расхождений
+'''
+import argparse
+import importlib.util
+import json
+import sys
+import time
+
+import psycopg2
+
+from common import BACKEND, bench_dsn, reset_database
+
+SEED_CHUNK = 1000000
+
+
+def seed(dsn: str, cards: int, postings: int, drift: int) -> None:
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute("INSERT INTO users (phone, name) VALUES ('+70000000001', 'Reconcile')")
+    cur.execute(
+        "INSERT INTO cards (user_id, card_number, balance) "
+        "SELECT 1, lpad(i::text, 16, '0'), 0 FROM generate_series(1, %s) i",
+        (cards,)
+    )
+    transfers = postings // 2
+    for start in range(0, transfers, SEED_CHUNK):
+        cur.execute(
+            """
+            INSERT INTO postings (transaction_id, entry_type, account, card_id, amount)
+            SELECT t.id, 'transfer', 'card', leg.card_id, leg.amount
+            FROM (
+                SELECT %(start)s + i AS id, 1 + floor(random() * %(cards)s)::int AS from_id,
+                       1 + floor(random() * %(cards)s)::int AS to_id, round((1 + random() * 500)::numeric, 2) AS amount
+                FROM generate_series(1, %(count)s) i
+            ) t
+            CROSS JOIN LATERAL (VALUES (t.from_id, -t.amount), (t.to_id, t.amount)) AS leg(card_id, amount)
+            """,
+            {'start': start, 'cards': cards, 'count': min(SEED_CHUNK, transfers - start)}
+        )
+    cur.execute(
+        """
+        UPDATE cards c SET balance = p.total
+        FROM (SELECT card_id, SUM(amount) AS total FROM postings WHERE account = 'card' GROUP BY card_id) p
+        WHERE c.id = p.card_id
+        """
+    )
+    cur.execute("UPDATE cards SET balance = balance + 0.01 WHERE id IN (SELECT id FROM cards ORDER BY random() LIMIT %s)", (drift,))
+    cur.execute('VACUUM ANALYZE postings')
+    cur.execute('VACUUM ANALYZE cards')
+    conn.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cards', type=int, default=1000000)
+    parser.add_argument('--postings', type=int, default=20000000)
+    parser.add_argument('--drift', type=int, default=25)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=20000)
+    args = parser.parse_args()
+
+    dsn = bench_dsn()
+    reset_database(dsn)
+    started = time.monotonic()
+    seed(dsn, args.cards, args.postings, args.drift)
+    seed_s = time.monotonic() - started
+
+    sys.path.insert(0, str(BACKEND / 'transactions'))
+    spec = importlib.util.spec_from_file_location('bench_postings', BACKEND / 'transactions' / 'postings.py')
+    postings = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(postings)
+
+    report = postings.reconcile(dsn, args.workers, args.batch_size)
+    print(json.dumps({
+        'cards': args.cards,
+        'postings': args.postings,
+        'workers': args.workers,
+        'seed_s': round(seed_s, 2),
+        'reconcile_s': report['elapsed_s'],
+        'postings_per_second': round(args.postings / report['elapsed_s']) if report['elapsed_s'] else None,
+        'drift_found': report['drift_count'],
+        'unbalanced_found': report['unbalanced_count']
+    }, indent=2))
+
+    if report['drift_count'] != args.drift or report['unbalanced_count']:
+        print(f"expected {args.drift} drifted cards and no unbalanced transactions", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+'''
+Business: Проверка маршрутизации чтений на реплику - после каждого перевода чтение с токеном X-Consistency-Token
+          видит новый баланс, при паузе воспроизведения WAL чтения уходят на основную БД, недоступная реплика не ломает GET
+Args: BENCH_DATABASE_URL - одноразовая основная БД; BENCH_REPLICA_URL - её потоковая реплика, например:
+      pg_basebackup -D standby -R -X stream -h localhost -p 5432 && pg_ctl -D standby -o '-p 5433' start;
+      --transfers N; --sources S - карт-отправителей по кругу, чтобы не упираться в окно скорости антифрода
+Returns: JSON с числом устаревших чтений и задержками; код выхода 1 при любом устаревшем чтении или ошибке
+'''
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from typing import List, Tuple
+
+import psycopg2
+
+from common import bench_dsn, invoke, load_handler, reset_database
+
+UNREACHABLE_REPLICA = 'postgresql://bench@127.0.0.1:1/unreachable?connect_timeout=1'
+
+
+RECIPIENT = '2000 0000 0000 0000'
+
+
+def seed(dsn: str, sources: int) -> Tuple[int, List[int]]:
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    cur.execute("INSERT INTO users (phone, name) VALUES ('+70000000001', 'Replica') RETURNING id")
+    user_id = cur.fetchone()[0]
+    cur.execute(
+        "INSERT INTO cards (user_id, card_number, balance) "
+        "SELECT %s, '1000 0000 0000 ' || lpad(i::text, 4, '0'), 1000000 FROM generate_series(1, %s) i RETURNING id",
+        (user_id, sources)
+    )
+    source_ids = [row[0] for row in cur.fetchall()]
+    cur.execute("INSERT INTO cards (user_id, card_number, balance) VALUES (%s, %s, 0)", (user_id, RECIPIENT))
+    conn.commit()
+    conn.close()
+    return user_id, source_ids
+
+
+def balances(response: dict) -> dict:
+    return {card['card_number']: card['balance'] for card in json.loads(response['body'])['cards']}
+
+
+def run_transfers(transactions, cards, user_id: int, source_ids: List[int], count: int, start: int) -> dict:
+    stale = errors = 0
+    latencies = []
+    for i in range(count):
+        response = invoke(transactions, {
+            'httpMethod': 'POST',
+            'body': json.dumps({'from_card_id': source_ids[(start + i) % len(source_ids)], 'to_identifier': RECIPIENT, 'amount': 1})
+        })
+        if response['statusCode'] != 200:
+            errors += 1
+            continue
+        token = response['headers'].get('X-Consistency-Token')
+        started = time.perf_counter()
+        response = invoke(cards, {
+            'httpMethod': 'GET',
+            'queryStringParameters': {'user_id': str(user_id)},
+            'headers': {'X-Consistency-Token': token} if token else {}
+        })
+        latencies.append((time.perf_counter() - started) * 1000)
+        if response['statusCode'] != 200:
+            errors += 1
+        elif balances(response).get(RECIPIENT) != start + i + 1:
+            stale += 1
+    return {
+        'transfers': count,
+        'stale_reads': stale,
+        'errors': errors,
+        'read_p50_ms': round(statistics.median(latencies), 2) if latencies else None,
+        'read_max_ms': round(max(latencies), 2) if latencies else None
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--transfers', type=int, default=200)
+    parser.add_argument('--sources', type=int, default=100)
+    args = parser.parse_args()
+
+    dsn = bench_dsn()
+    replica_dsn = os.environ.get('BENCH_REPLICA_URL')
+    if not replica_dsn:
+        sys.exit('BENCH_REPLICA_URL is required (a streaming replica of BENCH_DATABASE_URL)')
+    reset_database(dsn)
+    user_id, source_ids = seed(dsn, args.sources)
+
+    os.environ['DATABASE_REPLICA_URL'] = replica_dsn
+    transactions = load_handler('transactions')
+    cards = load_handler('cards')
+    report = {'read_your_writes': run_transfers(transactions, cards, user_id, source_ids, args.transfers, 0)}
+    report['read_your_writes']['replica_pool'] = cards.db.get_replica_pool().stats
+    done = args.transfers
+
+    replica = psycopg2.connect(replica_dsn)
+    replica.autocommit = True
+    try:
+        replica.cursor().execute('SELECT pg_wal_replay_pause()')
+    except psycopg2.Error as e:
+        report['replay_paused'] = {'skipped': str(e).strip()}
+    else:
+        try:
+            report['replay_paused'] = run_transfers(transactions, cards, user_id, source_ids, args.transfers, done)
+            done += args.transfers
+        finally:
+            replica.cursor().execute('SELECT pg_wal_replay_resume()')
+    replica.close()
+
+    os.environ['DATABASE_REPLICA_URL'] = UNREACHABLE_REPLICA
+    cards = load_handler('cards')
+    report['replica_down'] = run_transfers(transactions, cards, user_id, source_ids, args.transfers, done)
+
+    for module in (transactions, cards):
+        module.db.get_pool().closeall()
+        if module.db.get_replica_pool() is not None:
+            module.db.get_replica_pool().closeall()
+
+    print(json.dumps(report, indent=2))
+    failed = any(phase.get('stale_reads') or phase.get('errors') for phase in report.values())
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
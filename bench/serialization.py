@@ -0,0 +1,97 @@
+'''
+Business: Микробенчмарк сериализации списка карт - кортежи -> dict + json.dumps против записей со __slots__ + api.dumps
+Args: --cards N - карт в ответе; --iterations K - повторов; БД не нужна
+Returns: JSON с CPU-временем на вызов (мкс) для обоих путей и ускорением; код выхода 1, если ответы различаются
+'''
+import argparse
+import importlib.util
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Callable, Dict, List
+
+from common import BACKEND
+
+spec = importlib.util.spec_from_file_location('cards_api', BACKEND / 'cards' / 'api.py')
+api = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(api)
+
+CARD_FIELDS = (
+    'id', 'card_number', 'card_type', 'card_name', 'card_category', 'is_child_card',
+    'balance', 'created_at', 'status', 'credit_limit', 'credit_used'
+)
+Card = api.record_type('Card', CARD_FIELDS)
+
+
+def make_rows(count: int) -> List[tuple]:
+    start = datetime(2024, 1, 1, 12, 0, 0)
+    return [
+        (
+            i, f'2200 01{i % 100:02d} {i // 100 % 10000:04d} {i % 10000:04d}', 'virtual', 'Виртуальная карта', 'credit' if i % 3 == 0 else 'debit',
+            i % 5 == 0, Decimal(f'{i * 137 % 100000}.{i % 100:02d}'), start + timedelta(hours=i),
+            'active', Decimal('50000.00') if i % 3 == 0 else None, Decimal('1250.50') if i % 3 == 0 else None
+        )
+        for i in range(1, count + 1)
+    ]
+
+
+def legacy_path(rows: List[tuple]) -> str:
+    return json.dumps({'cards': [
+        {
+            'id': card[0],
+            'card_number': card[1],
+            'card_type': card[2],
+            'card_name': card[3],
+            'card_category': card[4],
+            'is_child_card': card[5],
+            'balance': float(card[6]),
+            'created_at': card[7].isoformat() if card[7] else None,
+            'status': card[8] or 'active',
+            'credit_limit': float(card[9]) if card[9] else None,
+            'credit_used': float(card[10]) if card[10] else None
+        }
+        for card in rows
+    ]})
+
+
+def records_path(rows: List[tuple]) -> str:
+    return api.dumps({'cards': [Card(*row) for row in rows]})
+
+
+def measure(fn: Callable[[List[tuple]], str], rows: List[tuple], iterations: int) -> float:
+    fn(rows)
+    started = time.process_time()
+    for _ in range(iterations):
+        fn(rows)
+    return (time.process_time() - started) / iterations * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cards', type=int, default=10)
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    rows = make_rows(args.cards)
+    if json.loads(legacy_path(rows)) != json.loads(records_path(rows)):
+        print('serialized payloads differ', file=sys.stderr)
+        return 1
+
+    before = measure(legacy_path, rows, args.iterations)
+    after = measure(records_path, rows, args.iterations)
+    report: Dict[str, Any] = {
+        'cards': args.cards,
+        'iterations': args.iterations,
+        'encoder': 'orjson' if api.orjson is not None else 'json',
+        'before_us': round(before, 2),
+        'after_us': round(after, 2),
+        'speedup': round(before / after, 2)
+    }
+    print(json.dumps(report))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+'''
+Business: Стресс-тест переводов - сотни параллельных списаний с одной карты не уводят баланс в минус;
+          правила антифрода включены, но окно скорости поднято до --transfers, чтобы гонка дошла до нехватки средств
+Args: BENCH_DATABASE_URL - одноразовая локальная БД; --transfers N; --workers W; --balance B
+Returns: код выхода 1 при отрицательном балансе, расхождении сумм, ошибках БД (в т.ч. deadlock),
+         отказах антифрода или если ни один перевод не упёрся в нехватку средств
+'''
+import argparse
+import json
+import os
+import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import psycopg2
+
+from common import bench_dsn, invoke, load_handler, reset_database
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--transfers', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--balance', type=Decimal, default=Decimal('100.00'))
+    parser.add_argument('--recipients', type=int, default=5)
+    args = parser.parse_args()
+
+    dsn = bench_dsn()
+    os.environ['DB_POOL_MAX_SIZE'] = str(args.workers)
+    reset_database(dsn)
+
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    cur.execute("UPDATE transfer_rules SET max_value = %s WHERE name = 'velocity_count'", (args.transfers,))
+    cur.execute("INSERT INTO users (phone, name) VALUES ('+70000000001', 'Stress') RETURNING id")
+    user_id = cur.fetchone()[0]
+    cur.execute("INSERT INTO cards (user_id, card_number, balance) VALUES (%s, '1000 0000 0000 0000', %s) RETURNING id", (user_id, args.balance))
+    source_id = cur.fetchone()[0]
+    recipients = []
+    for i in range(args.recipients):
+        cur.execute("INSERT INTO cards (user_id, card_number, balance) VALUES (%s, %s, 10) RETURNING id, card_number", (user_id, f'2000 0000 0000 {i:04d}'))
+        recipients.append(cur.fetchone())
+    conn.commit()
+    cur.execute('SELECT SUM(balance) FROM cards')
+    total_before = cur.fetchone()[0]
+    conn.commit()
+
+    module = load_handler('transactions')
+
+    def transfer(i: int) -> int:
+        recipient_id, recipient_number = random.choice(recipients)
+        if i % 5 == 0:
+            body = {'from_card_id': recipient_id, 'to_identifier': '1000 0000 0000 0000', 'amount': 1}
+        else:
+            body = {'from_card_id': source_id, 'to_identifier': recipient_number, 'amount': 1}
+        response = invoke(module, {'httpMethod': 'POST', 'body': json.dumps(body)})
+        return response['statusCode']
+
+    errors = 0
+    statuses = {}
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for future in [pool.submit(transfer, i) for i in range(args.transfers)]:
+            try:
+                status = future.result()
+                statuses[status] = statuses.get(status, 0) + 1
+            except psycopg2.Error as e:
+                errors += 1
+                print(f'db error: {e}', file=sys.stderr)
+
+    cur.execute('SELECT MIN(balance), SUM(balance) FROM cards')
+    min_balance, total_after = cur.fetchone()
+    cur.execute('SELECT balance FROM cards WHERE id = %s', (source_id,))
+    source_balance = cur.fetchone()[0]
+    cur.execute("SELECT COUNT(*) FROM transactions WHERE transaction_type = 'transfer'")
+    ledger_rows = cur.fetchone()[0]
+    cur.close()
+    conn.close()
+
+    raced = statuses.get(200, 0) >= args.balance and statuses.get(400, 0) > 0 and not statuses.get(403)
+    ok = errors == 0 and min_balance >= 0 and total_after == total_before and ledger_rows == statuses.get(200, 0) and raced
+    print(json.dumps({
+        'transfers': args.transfers,
+        'statuses': statuses,
+        'db_errors': errors,
+        'source_balance': str(source_balance),
+        'min_balance': str(min_balance),
+        'total_conserved': total_after == total_before,
+        'ledger_rows': ledger_rows,
+        'reached_insufficient_funds': raced,
+        'ok': ok
+    }))
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
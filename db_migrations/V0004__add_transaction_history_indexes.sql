@@ -0,0 +1,5 @@
+CREATE INDEX IF NOT EXISTS idx_transactions_from_card_created ON transactions(from_card_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_transactions_to_card_created ON transactions(to_card_id, created_at DESC, id DESC);
+
+DROP INDEX IF EXISTS idx_transactions_from_card;
+DROP INDEX IF EXISTS idx_transactions_to_card;
\ No newline at end of file
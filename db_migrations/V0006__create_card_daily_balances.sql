@@ -0,0 +1,9 @@
+CREATE TABLE IF NOT EXISTS card_daily_balances (
+    card_id INTEGER NOT NULL,
+    day DATE NOT NULL,
+    opening_balance DECIMAL(15, 2) NOT NULL,
+    closing_balance DECIMAL(15, 2) NOT NULL,
+    inflow DECIMAL(15, 2) NOT NULL DEFAULT 0.00,
+    outflow DECIMAL(15, 2) NOT NULL DEFAULT 0.00,
+    PRIMARY KEY (card_id, day)
+);
\ No newline at end of file
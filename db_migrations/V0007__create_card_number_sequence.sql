@@ -0,0 +1 @@
+CREATE SEQUENCE IF NOT EXISTS card_number_seq START WITH 1 MINVALUE 1 MAXVALUE 999999999 NO CYCLE CACHE 20;
\ No newline at end of file
@@ -0,0 +1,15 @@
+CREATE TABLE IF NOT EXISTS outbox_events (
+    id BIGSERIAL PRIMARY KEY,
+    event_type VARCHAR(50) NOT NULL,
+    aggregate_id BIGINT,
+    payload JSONB NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    available_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    processed_at TIMESTAMP,
+    failed_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_outbox_events_pending ON outbox_events(available_at, id) WHERE processed_at IS NULL AND failed_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_outbox_events_processed_at ON outbox_events(processed_at) WHERE processed_at IS NOT NULL;
\ No newline at end of file
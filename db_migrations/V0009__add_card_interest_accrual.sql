@@ -0,0 +1,4 @@
+ALTER TABLE cards
+ADD COLUMN IF NOT EXISTS interest_accrued_on DATE;
+
+CREATE INDEX IF NOT EXISTS idx_cards_credit_outstanding ON cards(id) WHERE credit_used > 0;
\ No newline at end of file
@@ -0,0 +1,26 @@
+ALTER TABLE cards
+ADD COLUMN IF NOT EXISTS pan_digits VARCHAR(19) GENERATED ALWAYS AS (regexp_replace(card_number, '[^0-9]', '', 'g')) STORED;
+
+ALTER TABLE users
+ADD COLUMN IF NOT EXISTS phone_normalized VARCHAR(20) GENERATED ALWAYS AS (
+    CASE
+        WHEN length(regexp_replace(phone, '[^0-9]', '', 'g')) = 11 AND left(regexp_replace(phone, '[^0-9]', '', 'g'), 1) = '8'
+            THEN '7' || substr(regexp_replace(phone, '[^0-9]', '', 'g'), 2)
+        WHEN length(regexp_replace(phone, '[^0-9]', '', 'g')) = 10
+            THEN '7' || regexp_replace(phone, '[^0-9]', '', 'g')
+        ELSE regexp_replace(phone, '[^0-9]', '', 'g')
+    END
+) STORED,
+ADD COLUMN IF NOT EXISTS default_card_id INTEGER;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_cards_pan_digits ON cards(pan_digits);
+CREATE INDEX IF NOT EXISTS idx_users_phone_normalized ON users(phone_normalized, id) INCLUDE (default_card_id);
+
+UPDATE users u
+SET default_card_id = (
+    SELECT c.id FROM cards c
+    WHERE c.user_id = u.id
+    ORDER BY COALESCE(c.is_child_card, FALSE), c.card_category IS DISTINCT FROM 'debit', c.id
+    LIMIT 1
+)
+WHERE u.default_card_id IS NULL;
\ No newline at end of file
@@ -0,0 +1,118 @@
+ALTER SEQUENCE transactions_id_seq AS BIGINT;
+
+CREATE TABLE IF NOT EXISTS transactions_partitioned (
+    id BIGINT NOT NULL DEFAULT nextval('transactions_id_seq'),
+    from_card_id INTEGER,
+    to_card_id INTEGER,
+    amount DECIMAL(15, 2) NOT NULL,
+    transaction_type VARCHAR(50) NOT NULL,
+    description TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE IF NOT EXISTS transactions_default PARTITION OF transactions_partitioned DEFAULT;
+
+CREATE INDEX IF NOT EXISTS idx_transactions_part_from_card_created ON transactions_partitioned(from_card_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_transactions_part_to_card_created ON transactions_partitioned(to_card_id, created_at DESC, id DESC);
+
+CREATE TABLE IF NOT EXISTS transaction_archives (
+    partition_name VARCHAR(63) PRIMARY KEY,
+    range_start TIMESTAMP NOT NULL,
+    range_end TIMESTAMP NOT NULL,
+    path TEXT NOT NULL,
+    row_count BIGINT NOT NULL,
+    sha256 CHAR(64) NOT NULL,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS transactions_migration (
+    singleton BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (singleton),
+    last_id BIGINT NOT NULL DEFAULT 0,
+    target_id BIGINT NOT NULL,
+    completed_at TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION transactions_parent() RETURNS TEXT AS $$
+    SELECT CASE WHEN to_regclass('transactions_partitioned') IS NOT NULL THEN 'transactions_partitioned' ELSE 'transactions' END;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION ensure_transaction_partition(month_start DATE) RETURNS TEXT AS $$
+DECLARE
+    range_start TIMESTAMP := date_trunc('month', month_start);
+    range_end TIMESTAMP := date_trunc('month', month_start) + INTERVAL '1 month';
+    partition_name TEXT := 'transactions_p' || to_char(month_start, 'YYYYMM');
+    parent TEXT := transactions_parent();
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL
+       OR EXISTS (SELECT 1 FROM transaction_archives a WHERE a.partition_name = ensure_transaction_partition.partition_name) THEN
+        RETURN partition_name;
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS)', partition_name, parent);
+    EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I CHECK (created_at >= %L AND created_at < %L)',
+                   partition_name, partition_name || '_range', range_start, range_end);
+    EXECUTE format('WITH moved AS (DELETE FROM transactions_default WHERE created_at >= %L AND created_at < %L RETURNING *) '
+                   'INSERT INTO %I SELECT * FROM moved', range_start, range_end, partition_name);
+    EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', parent, partition_name, range_start, range_end);
+    EXECUTE format('ALTER TABLE %I DROP CONSTRAINT %I', partition_name, partition_name || '_range');
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION mirror_transactions_to_partitioned() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM transactions_partitioned WHERE id = OLD.id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO transactions_partitioned (id, from_card_id, to_card_id, amount, transaction_type, description, created_at)
+        VALUES (NEW.id, NEW.from_card_id, NEW.to_card_id, NEW.amount, NEW.transaction_type, NEW.description,
+                COALESCE(NEW.created_at, TIMESTAMP '1970-01-01'))
+        ON CONFLICT DO NOTHING;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION cutover_transactions_partitioning() RETURNS BIGINT AS $$
+DECLARE
+    copied BIGINT;
+BEGIN
+    LOCK TABLE transactions IN ACCESS EXCLUSIVE MODE;
+    INSERT INTO transactions_partitioned (id, from_card_id, to_card_id, amount, transaction_type, description, created_at)
+    SELECT id, from_card_id, to_card_id, amount, transaction_type, description, COALESCE(created_at, TIMESTAMP '1970-01-01')
+    FROM transactions
+    WHERE id > COALESCE((SELECT last_id FROM transactions_migration), 0)
+    ON CONFLICT DO NOTHING;
+    GET DIAGNOSTICS copied = ROW_COUNT;
+    IF (SELECT count(*) FROM transactions) <> (SELECT count(*) FROM transactions_partitioned) THEN
+        RAISE EXCEPTION 'transactions and transactions_partitioned row counts differ, cutover aborted';
+    END IF;
+    DROP TRIGGER IF EXISTS transactions_mirror ON transactions;
+    ALTER TABLE transactions RENAME TO transactions_legacy;
+    ALTER TABLE transactions_partitioned RENAME TO transactions;
+    ALTER SEQUENCE transactions_id_seq OWNED BY transactions.id;
+    UPDATE transactions_migration SET completed_at = CURRENT_TIMESTAMP;
+    RETURN copied;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT ensure_transaction_partition((date_trunc('month', CURRENT_DATE) + make_interval(months => m))::date)
+FROM generate_series(-1, 3) m;
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM transactions) THEN
+        INSERT INTO transactions_migration (last_id, target_id)
+        SELECT 0, max(id) FROM transactions
+        ON CONFLICT DO NOTHING;
+        CREATE TRIGGER transactions_mirror
+            AFTER INSERT OR UPDATE OR DELETE ON transactions
+            FOR EACH ROW EXECUTE FUNCTION mirror_transactions_to_partitioned();
+    ELSE
+        INSERT INTO transactions_migration (last_id, target_id) VALUES (0, 0) ON CONFLICT DO NOTHING;
+        PERFORM cutover_transactions_partitioning();
+        DROP TABLE transactions_legacy;
+    END IF;
+END;
+$$;
\ No newline at end of file
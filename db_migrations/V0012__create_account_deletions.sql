@@ -0,0 +1,13 @@
+ALTER TABLE users ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP;
+
+CREATE TABLE IF NOT EXISTS account_deletions (
+    user_id INTEGER PRIMARY KEY,
+    phase VARCHAR(20) NOT NULL DEFAULT 'outgoing',
+    purged BIGINT NOT NULL DEFAULT 0,
+    anonymized BIGINT NOT NULL DEFAULT 0,
+    requested_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    completed_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_account_deletions_pending ON account_deletions(requested_at) WHERE completed_at IS NULL;
\ No newline at end of file
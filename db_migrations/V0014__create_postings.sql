@@ -0,0 +1,24 @@
+CREATE TABLE IF NOT EXISTS postings (
+    id BIGSERIAL PRIMARY KEY,
+    transaction_id BIGINT,
+    entry_type VARCHAR(50) NOT NULL,
+    account VARCHAR(20) NOT NULL,
+    card_id INTEGER,
+    amount DECIMAL(15, 2) NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_postings_card_account ON postings(card_id, account) INCLUDE (amount);
+CREATE INDEX IF NOT EXISTS idx_postings_transaction ON postings(transaction_id);
+
+INSERT INTO postings (entry_type, account, card_id, amount)
+SELECT 'opening', v.account, v.card_id, v.amount
+FROM cards c
+CROSS JOIN LATERAL (VALUES
+    ('card', c.id, COALESCE(c.balance, 0)),
+    ('opening_equity', NULL::INTEGER, -COALESCE(c.balance, 0)),
+    ('credit', c.id, -COALESCE(c.credit_used, 0)),
+    ('opening_equity', NULL::INTEGER, COALESCE(c.credit_used, 0))
+) AS v(account, card_id, amount)
+WHERE v.amount <> 0
+  AND NOT EXISTS (SELECT 1 FROM postings);
\ No newline at end of file
@@ -0,0 +1,118 @@
+CREATE TABLE IF NOT EXISTS transfer_rules (
+    name VARCHAR(50) PRIMARY KEY,
+    enabled BOOLEAN NOT NULL DEFAULT TRUE,
+    scope VARCHAR(10) NOT NULL DEFAULT 'all' CHECK (scope IN ('all', 'child', 'single', 'batch')),
+    metric VARCHAR(20) NOT NULL CHECK (metric IN ('amount', 'day_count', 'day_sum', 'window_count', 'window_sum')),
+    max_value DECIMAL(15, 2) NOT NULL
+);
+
+INSERT INTO transfer_rules (name, scope, metric, max_value) VALUES
+    ('child_daily_count', 'child', 'day_count', 20),
+    ('child_daily_sum', 'child', 'day_sum', 5000),
+    ('single_amount', 'all', 'amount', 1000000),
+    ('velocity_count', 'single', 'window_count', 10),
+    ('velocity_sum', 'single', 'window_sum', 300000),
+    ('batch_velocity_count', 'batch', 'window_count', 20000),
+    ('batch_velocity_sum', 'batch', 'window_sum', 10000000)
+ON CONFLICT (name) DO NOTHING;
+
+CREATE TABLE IF NOT EXISTS card_velocity (
+    card_id INTEGER NOT NULL,
+    kind VARCHAR(10) NOT NULL CHECK (kind IN ('single', 'batch')),
+    day DATE NOT NULL,
+    day_count INTEGER NOT NULL DEFAULT 0,
+    day_sum DECIMAL(15, 2) NOT NULL DEFAULT 0,
+    window_no BIGINT NOT NULL,
+    window_count INTEGER NOT NULL DEFAULT 0,
+    window_sum DECIMAL(15, 2) NOT NULL DEFAULT 0,
+    prev_count INTEGER NOT NULL DEFAULT 0,
+    prev_sum DECIMAL(15, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (card_id, kind)
+);
+
+CREATE OR REPLACE FUNCTION check_transfer_rules(
+    p_card_id INTEGER, p_amount NUMERIC, p_window_seconds INTEGER,
+    p_items INTEGER DEFAULT NULL, p_max_amount NUMERIC DEFAULT NULL
+) RETURNS TEXT AS $$
+DECLARE
+    v_card RECORD;
+    v_counters card_velocity%ROWTYPE;
+    v_kind VARCHAR(10) := CASE WHEN p_items IS NULL THEN 'single' ELSE 'batch' END;
+    v_items INTEGER := COALESCE(p_items, 1);
+    v_max_amount NUMERIC := COALESCE(p_max_amount, p_amount);
+    v_epoch NUMERIC := extract(epoch FROM CURRENT_TIMESTAMP);
+    v_window BIGINT := floor(v_epoch / p_window_seconds);
+    v_elapsed NUMERIC := (v_epoch - v_window * p_window_seconds) / p_window_seconds;
+    v_day_count INTEGER := 0;
+    v_day_sum NUMERIC := 0;
+    v_own_day_count INTEGER := 0;
+    v_own_day_sum NUMERIC := 0;
+    v_window_count INTEGER := 0;
+    v_window_sum NUMERIC := 0;
+    v_prev_count INTEGER := 0;
+    v_prev_sum NUMERIC := 0;
+    v_violated TEXT;
+BEGIN
+    SELECT status, COALESCE(is_child_card, FALSE) AS is_child INTO v_card FROM cards WHERE id = p_card_id;
+    IF NOT FOUND THEN
+        RETURN 'card_not_found';
+    END IF;
+    IF v_card.status IN ('frozen', 'blocked', 'closed') THEN
+        RETURN 'card_' || v_card.status;
+    END IF;
+
+    FOR v_counters IN
+        SELECT * FROM card_velocity WHERE card_id = p_card_id ORDER BY kind FOR UPDATE
+    LOOP
+        IF v_counters.day = CURRENT_DATE THEN
+            v_day_count := v_day_count + v_counters.day_count;
+            v_day_sum := v_day_sum + v_counters.day_sum;
+        END IF;
+        CONTINUE WHEN v_counters.kind <> v_kind;
+        IF v_counters.day = CURRENT_DATE THEN
+            v_own_day_count := v_counters.day_count;
+            v_own_day_sum := v_counters.day_sum;
+        END IF;
+        IF v_counters.window_no = v_window THEN
+            v_window_count := v_counters.window_count;
+            v_window_sum := v_counters.window_sum;
+            v_prev_count := v_counters.prev_count;
+            v_prev_sum := v_counters.prev_sum;
+        ELSIF v_counters.window_no = v_window - 1 THEN
+            v_prev_count := v_counters.window_count;
+            v_prev_sum := v_counters.window_sum;
+        END IF;
+    END LOOP;
+
+    SELECT r.name INTO v_violated
+    FROM transfer_rules r
+    WHERE r.enabled
+      AND (r.scope IN ('all', v_kind) OR (r.scope = 'child' AND v_card.is_child))
+      AND CASE r.metric
+              WHEN 'amount' THEN v_max_amount
+              WHEN 'day_count' THEN v_day_count + v_items
+              WHEN 'day_sum' THEN v_day_sum + p_amount
+              WHEN 'window_count' THEN v_prev_count * (1 - v_elapsed) + v_window_count + v_items
+              WHEN 'window_sum' THEN v_prev_sum * (1 - v_elapsed) + v_window_sum + p_amount
+          END > r.max_value
+    ORDER BY r.name
+    LIMIT 1;
+    IF v_violated IS NOT NULL THEN
+        RETURN v_violated;
+    END IF;
+
+    INSERT INTO card_velocity (card_id, kind, day, day_count, day_sum, window_no, window_count, window_sum, prev_count, prev_sum)
+    VALUES (p_card_id, v_kind, CURRENT_DATE, v_own_day_count + v_items, v_own_day_sum + p_amount, v_window,
+            v_window_count + v_items, v_window_sum + p_amount, v_prev_count, v_prev_sum)
+    ON CONFLICT (card_id, kind) DO UPDATE
+    SET day = EXCLUDED.day,
+        day_count = EXCLUDED.day_count,
+        day_sum = EXCLUDED.day_sum,
+        window_no = EXCLUDED.window_no,
+        window_count = EXCLUDED.window_count,
+        window_sum = EXCLUDED.window_sum,
+        prev_count = EXCLUDED.prev_count,
+        prev_sum = EXCLUDED.prev_sum;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
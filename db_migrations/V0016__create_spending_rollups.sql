@@ -0,0 +1,10 @@
+CREATE TABLE IF NOT EXISTS spending_rollups (
+    card_id INTEGER NOT NULL,
+    month DATE NOT NULL,
+    category VARCHAR(50) NOT NULL,
+    spent DECIMAL(18, 2) NOT NULL DEFAULT 0.00,
+    spent_count INTEGER NOT NULL DEFAULT 0,
+    received DECIMAL(18, 2) NOT NULL DEFAULT 0.00,
+    received_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (card_id, month, category)
+);
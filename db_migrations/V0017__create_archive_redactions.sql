@@ -0,0 +1,7 @@
+CREATE TABLE IF NOT EXISTS archive_redactions (
+    card_id INTEGER PRIMARY KEY,
+    requested_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    redacted_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_archive_redactions_pending ON archive_redactions(card_id) WHERE redacted_at IS NULL;
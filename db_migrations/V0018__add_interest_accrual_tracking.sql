@@ -0,0 +1,46 @@
+ALTER TABLE cards
+ADD COLUMN IF NOT EXISTS interest_remainder NUMERIC NOT NULL DEFAULT 0;
+
+ALTER TABLE transactions
+ADD COLUMN IF NOT EXISTS accrued_on DATE;
+
+ALTER TABLE IF EXISTS transactions_partitioned
+ADD COLUMN IF NOT EXISTS accrued_on DATE;
+
+CREATE OR REPLACE FUNCTION mirror_transactions_to_partitioned() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM transactions_partitioned WHERE id = OLD.id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO transactions_partitioned (id, from_card_id, to_card_id, amount, transaction_type, description, created_at, accrued_on)
+        VALUES (NEW.id, NEW.from_card_id, NEW.to_card_id, NEW.amount, NEW.transaction_type, NEW.description,
+                COALESCE(NEW.created_at, TIMESTAMP '1970-01-01'), NEW.accrued_on)
+        ON CONFLICT DO NOTHING;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION cutover_transactions_partitioning() RETURNS BIGINT AS $$
+DECLARE
+    copied BIGINT;
+BEGIN
+    LOCK TABLE transactions IN ACCESS EXCLUSIVE MODE;
+    INSERT INTO transactions_partitioned (id, from_card_id, to_card_id, amount, transaction_type, description, created_at, accrued_on)
+    SELECT id, from_card_id, to_card_id, amount, transaction_type, description, COALESCE(created_at, TIMESTAMP '1970-01-01'), accrued_on
+    FROM transactions
+    WHERE id > COALESCE((SELECT last_id FROM transactions_migration), 0)
+    ON CONFLICT DO NOTHING;
+    GET DIAGNOSTICS copied = ROW_COUNT;
+    IF (SELECT count(*) FROM transactions) <> (SELECT count(*) FROM transactions_partitioned) THEN
+        RAISE EXCEPTION 'transactions and transactions_partitioned row counts differ, cutover aborted';
+    END IF;
+    DROP TRIGGER IF EXISTS transactions_mirror ON transactions;
+    ALTER TABLE transactions RENAME TO transactions_legacy;
+    ALTER TABLE transactions_partitioned RENAME TO transactions;
+    ALTER SEQUENCE transactions_id_seq OWNED BY transactions.id;
+    UPDATE transactions_migration SET completed_at = CURRENT_TIMESTAMP;
+    RETURN copied;
+END;
+$$ LANGUAGE plpgsql;
@@ -40,6 +40,7 @@ interface BankCard {
   status?: string;
   credit_limit?: number;
   credit_used?: number;
+  recent_transactions?: Transaction[];
 }
 
 interface Transaction {
@@ -59,6 +60,7 @@ const Dashboard = () => {
   const [cards, setCards] = useState<BankCard[]>([]);
   const [selectedCard, setSelectedCard] = useState<BankCard | null>(null);
   const [transactions, setTransactions] = useState<Transaction[]>([]);
+  const [recentTransactions, setRecentTransactions] = useState<Record<number, Transaction[]>>({});
   const [activeTab, setActiveTab] = useState('home');
   const [qrCode, setQrCode] = useState('');
   const [isVoiceAssistantOpen, setIsVoiceAssistantOpen] = useState(false);
@@ -92,17 +94,26 @@ const Dashboard = () => {
 
   useEffect(() => {
     if (selectedCard) {
-      loadTransactions(selectedCard.id);
+      const preloaded = recentTransactions[selectedCard.id];
+      if (preloaded) {
+        setTransactions(preloaded);
+      } else {
+        loadTransactions(selectedCard.id);
+      }
       generateQRCode(selectedCard.card_number);
     }
   }, [selectedCard]);
 
   const loadCards = async (userId: number) => {
-    const response = await fetch(`${API_URLS.cards}?user_id=${userId}`);
+    const response = await fetch(`${API_URLS.cards}?user_id=${userId}&view=dashboard&recent=50`);
     const data = await response.json();
-    setCards(data.cards || []);
-    if (data.cards && data.cards.length > 0) {
-      setSelectedCard(data.cards[0]);
+    const loadedCards: BankCard[] = data.cards || [];
+    setCards(loadedCards);
+    setRecentTransactions(Object.fromEntries(
+      loadedCards.map((card) => [card.id, card.recent_transactions || []])
+    ));
+    if (loadedCards.length > 0) {
+      setSelectedCard(loadedCards[0]);
     }
   };
 